@@ -22,6 +22,7 @@ sys.path += [os.getcwd()]
 
 # Imports from other modules in this project
 import sshutil
+import snapshot
 
 # Imports from third party modules
 import phpipam
@@ -303,7 +304,8 @@ class clintSwitch(sshutil.Switch):
         Popen(cmd, shell=True).communicate()
 
     def bufferflush(self):
-        return self.connection.buffer_flush()
+        with self._connect() as connection:
+            return connection.buffer_flush()
 
 
 def poll_switch(sw, cmd, sleep_time):
@@ -314,6 +316,14 @@ def poll_switch(sw, cmd, sleep_time):
         time.sleep(sleep_time)
 
 
+def load_snapshot(path):
+    """
+    Reload switches saved with --save-snapshot (or snapshot.save()).
+    They pick up clintSwitch's credentials so they can be refreshed.
+    """
+    return snapshot.load(path, getattr(clintSwitch, 'credentials', None))
+
+
 def pythonrc():
     """Return expanded path to current users .pythonrc.py"""
     home = os.path.expanduser('~/')
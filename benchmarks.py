@@ -0,0 +1,591 @@
+#!/usr/bin/python
+"""
+Created on Oct 18, 2026
+
+Micro-benchmarks for the parsing hot paths in sshutil.  Each suite times the
+current implementation against a copy of the one it replaced, so regressions
+show up as a shrinking ratio.
+
+benchmarks.py [-t <suite>] [-n <count>] [-f <fixture>]
+"""
+# Standard Library Imports
+import os
+import re
+import tempfile
+import time
+import cPickle
+from optparse import OptionParser
+
+# Imports from other scripts in this project
+import sshutil
+import snapshot
+
+# A stacked 3750X, as returned by 'sh ver'
+SAMPLE_VERSION = """\
+Cisco IOS Software, C3750E Software (C3750E-UNIVERSALK9-M), Version 12.2(55)SE5, RELEASE SOFTWARE (fc1)
+Technical Support: http://www.cisco.com/techsupport
+Copyright (c) 1986-2012 by Cisco Systems, Inc.
+Compiled Thu 09-Feb-12 19:11 by prod_rel_team
+
+ROM: Bootstrap program is C3750E boot loader
+BOOTLDR: C3750E Boot Loader (C3750X-HBOOT-M) Version 12.2(53r)SE2, RELEASE SOFTWARE (fc1)
+
+sw1 uptime is 1 year, 12 weeks, 3 days, 4 hours, 19 minutes
+System returned to ROM by power-on
+System image file is "flash:/c3750e-universalk9-mz.122-55.SE5.bin"
+
+License Level: ipbase
+License Type: Permanent
+Next reload license Level: ipbase
+
+cisco WS-C3750X-48P (PowerPC405) processor (revision A0) with 262144K bytes of memory.
+Processor board ID FDO1234X0AB
+Last reset from power-on
+1 Virtual Ethernet interface
+104 Gigabit Ethernet interfaces
+2 Ten Gigabit Ethernet interfaces
+The password-recovery mechanism is enabled.
+
+512K bytes of flash-simulated non-volatile configuration memory.
+Base ethernet MAC Address       : 00:19:E8:A4:A4:00
+Motherboard assembly number     : 73-12557-06
+Model number                    : WS-C3750X-48P-S
+System serial number            : FDO1234X0AB
+
+Switch Ports Model              SW Version            SW Image
+------ ----- -----              ----------            ----------
+*    1 54    WS-C3750X-48P      12.2(55)SE5           C3750E-UNIVERSALK9-M
+     2 54    WS-C3750X-48P      12.2(55)SE5           C3750E-UNIVERSALK9-M
+
+
+Switch 02
+---------
+Switch Uptime                   : 1 year, 12 weeks, 3 days, 4 hours, 20 minutes
+Base ethernet MAC Address       : 00:19:E8:A4:B2:00
+Model number                    : WS-C3750X-48P-S
+System serial number            : FDO1234X0CD
+
+Configuration register is 0xF
+"""
+
+# Used when the ut.py fixture (sample/ShowInt) isn't available.
+SAMPLE_INTERFACE = """\
+FastEthernet1/0/1 is up, line protocol is up (connected)
+  Hardware is Fast Ethernet, address is 0019.e8a4.a443 (bia 0019.e8a4.a443)
+  Description: %End Device: mac:0026.b9f0.095e host:blcl28265; Date: 06-01-2015
+  MTU 1500 bytes, BW 100000 Kbit, DLY 100 usec,
+     reliability 255/255, txload 1/255, rxload 1/255
+  Encapsulation ARPA, loopback not set
+  Keepalive set (10 sec)
+  Full-duplex, 100Mb/s, media type is 10/100BaseTX
+  input flow-control is off, output flow-control is unsupported
+  ARP type: ARPA, ARP Timeout 04:00:00
+  Last input 00:00:01, output 00:00:00, output hang never
+  Last clearing of "show interface" counters never
+  Input queue: 0/75/0/0 (size/max/drops/flushes); Total output drops: 0
+  Queueing strategy: fifo
+  Output queue: 0/40 (size/max)
+  5 minute input rate 12000 bits/sec, 10 packets/sec
+  5 minute output rate 48000 bits/sec, 30 packets/sec
+     68426911 packets input, 3402343221 bytes, 0 no buffer
+     Received 1239 broadcasts (902 multicasts)
+     0 runts, 0 giants, 0 throttles
+     12 input errors, 3 CRC, 0 frame, 0 overrun, 0 ignored
+     0 watchdog, 902 multicast, 0 pause input
+     0 input packets with dribble condition detected
+     441629331 packets output, 4103217890 bytes, 0 underruns
+     1 output errors, 0 collisions, 1 interface resets
+     0 unknown protocol drops
+     0 babbles, 0 late collision, 0 deferred
+     0 lost carrier, 0 no carrier, 0 pause output
+     0 output buffer failures, 0 output buffers swapped out
+"""
+
+
+def legacy_detail(value):
+    """SwitchPort.detail setter as it was before the table-driven parser"""
+    stats = {}
+    rslt = {'stats': stats}
+    lines = value.strip().splitlines()
+    for line in lines:
+        lsplit = line.split()
+        if 'line protocol' in line:
+            rslt['name'] = line.split()[0]
+            status = [x.lower() for x in line.split()
+                      if x.lower() in ['up', 'down']][-1]
+            rslt['status'] = status
+        elif 'Last clearing of' in line:
+            stats['StatDuration'] = lsplit[-1]
+        elif '5 minute input' in line:
+            stats['5MinInputBPS'] = int(lsplit[4])
+            stats['5MinInputPPS'] = int(lsplit[-2])
+        elif '5 minute output' in line:
+            stats['5MinOutputBPS'] = int(lsplit[4])
+            stats['5MinOutputPPS'] = int(lsplit[-2])
+        elif 'packets input' in line:
+            stats['InputPackets'] = int(lsplit[0])
+            stats['InputBytes'] = int(lsplit[3])
+        elif 'packets output' in line:
+            stats['OutputPackets'] = int(lsplit[0])
+            stats['OutputBytes'] = int(lsplit[3])
+        elif 'input errors' in line:
+            stats['InputErrors'] = int(lsplit[0])
+        elif 'output errors' in line:
+            stats['OutputErrors'] = int(lsplit[0])
+        elif 'Description:' in line:
+            rslt['description'] = ' '.join(lsplit[1:])
+    return rslt
+
+
+def legacy_format_interface_name(oInterface, short=False):
+    """format_interface_name() as it was before the trie and cache"""
+    Formats = {
+        'gi': ['Gi', 'GigabitEthernet'],
+        'fa': ['Fa', 'FastEthernet'],
+        'e':  ['E', 'Ethernet'],
+        'vl': ['Vl', 'Vlan'],
+        'se': ['Se', 'Serial'],
+        'te': ['Te', 'TenGigabitEthernet'],
+        'po': ['Po', 'Port-Channel'],
+        'tu': ['Tu', 'Tunnel']
+        }
+    if oInterface in ['', None]:
+        return oInterface
+
+    iInterface = oInterface.lower()
+    prefix = iInterface[:2]
+    if prefix in Formats:
+        lName = Formats[prefix][1]
+        sName = Formats[prefix][0]
+    elif prefix[0] in Formats:
+        prefix = prefix[0]
+        lName = Formats[prefix][1]
+        sName = Formats[prefix][0]
+    else:
+        raise Exception(ValueError)
+
+    buff = iInterface.strip(lName.lower())
+    if short:
+        nName = sName
+    else:
+        nName = lName
+    return nName + buff
+
+
+def legacy_format_mac_address(oMac):
+    """format_mac_address() as it was before MACAddress"""
+    if oMac is None:
+        return None
+    elif len(oMac) == 4:
+        rslt = oMac
+    elif len(oMac) >= 12:
+        wMac = oMac.replace('-', '')
+        wMac = wMac.replace('.', '')
+        rslt = '.'.join([wMac[:4], wMac[4:8], wMac[8:]])
+    else:
+        raise Exception('I don\'t know how to process this MAC Address!')
+    return rslt.lower()
+
+
+def legacy_deduplicate_list(oList, tag=None):
+    """deduplicate_list() as it was before the hashed version (no prints)"""
+    nList = []
+    for item in oList:
+        if item in nList:
+            nList[nList.index(item)] = item
+        else:
+            nList.append(item)
+    return nList
+
+
+def legacy_get_end_devices(switch):
+    """Switch._get_end_devices() as it was before the single pass version"""
+    rslt = []
+    scrubbedInterfaceList = [port for port in switch.ports if port.edge]
+    scrubbedMACAddressTable = []
+    macAddressTable = switch.mac_table
+    for interface in scrubbedInterfaceList:
+        for line in macAddressTable.splitlines():
+            if line.strip().endswith(
+                    legacy_format_interface_name(str(interface), short=True)):
+                scrubbedMACAddressTable.append(line.strip())
+    for line in scrubbedMACAddressTable:
+        ed = sshutil.EndDevice()
+        ed.mac = line.split()[1]
+        ed.switch = switch
+        ed.switchport = line.split()[-1]
+        rslt.append(ed)
+    return legacy_deduplicate_list(rslt)
+
+
+def stack_switch(macs):
+    """A 9 member stack of 48 port switches with `macs` dynamic entries"""
+    switch = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+    switch.ports = ['Gi{0}/0/{1}'.format(n // 48 + 1, n % 48 + 1)
+                    for n in xrange(9 * 48)]
+    switch._mac_address_table = '\n'.join(
+        '  10    0026.{0:04x}.{1:04x}    DYNAMIC     Gi{2}/0/{3}'
+        ''.format(n >> 16, n & 0xffff, n % 9 + 1, n % 48 + 1)
+        for n in xrange(macs))
+    return switch
+
+
+# One 'sh cdp ne det' entry, repeated to make a big neighbor table
+SAMPLE_CDP_ENTRY = """\
+-------------------------
+Device ID: sw{0}.example.com
+Entry address(es): 
+  IP address: 10.0.{0}.2
+Platform: cisco WS-C3750X-48P,  Capabilities: Switch IGMP 
+Interface: GigabitEthernet1/0/{0},  Port ID (outgoing port): GigabitEthernet1/0/1
+Holdtime : 137 sec
+
+Version :
+Cisco IOS Software, C3750E Software (C3750E-UNIVERSALK9-M), Version 12.2(55)SE5
+Technical Support: http://www.cisco.com/techsupport
+
+advertisement version: 2
+Management address(es): 
+  IP address: 10.0.{0}.2
+"""
+
+
+def legacy_cdp_entries(lines):
+    """_collect_cdp_information()'s parser as it was before CDPNeighbor"""
+    CDPEntries = {}
+    for line in lines:
+        if line.split() == []:
+            continue
+        cat = line.split()[0].lower()
+        if 'device' in cat:
+            cdpid = ''.join(line.split()[2:])
+        elif 'ip' == cat:
+            ip = line.split()[2]
+        elif 'platform' in cat:
+            i = 0
+            while i < len(line.split()):
+                word = line.split()[i]
+                if 'capabilit' in word.lower():
+                    capindex = i + 1
+                i += 1
+            caps = line.split()[capindex:]
+        elif 'interface' in cat:
+            interface = line.split()[1].strip(':,')
+            neighborinterface = line.split()[-1]
+            CDPEntries[interface.lower()] = (cdpid, ip, caps,
+                                             neighborinterface)
+    return CDPEntries
+
+
+def legacy_edge(CDPneigh):
+    """SwitchPort._get_edge()'s CDP check as it was before flags"""
+    for neighbor in CDPneigh:
+        nlist = ' '.join(neighbor[2]).lower()
+        if (('switch' in nlist) or
+                ('router' in nlist)):
+            return False
+    return True
+
+
+def legacy_model(switch):
+    """Switch.model as it was before VersionInfo"""
+    if switch.state == 'UP':
+        for line in switch.version.splitlines():
+            if 'bytes of' in line.lower():
+                return line.split()[1]
+    return 'UNK'
+
+
+def legacy_supported(switch):
+    return legacy_model(switch) != 'UNK'
+
+
+def legacy_available_ram(switch):
+    """Switch.available_ram as it was before VersionInfo"""
+    if not legacy_supported(switch):
+        return 'UNK'
+    regex = re.compile(r'[^K/0-9.]').search
+    search = lambda x: 'K' in x and not bool(regex(x))
+    for line in switch.version.splitlines():
+        if 'bytes of memory' in line or \
+                'bytes of physical memory' in line:
+            for word in line.split():
+                if search(word):
+                    break
+            break
+    else:
+        return ''
+    word = word.split('/')
+    add = lambda x, y: x + int(y.strip('K'))
+    return reduce(add, word, 0)
+
+
+def legacy_stacked(switch):
+    """Switch.stacked as it was before VersionInfo"""
+    if not legacy_supported(switch):
+        return 'UNK'
+    stackable = False
+    stacklines = []
+    for line in switch.version.splitlines():
+        if stackable:
+            if not line:
+                break
+            elif '-' in line.split()[0]:
+                continue
+            stacklines.append(line)
+            continue
+        if 'switch ports model' in line.lower():
+            stackable = True
+    return len(stacklines) > 1
+
+
+def legacy_software_version(switch):
+    """Switch.software_version as it was before VersionInfo (cached)"""
+    if not legacy_supported(switch):
+        return 'UNK'
+    _sw_version = getattr(switch, '_legacy_sw_version', None)
+    if _sw_version is not None:
+        return _sw_version
+    if 'IOS-XE' in switch.version:
+        regex = re.compile(r'Version.*RELEASE')
+    else:
+        regex = re.compile(r'Version.*,')
+    _sw_version = regex.findall(switch.version)[0].strip(',').split()[1]
+    switch._legacy_sw_version = _sw_version
+    return _sw_version
+
+
+def legacy_version_row(switch):
+    """The version-derived columns WorkbookWrapper.output_values reads"""
+    return (legacy_available_ram(switch), legacy_model(switch),
+            legacy_stacked(switch), legacy_software_version(switch),
+            legacy_software_version(switch))
+
+
+def version_row(switch):
+    return (switch.available_ram, switch.model, switch.stacked,
+            switch.software_version, switch.software_version)
+
+
+def interface_names(count):
+    """`count` port names the way a stack of 48 port switches repeats them"""
+    forms = ['Gi{0}/0/{1}', 'GigabitEthernet{0}/0/{1}', 'Fa{0}/0/{1}',
+             'FastEthernet{0}/0/{1}', 'Vlan{1}', 'Po{1}']
+    return [forms[n % len(forms)].format(n % 4 + 1, n % 48 + 1)
+            for n in xrange(count)]
+
+
+def mac_table_lines(count):
+    """`count` 'sh mac address-table' lines, each MAC showing up twice"""
+    return ['  10    {0:04x}.{1:04x}.{2:04x}    DYNAMIC     Gi1/0/{3}'
+            ''.format(0x0026, n // 2 >> 16, n // 2 & 0xffff, n % 48 + 1)
+            for n in xrange(count)]
+
+
+def interface_blocks(fixture, count):
+    """Return `count` interface blocks, cycling through those in fixture"""
+    try:
+        with open(fixture, 'r') as fSample:
+            data = fSample.read()
+    except IOError:
+        print 'No fixture at {0}, using built-in sample'.format(fixture)
+        data = SAMPLE_INTERFACE
+    blocks = ['\n'.join(block) for block in
+              sshutil.iter_interface_blocks(data.splitlines())]
+    return [blocks[n % len(blocks)] for n in xrange(count)]
+
+
+def timed(func, items):
+    start = time.time()
+    for item in items:
+        func(item)
+    return time.time() - start
+
+
+def report(name, count, before, after):
+    print '{0}: {1} items'.format(name, count)
+    print '  before: {0:.3f}s ({1:.2f}us each)'.format(before,
+                                                     before / count * 1e6)
+    print '  after:  {0:.3f}s ({1:.2f}us each)'.format(after,
+                                                     after / count * 1e6)
+    print '  speedup: {0:.2f}x'.format(before / after if after else 0)
+
+
+def bench_detail(options):
+    count = options.count or 100000
+    blocks = interface_blocks(options.fixture, count)
+    before = timed(legacy_detail, blocks)
+    after = timed(sshutil.parse_interface_detail, blocks)
+    report('SwitchPort.detail', count, before, after)
+
+
+def bench_fin(options):
+    count = options.count or 100000
+    names = interface_names(count)
+    before = timed(lambda x: legacy_format_interface_name(x, short=True),
+                   names)
+    after = timed(lambda x: sshutil.format_interface_name(x, short=True),
+                  names)
+    report('format_interface_name', count, before, after)
+
+
+def bench_mac(options):
+    # The list scan is quadratic, keep the default small enough to finish
+    count = options.count or 20000
+    lines = mac_table_lines(count)
+
+    def legacy(lines):
+        seen = []
+        for line in lines:
+            mac = legacy_format_mac_address(line.split()[1])
+            if mac not in seen:
+                seen.append(mac)
+        return seen
+
+    def current(lines):
+        seen = set()
+        for line in lines:
+            seen.add(sshutil.MACAddress(line.split()[1]))
+        return seen
+
+    before = timed(legacy, [lines])
+    after = timed(current, [lines])
+    report('MAC parse + dedupe', count, before, after)
+
+
+def bench_ports(options):
+    # A stack of 8 48 port switches, looked up the way _classify_ports does
+    count = options.count or 20000
+    names = ['GigabitEthernet{0}/0/{1}'.format(n // 48 + 1, n % 48 + 1)
+             for n in xrange(384)]
+    legacy = [sshutil.SwitchPort(name=name) for name in names]
+    table = sshutil.PortTable(legacy)
+    lookups = [names[n * 7 % len(names)] for n in xrange(count)]
+    before = timed(legacy.index, lookups)
+    after = timed(table.index, lookups)
+    report('Switch.ports.index', count, before, after)
+
+
+def bench_end_devices(options):
+    # The old version is quadratic, keep the default small enough to finish
+    count = options.count or 2000
+    before = timed(legacy_get_end_devices, [stack_switch(count)])
+    after = timed(lambda switch: switch._get_end_devices(),
+                  [stack_switch(count)])
+    report('Switch._get_end_devices', count, before, after)
+
+
+def bench_cdp(options):
+    count = options.count or 20000
+    lines = ''.join(SAMPLE_CDP_ENTRY.format(n % 48 + 1)
+                    for n in xrange(count)).splitlines()
+    before = timed(legacy_cdp_entries, [lines])
+    after = timed(sshutil.parse_cdp_neighbors, [lines])
+    report('sh cdp ne det parse', count, before, after)
+
+    tuples = [[x] for x in legacy_cdp_entries(lines).values()] * 100
+    neighbors = [[x] for x in sshutil.parse_cdp_neighbors(lines)[:48]] * 100
+    before = timed(legacy_edge, tuples)
+    after = timed(sshutil.SwitchPort()._get_edge, neighbors)
+    report('SwitchPort.edge', len(neighbors), before, after)
+
+
+def bench_version(options):
+    # Attribute access on already populated switches, like output_values
+    count = options.count or 5000
+    switches = []
+    for n in xrange(count):
+        switch = sshutil.Switch(ip='10.0.{0}.{1}'.format(n // 256, n % 256),
+                                creds=('user', 'pass'))
+        switch.state = 'UP'
+        switch._collect_version(data=SAMPLE_VERSION)
+        switches.append(switch)
+    # First pass parses (and fills the caches both versions keep)
+    first = timed(version_row, switches)
+    assert legacy_version_row(switches[0]) == version_row(switches[0])
+    before = timed(legacy_version_row, switches)
+    after = timed(version_row, switches)
+    report('Switch version properties', count, before, after)
+    print '  first access (parse): {0:.3f}s'.format(first)
+
+
+def populated_fleet(fixture, count):
+    """`count` switches with 48 ports each, as populate() would leave them"""
+    blocks = interface_blocks(fixture, 48)
+    switches = []
+    for n in xrange(count):
+        switch = sshutil.Switch(ip='10.{0}.{1}.1'.format(n // 256, n % 256),
+                                creds=('user', 'pass'))
+        switch.state = 'UP'
+        switch._collect_version(data=SAMPLE_VERSION)
+        for block in blocks:
+            switch.ports.append(sshutil.SwitchPort(detail=block,
+                                                   switch=switch))
+        switches.append(switch)
+    return switches
+
+
+def bench_snapshot(options):
+    # Reload a saved fleet and look at one switch, pickle vs snapshot
+    count = options.count or 500
+    switches = populated_fleet(options.fixture, count)
+    fd, path = tempfile.mkstemp(suffix='.snap')
+    os.close(fd)
+    try:
+        with open(path, 'wb') as fOut:
+            cPickle.dump(switches, fOut, 2)
+        pickled = os.path.getsize(path)
+        before = timed(lambda p: cPickle.load(open(p, 'rb'))[-1].model,
+                       [path])
+        snapshot.save(switches, path)
+        saved = os.path.getsize(path)
+        after = timed(lambda p: snapshot.load(p).get(switches[-1].ip).model,
+                      [path])
+        report('Fleet reload, one switch', count, before, after)
+        decodeAll = timed(lambda p: list(snapshot.load(p)), [path])
+        print '  every switch: {0:.3f}s'.format(decodeAll)
+        print '  size: {0} bytes pickled, {1} bytes snapshot'.format(pickled,
+                                                                    saved)
+    finally:
+        os.remove(path)
+
+
+SUITES = {
+    'cdp': bench_cdp,
+    'detail': bench_detail,
+    'enddevices': bench_end_devices,
+    'fin': bench_fin,
+    'mac': bench_mac,
+    'ports': bench_ports,
+    'snapshot': bench_snapshot,
+    'version': bench_version,
+}
+
+
+def createParser():
+    usage = 'usage: %prog [options]'
+    parser = OptionParser(usage)
+    parser.add_option('-t', '--suite', action='store', dest='suite',
+                      help='Benchmark to run: {0} or all'
+                      ''.format(', '.join(sorted(SUITES))))
+    parser.add_option('-n', '--count', type='int', dest='count',
+                      help='Number of items per benchmark (default varies)')
+    parser.add_option('-f', '--fixture', dest='fixture',
+                      help='show interface sample to scale up')
+    parser.set_default('suite', 'all')
+    parser.set_default('fixture', 'sample/ShowInt')
+    return parser
+
+
+def main():
+    parser = createParser()
+    (options, args) = parser.parse_args()
+    suite = options.suite.lower()
+    if suite == 'all':
+        for name in sorted(SUITES):
+            SUITES[name](options)
+    else:
+        SUITES[suite](options)
+
+if __name__ == '__main__':
+    main()
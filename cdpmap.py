@@ -8,13 +8,15 @@ Created on Dec 1, 2014
 # Standard Library Imports
 import sys
 from optparse import OptionParser
-import multiprocessing.pool
 
 # Imports from other scripts in this project
 from sshutil import get_credentials
-from sshutil import Switch
 from sshutil import deduplicate_list
+from sshutil import Switch, CDP_NETWORK_DEVICE
 import metrics
+import collector
+import cmdcache
+import snapshot
 
 
 def createParser():
@@ -24,7 +26,8 @@ def createParser():
     """
 
     usage = ('cdpmap.py -h | ([-t <host>] | -T <hostfile) '
-             '[-u <username>] [-o Output file] [-d <maximum thread count>])')
+             '[-u <username>] [-o Output file] [-d <maximum thread count>] '
+             '[-c [--depth <hops>]])')
 
     description = ('Given switch or list of switches, list CDP Neighbors.')
 
@@ -37,12 +40,21 @@ def createParser():
     parser.add_option('-u', '--username', help='Username to use to connect.'
                       ' *Will assume currently logged in user if not provided.'
                       )
-    parser.add_option('-d', '--threads', type='int', help='Number of threads '
-                      'to use for DNS resolution (or other tasks).', default=1)
+    parser.add_option('-d', '--threads', type='int', help='Number of switches '
+                      'to collect from at once (and threads to use for other '
+                      'tasks).', default=1)
+    parser.add_option('-c', '--crawl', action='store_true', default=False,
+                      help='Treat the hosts as seeds and keep going: visit '
+                      'every switch or router CDP turns up.  Only CDP and '
+                      '"sh ver" are collected.')
+    parser.add_option('--depth', type='int', default=16, help='With --crawl, '
+                      'go at most this many CDP hops from a seed (default 16)')
     parser.add_option('-o', '--outfile', help='Primary output to listed file.')
     parser.add_option('-v', '--verbose', action='count', help='Increase output'
                       ' verbosity (e.g., -vv is more than -v) up to 3',
                       default=0)
+    cmdcache.add_options(parser)
+    snapshot.add_options(parser)
     return parser
 
 
@@ -67,6 +79,7 @@ def main(argv):
     MAX_THREADS = options.threads
     metrics.VERBOSITY = options.verbose
     outfile = options.outfile
+    cmdcache.configure(options)
 
     if hostfile:  # make sense of host/hostfile options
         if host:
@@ -91,16 +104,22 @@ def main(argv):
     metrics.Clock(True)
 
     oBuffer = ''
-    switches = []
     hosts = deduplicate_list(hosts)
-    for host in hosts:
-        switch = Switch(ip=host, creds=CREDENTIALS)
-        switches.append(switch)
-
-    if MAX_THREADS > 1:  # Single or MultiThreaded...
-        switches = PopulateSwitchesMT(switches)
+    if options.crawl:
+        switches = Crawl(hosts, CREDENTIALS, MAX_THREADS, options.depth)
     else:
-        switches = PopulateSwitchesST(switches)
+        # Switches already in the snapshot are reused as-is, only the rest
+        # are populated.
+        switches, stale = snapshot.reuse(snapshot.configure(options), hosts,
+                                         CREDENTIALS)
+
+        if MAX_THREADS > 1:  # Single or MultiThreaded...
+            PopulateSwitchesMT(stale)
+        else:
+            PopulateSwitchesST(stale)
+
+    if options.save_snapshot:
+        snapshot.save(switches, options.save_snapshot)
 
     ScrubbedSwitches = []
     for switch in switches:
@@ -144,6 +163,71 @@ def main(argv):
     metrics.PrintMetrics()
 
 
+def DeviceName(name):
+    """CDP device ID or hostname, minus domain and serial, lowercase"""
+    return (name or '').split('(')[0].split('.')[0].strip().lower()
+
+
+def CrawlOne(item, creds):
+    """Visit one (ip, depth) of a crawl: CDP and 'sh ver' only"""
+    ip, depth = item
+    switch = Switch(ip=ip, creds=creds)
+    try:
+        switch.populate_cdp()
+    except Exception as E:
+        switch.state = 'DOWN'
+        metrics.DebugPrint('[{0}].populate_cdp() failed: {1}'
+                           ''.format(switch.ip, E), 3)
+    return switch
+
+
+def Crawl(seeds, creds, maxInFlight, maxDepth):
+    """
+    Visit seeds, then every switch or router their CDP neighbors lead to,
+    breadth first, at most maxInFlight at a time and at most maxDepth hops
+    from a seed.  A device is visited once, whether it turns up again
+    under the same management IP or under the same name.  Return the
+    switches visited, in the order they finished.
+    """
+    runner = collector.Runner(lambda item: CrawlOne(item, creds),
+                              maxInFlight=maxInFlight)
+    for seed in seeds:
+        runner.push((seed, 0))
+    seenIPs = set(seeds)
+    names = {}  # device name -> IP it was (or will be) visited under
+    switches = []
+    for (_, depth), switch, _ in runner:
+        if switch.state != 'UP':
+            switches.append(switch)
+            continue
+        name = DeviceName(switch.version_info.hostname)
+        if name and names.setdefault(name, switch.ip) != switch.ip:
+            # a seed we'd already reached through another address
+            metrics.DebugPrint('[{0}] is {1}, already visited as [{2}]'
+                               ''.format(switch.ip, name, names[name]), 1)
+            continue
+        switches.append(switch)
+        metrics.UpdateMetric('cdpmap.crawled')
+        if depth >= maxDepth:
+            continue
+
+        for neighbor in switch.cdp_information.values():
+            if not neighbor.flags & CDP_NETWORK_DEVICE:
+                continue
+            ip = neighbor.ip
+            name = DeviceName(neighbor.deviceID)
+            if not ip or ip in seenIPs or name in names:
+                continue
+            seenIPs.add(ip)
+            if name:
+                names[name] = ip
+            runner.push((ip, depth + 1))
+        metrics.DebugPrint('crawl: {0} done, {1} in flight, {2} queued'
+                           ''.format(len(switches), runner.inFlight,
+                                     len(runner)), 1)
+    return switches
+
+
 def ListCDPEndpoints(switches):
     s = set()
     for switch in switches:
@@ -155,7 +239,7 @@ def ListCDPEndpoints(switches):
 
 def PopulateSwitch(switch):
     """
-    Wrapper to support multiprocessing.pool.map() syntax
+    Populate a single switch, return it.
     """
     switch.populate()
     return switch
@@ -167,11 +251,7 @@ def PopulateSwitchesMT(switches):
     metrics.DebugPrint('interfacedescription.py:PopulateSwitchesMT.Switches: '
                        '{0}'.format(', '.join(map(str, switches))), 1)
 
-    pool = multiprocessing.pool.ThreadPool(processes=MAX_THREADS)
-    mtRslts = pool.map(PopulateSwitch, switches)
-    pool.close()
-    pool.join()
-    return mtRslts
+    return collector.populate_switches(switches, MAX_THREADS)
 
 
 def PopulateSwitchesST(switches):
@@ -0,0 +1,179 @@
+"""
+Created on Oct 18, 2026
+
+Opt-in on-disk cache of command output, keyed by (host, command).
+
+Output lives in a local SQLite file so separate runs (and separate tools) can
+share it.  How long an entry stays good depends on the command: 'show
+version' barely changes, the MAC address table changes constantly.  See
+DEFAULT_TTLS.  Nothing is cached unless enable() has been called, usually
+through the --cache option that add_options() gives a script.
+"""
+# Standard Library Imports
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Imports from other scripts in this project
+from metrics import UpdateMetric, DebugPrint
+
+DEFAULT_PATH = os.path.expanduser('~/.sshutil_cache.sqlite')
+
+# (regex, seconds), first match wins.  Commands are matched lowercase with
+# whitespace collapsed.  Anything that doesn't match is never cached, which
+# keeps ping, configuration and any show command not listed here off the
+# cache.
+DEFAULT_TTLS = [
+    (r'sh(ow?)? ver', 24 * 3600),
+    (r'sh(ow?)? (start|run)', 12 * 3600),
+    (r'sh(ow?)? (mod|lic)', 12 * 3600),
+    (r'dir( |$)', 3600),
+    (r'sh(ow?)? cdp', 3600),
+    (r'sh(ow?)? int\S* (desc|switchport|status)', 3600),
+    (r'sh(ow?)? mac', 300),
+    (r'sh(ow?)? ip arp|sh(ow?)? arp', 300),
+    (r'sh(ow?)? int', 60),  # counters
+]
+
+# IOS error replies ('% Invalid input detected', '% Ambiguous command') are
+# never stored, or a typo would keep failing long after it's fixed
+ERROR_LINE = re.compile(r'^\s*% ', re.M)
+
+CACHE = None  # set by enable()
+
+
+class CommandCache(object):
+    """
+        (host, command) -> output, in SQLite.  Safe to share between threads.
+        maxAge, if given, caps every TTL (seconds).
+    """
+    def __init__(self, path=DEFAULT_PATH, maxAge=None, ttls=DEFAULT_TTLS):
+        self.path = path
+        self.maxAge = maxAge
+        self.ttls = [(re.compile(regex), ttl) for regex, ttl in ttls]
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.text_factory = str  # device output isn't always utf-8
+        with self._lock:
+            self._db.execute('CREATE TABLE IF NOT EXISTS output ('
+                             'host TEXT, command TEXT, trim INTEGER, '
+                             'stored REAL, output TEXT, '
+                             'PRIMARY KEY (host, command, trim))')
+            self._db.commit()
+
+    @staticmethod
+    def _key(command):
+        return ' '.join(command.split()).lower()
+
+    def ttl(self, command):
+        """Seconds output of command stays good, None if it isn't cached"""
+        command = self._key(command)
+        for regex, ttl in self.ttls:
+            if regex.match(command):
+                if self.maxAge is not None:
+                    ttl = min(ttl, self.maxAge)
+                return ttl
+        return None
+
+    def get(self, host, command, trim=True):
+        """Return cached output, or None if missing, expired or uncacheable"""
+        ttl = self.ttl(command)
+        if not ttl:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                'SELECT stored, output FROM output '
+                'WHERE host = ? AND command = ? AND trim = ?',
+                (host, self._key(command), int(bool(trim)))).fetchone()
+        if row is None:
+            UpdateMetric('cmdcache.miss')
+            return None
+        stored, output = row
+        if time.time() - stored > ttl:
+            UpdateMetric('cmdcache.expired')
+            return None
+        UpdateMetric('cmdcache.hit')
+        DebugPrint('cmdcache: [{0}] {1} ({2:.0f}s old)'
+                   ''.format(host, command, time.time() - stored), 0)
+        return output
+
+    def put(self, host, command, output, trim=True):
+        if not self.ttl(command):
+            return
+        if ERROR_LINE.search(output):
+            UpdateMetric('cmdcache.error')
+            return
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO output '
+                '(host, command, trim, stored, output) VALUES (?, ?, ?, ?, ?)',
+                (host, self._key(command), int(bool(trim)), time.time(),
+                 output))
+            self._db.commit()
+        UpdateMetric('cmdcache.store')
+
+    def purge(self, olderThan=None):
+        """Drop entries older than olderThan seconds (default: all)"""
+        with self._lock:
+            if olderThan is None:
+                self._db.execute('DELETE FROM output')
+            else:
+                self._db.execute('DELETE FROM output WHERE stored < ?',
+                                 (time.time() - olderThan, ))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def enable(path=DEFAULT_PATH, maxAge=None):
+    """Turn the cache on for every NetworkDevice in this process"""
+    global CACHE
+    if CACHE is not None:
+        CACHE.close()
+    CACHE = CommandCache(path, maxAge)
+    DebugPrint('cmdcache: using {0}'.format(path), 1)
+    return CACHE
+
+
+def disable():
+    global CACHE
+    if CACHE is not None:
+        CACHE.close()
+    CACHE = None
+
+
+def cached(host, command, run, trim=True):
+    """
+        Return output of command on host from the cache if it's there,
+        otherwise call run() for it and store the result.
+    """
+    if CACHE is None:
+        return run()
+    output = CACHE.get(host, command, trim)
+    if output is None:
+        output = run()
+        CACHE.put(host, command, output, trim)
+    return output
+
+
+def add_options(parser):
+    """Add --cache, --cache-file and --max-age to an OptionParser"""
+    parser.add_option('--cache', action='store_true', default=False,
+                      help='Reuse recent command output from the local cache '
+                      'instead of connecting, and store what is pulled.')
+    parser.add_option('--cache-file', default=DEFAULT_PATH,
+                      help='Cache location (default: {0})'
+                      ''.format(DEFAULT_PATH))
+    parser.add_option('--max-age', type='int', dest='max_age',
+                      help='With --cache, ignore entries older than this '
+                      'many seconds, whatever the command.')
+
+
+def configure(options):
+    """Enable the cache if options (from add_options) ask for it"""
+    if options.cache:
+        return enable(options.cache_file, options.max_age)
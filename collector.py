@@ -0,0 +1,147 @@
+"""
+Created on Oct 18, 2026
+
+Fleet-wide collection engine.  Runs a Switch method (populate() by default)
+across many switches with a bounded number of devices in flight at once.
+
+paramiko already runs one transport thread per session and every call it
+makes is blocking, so each in-flight device gets a lightweight worker thread.
+Scheduling happens in the caller's thread, as it iterates: a worker is only
+started when a slot is free, and a slot is only given back once the caller
+is done with the result that held it.  Input is consumed lazily, so a
+hostfile of any size costs no more than maxInFlight devices worth of state
+at a time (running, waiting to be picked up, or being looked at).
+
+Runner does the scheduling for anything that looks like "do this to each of
+these, and maybe to whatever that turns up" (cdpmap's crawl, macsearch's
+next hops); iter_populated() and populate_switches() are the plain case.
+"""
+# Standard Library Imports
+import threading
+import Queue
+from collections import deque
+
+# Imports from other scripts in this project
+import sshexecute
+import metrics
+
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+class Runner(object):
+    """
+        Run work(item) on a worker thread per item, at most maxInFlight at
+        once, and yield (item, result, error) as each finishes, in completion
+        order.  error is the exception work() raised (result is then None).
+
+        Items come from push(), which the caller may keep using while it
+        iterates (a crawl adding the neighbors it just found), and then from
+        items, read lazily.  push(item, first=True) jumps the queue.  With
+        unique, an item that has already been started isn't started again.
+
+        Iteration ends once nothing is running, queued or left in items.  A
+        caller that stops early just walks away: nothing new is started and
+        what is still running is abandoned (worker threads are daemons).
+        Every device in flight holds a pooled session, so the connection pool
+        is told to make room for maxInFlight while the iteration lasts.
+    """
+    def __init__(self, work, items=(), maxInFlight=DEFAULT_MAX_IN_FLIGHT,
+                 unique=False):
+        self.work = work
+        self.maxInFlight = max(1, maxInFlight)
+        self.unique = unique
+        self.started = set()
+        self._items = iter(items)
+        self._queue = deque()
+        self._results = Queue.Queue()
+        self.inFlight = 0
+
+    def push(self, item, first=False):
+        if first:
+            self._queue.appendleft(item)
+        else:
+            self._queue.append(item)
+
+    def __len__(self):
+        """Items queued by push() and not started yet"""
+        return len(self._queue)
+
+    def _next(self):
+        """Next item to start, or raise StopIteration"""
+        while True:
+            if self._queue:
+                item = self._queue.popleft()
+            else:
+                item = next(self._items)  # errors go to the caller
+            if not self.unique:
+                return item
+            if item not in self.started:
+                self.started.add(item)
+                return item
+
+    def _run(self, item):
+        try:
+            self._results.put((item, self.work(item), None))
+        except Exception as E:
+            self._results.put((item, None, E))
+
+    def __iter__(self):
+        with sshexecute.POOL.reserve(self.maxInFlight):
+            while True:
+                while self.inFlight < self.maxInFlight:
+                    try:
+                        item = self._next()
+                    except StopIteration:
+                        break
+                    worker = threading.Thread(target=self._run, args=(item, ))
+                    worker.daemon = True
+                    worker.start()
+                    self.inFlight += 1
+                if not self.inFlight:
+                    return
+
+                # Queue.get() without a timeout can't be interrupted by ^C
+                # in py2
+                rslt = self._results.get(True, 1e6)
+                try:
+                    yield rslt
+                finally:
+                    self.inFlight -= 1
+
+
+def _populate(method):
+    def work(switch):
+        try:
+            getattr(switch, method)()
+        except Exception as E:
+            switch.state = 'DOWN'
+            metrics.UpdateMetric('collector.failed')
+            metrics.DebugPrint('[{0}].{1}() failed: {2}'
+                               ''.format(switch.ip, method, E), 3)
+        return switch
+    return work
+
+
+def iter_populated(switches, maxInFlight=DEFAULT_MAX_IN_FLIGHT,
+                   method='populate'):
+    """
+    Run switch.<method>() for each of switches with at most maxInFlight
+    running at once.  Yield each switch as it finishes, in completion order.
+    A switch that raises is marked 'DOWN' and yielded like any other.
+    """
+    metrics.DebugPrint('collector.iter_populated.maxInFlight: {0}'
+                       ''.format(maxInFlight), 2)
+    for switch, _, _ in Runner(_populate(method), switches, maxInFlight):
+        yield switch
+
+
+def populate_switches(switches, maxInFlight=DEFAULT_MAX_IN_FLIGHT,
+                      method='populate'):
+    """
+    Run switch.<method>() for each of switches with at most maxInFlight
+    running at once.  Return the same switches, in the order given.
+    """
+    switches = list(switches)
+    for _ in iter_populated(switches, maxInFlight, method):
+        pass
+    return switches
@@ -0,0 +1,267 @@
+"""
+Created on Oct 18, 2026
+
+Columnar store of 'show interface' counters for a whole fleet.
+
+Every counter InterfaceCounters knows about is one NumPy column (int64, -1
+where the device didn't report it), one row per port.  Switch, port and the
+'Last clearing of counters' text are dictionary encoded: the row holds an
+integer id, the strings live once in a table.  Questions about every port
+at once (top N by errors, everything over some rate, what changed between
+two polls) are then array operations instead of a walk over SwitchPorts.
+
+Rows go in through add_output() straight from the 'show interface' parser,
+or through add_switch() from the counters of an already populated switch.
+They're buffered as plain lists and become arrays, one chunk per flush, the
+first time something reads the store.
+
+NumPy is optional for the rest of the project, only this module needs it.
+"""
+# Standard Library Imports
+import bisect
+from collections import namedtuple
+
+# Imports from other scripts in this project
+from sshutil import (InterfaceCounters, iter_lines, iter_interface_blocks,
+                     parse_interface_detail, try_normalize)
+from metrics import UpdateMetric
+
+# Imports from third party modules
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MISSING = -1
+COUNTERS = InterfaceCounters.KEYS[1:]  # everything but StatDuration
+_STAT_DURATION = InterfaceCounters.INDEX['StatDuration']
+_COUNTER_INDEXES = [InterfaceCounters.INDEX[key] for key in COUNTERS]
+
+# One port of a store, as returned by CounterStore.top() and friends
+Row = namedtuple('Row', 'switch, port, value')
+
+
+class _Table(object):
+    """Dictionary encoding: string <-> small integer id"""
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def id(self, name):
+        id_ = self.ids.get(name)
+        if id_ is None:
+            id_ = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id_
+
+    def __len__(self):
+        return len(self.names)
+
+
+class CounterStore(object):
+    """
+        Interface counters for many switches, one column per counter.
+        store['InputErrors'] is the whole column; store.switch_ids,
+        store.port_ids and store.cleared_ids the encoded row keys.
+    """
+    def __init__(self):
+        if numpy is None:
+            raise Exception('CounterStore needs NumPy')
+        self.switches = _Table()
+        self.ports = _Table()
+        self.durations = _Table()
+        self._pending = [[] for _ in range(3 + len(COUNTERS))]
+        self._chunks = []  # [(switch ids, port ids, cleared ids, counters)]
+        self._offsets = []  # first row of each chunk
+        self._rows = 0
+
+    def _append(self, switchId, port, values):
+        pending = self._pending
+        pending[0].append(switchId)
+        pending[1].append(self.ports.id(port))
+        pending[2].append(self.durations.id(values[_STAT_DURATION] or ''))
+        for column, index in enumerate(_COUNTER_INDEXES, 3):
+            value = values[index]
+            pending[column].append(MISSING if value is None else value)
+        self._rows += 1
+
+    def add_output(self, switch, data):
+        """
+        Parse 'show interface' output from switch (its IP or name) straight
+        into the store.  Return the (start, stop) rows it filled.
+        """
+        start = self._rows
+        switchId = self.switches.id(str(switch))
+        for block in iter_interface_blocks(iter_lines(data)):
+            name, _, _, counters = parse_interface_detail('\n'.join(block))
+            if name is not None:
+                # same names SwitchPort gives them, so add_switch() rows
+                # line up with these
+                self._append(switchId, try_normalize(name, default=name),
+                             counters.values)
+        UpdateMetric('CounterStore.add_output')
+        return start, self._rows
+
+    def add_switch(self, switch):
+        """
+        Add every port of switch (after _get_interfaces()), reading the
+        parser's counter lists as they are.  Return the (start, stop) rows
+        it filled.
+        """
+        start = self._rows
+        switchId = self.switches.id(switch.ip)
+        for port in switch.ports:
+            self._append(switchId, port.name, port.stats.values)
+        UpdateMetric('CounterStore.add_switch')
+        return start, self._rows
+
+    def _flush(self):
+        if not self._pending[0]:
+            return
+        pending = self._pending
+        self._offsets.append(self._rows - len(pending[0]))
+        self._chunks.append((numpy.array(pending[0], dtype=numpy.int32),
+                             numpy.array(pending[1], dtype=numpy.int32),
+                             numpy.array(pending[2], dtype=numpy.int32),
+                             [numpy.array(column, dtype=numpy.int64)
+                              for column in pending[3:]]))
+        self._pending = [[] for _ in pending]
+
+    def _compact(self):
+        """All rows as a single chunk"""
+        self._flush()
+        if not self._chunks:
+            empty = numpy.zeros(0, dtype=numpy.int32)
+            return (empty, empty, empty,
+                    [numpy.zeros(0, dtype=numpy.int64) for _ in COUNTERS])
+        if len(self._chunks) > 1:
+            chunks = self._chunks
+            self._chunks = [(
+                numpy.concatenate([chunk[0] for chunk in chunks]),
+                numpy.concatenate([chunk[1] for chunk in chunks]),
+                numpy.concatenate([chunk[2] for chunk in chunks]),
+                [numpy.concatenate([chunk[3][n] for chunk in chunks])
+                 for n in range(len(COUNTERS))])]
+            self._offsets = [0]
+        return self._chunks[0]
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, key):
+        """A counter's column, e.g. store['InputErrors']"""
+        return self._compact()[3][COUNTERS.index(key)]
+
+    @property
+    def switch_ids(self):
+        return self._compact()[0]
+
+    @property
+    def port_ids(self):
+        return self._compact()[1]
+
+    @property
+    def cleared_ids(self):
+        return self._compact()[2]
+
+    def names(self, rows):
+        """[(switch, port)] for row numbers rows"""
+        switchIds, portIds = self.switch_ids[rows], self.port_ids[rows]
+        return [(self.switches.names[s], self.ports.names[p])
+                for s, p in zip(switchIds.tolist(), portIds.tolist())]
+
+    def top(self, key, n=50, mask=None):
+        """
+        The n rows with the highest key (ports missing it never count),
+        highest first.  mask, a boolean array over the rows, narrows them.
+        """
+        values = self[key]
+        rows = numpy.flatnonzero(values != MISSING if mask is None else
+                                 (values != MISSING) & mask)
+        if len(rows) > n:
+            rows = rows[numpy.argpartition(values[rows], -n)[-n:]]
+        rows = rows[numpy.argsort(values[rows], kind='mergesort')[::-1]]
+        return [Row(switch, port, value) for (switch, port), value
+                in zip(self.names(rows), values[rows].tolist())]
+
+    def keys(self, other=None):
+        """
+        One int64 per row naming its (switch, port), for this store's rows
+        or, with other, for other's rows in this store's ids (-1 for names
+        this store doesn't have).
+        """
+        if other is None:
+            switchIds, portIds = self.switch_ids, self.port_ids
+        else:
+            switchMap = numpy.array([self.switches.ids.get(name, -1)
+                                     for name in other.switches.names],
+                                    dtype=numpy.int64)
+            portMap = numpy.array([self.ports.ids.get(name, -1)
+                                   for name in other.ports.names],
+                                  dtype=numpy.int64)
+            switchIds = switchMap[other.switch_ids] if len(other) else \
+                numpy.zeros(0, dtype=numpy.int64)
+            portIds = portMap[other.port_ids] if len(other) else \
+                numpy.zeros(0, dtype=numpy.int64)
+        width = max(len(self.ports), 1)
+        keys = numpy.asarray(switchIds, dtype=numpy.int64) * width + portIds
+        # a name we don't have can't match any of our rows
+        return numpy.where((switchIds < 0) | (portIds < 0), -1, keys)
+
+    def delta(self, older, key):
+        """
+        Change in key from older (an earlier store of the same ports) to
+        this one.  Return (rows, deltas): the rows of this store that are
+        in both and have key in both, and how much it went up.  A counter
+        that dropped from the top half of the 32 bit range wrapped, one
+        that dropped from anywhere else was cleared and counts from zero
+        (see interfacestats.CounterDelta).
+        """
+        mine, theirs = self.keys(), self.keys(older)
+        order = numpy.argsort(theirs, kind='mergesort')
+        theirsSorted = theirs[order]
+        found = numpy.searchsorted(theirsSorted, mine)
+        found = numpy.minimum(found, max(len(theirsSorted) - 1, 0))
+        match = (theirsSorted[found] == mine) if len(theirsSorted) else \
+            numpy.zeros(len(mine), dtype=bool)
+        new = self[key]
+        old = numpy.full(len(mine), MISSING, dtype=numpy.int64)
+        old[match] = older[key][order[found[match]]]
+        match &= (new != MISSING) & (old != MISSING)
+
+        rows = numpy.flatnonzero(match)
+        new, old = new[rows], old[rows]
+        deltas = new - old
+        wrapped = (deltas < 0) & (old >= 2 ** 31) & (old < 2 ** 32)
+        deltas = numpy.where(wrapped, deltas + 2 ** 32,
+                             numpy.where(deltas < 0, new, deltas))
+        return rows, deltas
+
+    def iter_rows(self, start=0, stop=None):
+        """
+        [switch, port, StatDuration, counters...] for rows start to stop,
+        in InterfaceCounters.KEYS order, '' where a counter is missing.
+        Reads chunk by chunk; nothing per port is built beyond the row.
+        """
+        self._flush()
+        stop = self._rows if stop is None else min(stop, self._rows)
+        first = max(bisect.bisect_right(self._offsets, start) - 1, 0)
+        for n in range(first, len(self._chunks)):
+            offset = self._offsets[n]
+            if offset >= stop:
+                break
+            switchIds, portIds, clearedIds, counters = self._chunks[n]
+            lo, hi = max(start - offset, 0), min(stop - offset,
+                                                 len(switchIds))
+            if lo >= hi:
+                continue
+            columns = [column[lo:hi].tolist() for column in counters]
+            switches = [self.switches.names[i] for i in
+                        switchIds[lo:hi].tolist()]
+            ports = [self.ports.names[i] for i in portIds[lo:hi].tolist()]
+            cleared = [self.durations.names[i] for i in
+                       clearedIds[lo:hi].tolist()]
+            for row, values in enumerate(zip(*columns)):
+                yield ([switches[row], ports[row], cleared[row]] +
+                       ['' if value == MISSING else value
+                        for value in values])
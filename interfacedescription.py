@@ -22,13 +22,15 @@ MULTITHREADING = False
 # Standard Library Imports
 import sys
 from optparse import OptionParser
-import multiprocessing.pool
 
 # Imports from other scripts in this project
 import sshutil
-from sshutil import get_credentials, Switch  # EndDevice, SwitchPort
+from sshutil import get_credentials  # Switch, EndDevice, SwitchPort
 from sshutil import Date, DateTime  # DeduplicateList
 import metrics
+import collector
+import cmdcache
+import snapshot
 
 
 def createParser():
@@ -50,9 +52,13 @@ def createParser():
                       ' *Will assume currently logged in user if not provided.'
                       )
     parser.add_option('-g', '--gateway', help='Switch or router to use for '
-                      'MAC -> IP resolution (via ARP table lookup).')
-    parser.add_option('-d', '--threads', type='int', help='Number of threads '
-                      'to use for DNS resolution (or other tasks).',
+                      'MAC -> IP resolution (via ARP table lookup).  Several '
+                      'may be given, comma separated, each optionally limited'
+                      ' to VLANs/subnets: 10.1.20.1=20+21,10.1.30.1=10.1.30.0'
+                      '/24')
+    parser.add_option('-d', '--threads', type='int', help='Number of switches '
+                      'to collect from at once, and threads to use for DNS '
+                      'resolution (or other tasks).',
                       default=1)
     parser.add_option('-o', '--outfile', help='Primary output to listed file.')
     parser.add_option('-v', '--verbose', action='count', help='Increase output'
@@ -60,6 +66,10 @@ def createParser():
                       default=0)
     parser.add_option('-e', '--edge', help='Include Edge Devices',
                       action='store_true')
+    parser.add_option('--dns-cache', dest='dns_cache', help='Keep reverse '
+                      'DNS answers in this file between runs.')
+    cmdcache.add_options(parser)
+    snapshot.add_options(parser)
     return parser
 
 
@@ -77,11 +87,12 @@ def main(argv):
         addresses, one per line.
     --username or -u -- username to use to connect. *Will assume currently
         logged in user if not provided.
-    --threads or -d  -- Number of  threads to use for DNS resolution (or other
-        tasks).
+    --threads or -d  -- Number of switches to collect from at once, and threads
+        to use for DNS resolution (or other tasks).
     --outfile or -o  -- primary output to listed file.
     --gateway or -g  -- switch or router to use for MAC -> IP resolution (via
-        ARP table lookup).
+        ARP table lookup).  Comma separated for several, each optionally
+        '=' VLANs/subnets it serves, '+' separated.
     --help or -h -- print this usage information.
      """
     global CREDENTIALS
@@ -102,6 +113,9 @@ def main(argv):
     metrics.VERBOSITY = options.verbose
     MAX_THREADS = options.threads
     edge = options.edge
+    cmdcache.configure(options)
+    if options.dns_cache:
+        sshutil.DNS_RESOLVER = sshutil.DNSResolver(options.dns_cache)
 
     if MAX_THREADS > 1:
         MULTITHREADING = True
@@ -129,7 +143,10 @@ def main(argv):
     CREDENTIALS = get_credentials(username)
 
     metrics.Clock(True)
-    switches = PrepareSwitches(hosts, CREDENTIALS, DEFAULT_GATEWAY)
+    switches = PrepareSwitches(hosts, CREDENTIALS, DEFAULT_GATEWAY,
+                               snapshot.configure(options))
+    if options.save_snapshot:
+        snapshot.save(switches, options.save_snapshot)
 
     oBuffer = ''
     for switch in switches:
@@ -256,30 +273,28 @@ def PrepairDescripiton(switchport):
     return description
 
 
-def PrepareSwitches(hosts, creds, defaultgateway):
+def PrepareSwitches(hosts, creds, defaultgateway, snap=None):
     '''
         Given host,creds,defaultgateway, call switchuserinfo.process_end_devices
         use 'switch' strings in each EndDevice to populate list of switches,
         properly link Switch and EndDevice ojbects
         create device.switchport.  device.switchport property handles linking
         return list of switches
+        Switches found in snap (a snapshot.Snapshot) already have their end
+        devices resolved and are used as they are.
     '''
     metrics.DebugPrint('interfacedescription.py:PrepareSwitches()', 2)
-    switches = []
-
-    for host in hosts:
-        sw = Switch(ip=host, creds=creds)
-        switches.append(sw)
+    switches, stale = snapshot.reuse(snap, hosts, creds)
 
     if MULTITHREADING:
-        switches = PopulateSwitchesMT(switches)
+        PopulateSwitchesMT(stale)
     else:
-        switches = PopulateSwitchesST(switches)
+        PopulateSwitchesST(stale)
 
     metrics.DebugPrint('interfacedescription.py:PrepareSwitches.len(switches):'
                        ' {0}'.format(len(switches)), 2)
     ScrubbedSwitches = []
-    for sw in switches:
+    for sw in stale:
         if sw.state in sw.goodstates:
             ScrubbedSwitches.append(sw)
 
@@ -302,11 +317,7 @@ def PopulateSwitchesMT(switches):
     metrics.DebugPrint('interfacedescription.py:PopulateSwitchesMT.Switches: '
                        '{0}'.format(', '.join(map(str, switches))), 1)
 
-    pool = multiprocessing.pool.ThreadPool(processes=MAX_THREADS)
-    mtRslts = pool.map(PopulateSwitch, switches)
-    pool.close()
-    pool.join()
-    return mtRslts
+    return collector.populate_switches(switches, MAX_THREADS)
 
 
 def PopulateSwitchesST(switches):
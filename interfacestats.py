@@ -9,12 +9,214 @@ Created on Dec 3, 2014
 import sys
 import getopt
 import csv
+import re
+import time
+from collections import deque, namedtuple
 
 # Imports from other scripts in this project
 from sshutil import get_credentials, Switch
 from sshutil import deduplicate_list
 from metrics import PrintMetrics
 from metrics import DebugPrint
+import collector
+import counterstore
+
+MAX_THREADS = collector.DEFAULT_MAX_IN_FLIGHT
+STATS = ['StatDuration', '5MinInputBPS', '5MinInputPPS', '5MinOutputBPS',
+         '5MinOutputPPS', 'InputPackets', 'InputBytes', 'OutputPackets',
+         'OutputBytes', 'InputErrors', 'OutputErrors']
+
+
+def FormatSwitch(switch):
+    """Text output for one switch: its interfaces and their stats"""
+    oBuffer = switch.ip + '\n'
+    for interface in sorted(switch.ports):
+        oBuffer += ':' + interface.name + '\n'
+        for key in sorted(interface.stats):
+            oBuffer += '---' + key + ":  " + str(interface.stats[key])\
+                + '\n'
+    oBuffer += '\n'
+    return oBuffer
+
+
+def CSVRows(switch):
+    """CSV rows for one switch, one per interface, '' for a missing counter"""
+    for interface in sorted(switch.ports):
+        values = []
+        for stat in STATS:
+            values.append(interface.stats.get(stat, ''))
+        yield [switch.ip, interface.name] + values
+
+
+# Cumulative counters poll mode (-i) computes rates from
+POLLED = ('InputBytes', 'OutputBytes', 'InputPackets', 'OutputPackets',
+          'InputErrors', 'OutputErrors')
+DEFAULT_SAMPLES = 10
+RATE_FIELDS = ['InputBPS', 'OutputBPS', 'InputPPS', 'OutputPPS',
+               'InputErrorsPS', 'OutputErrorsPS']
+
+# One poll of one port.  cleared is seconds since its counters were last
+# cleared ('Last clearing of "show interface" counters'), None for never.
+Sample = namedtuple('Sample', 'time, cleared, counters')
+# Per-second rates between two samples, in RATE_FIELDS order, plus what
+# happened to the counters in between: None, 'wrapped', 'reset' or 'cleared'
+Rate = namedtuple('Rate', 'seconds, rates, event')
+
+_DURATION_UNITS = {'y': 365 * 86400, 'w': 7 * 86400, 'd': 86400, 'h': 3600,
+                   'm': 60, 's': 1}
+
+
+def ParseDuration(text):
+    """
+    IOS uptime-style duration ('00:12:34', '1d02h', '3w2d', '1y4w') in
+    seconds.  None for 'never' or anything unrecognised.
+    """
+    if not text or text == 'never':
+        return None
+    if ':' in text:
+        try:
+            hours, minutes, seconds = [int(x) for x in text.split(':')]
+        except ValueError:
+            return None
+        return hours * 3600 + minutes * 60 + seconds
+    parts = re.findall(r'(\d+)([ywdhms])', text)
+    if not parts:
+        return None
+    return sum(int(count) * _DURATION_UNITS[unit] for count, unit in parts)
+
+
+def CounterDelta(old, new, cleared=False):
+    """
+    Increase of a cumulative counter from old to new, and the event behind
+    it if it went backwards.  A counter that drops from the top half of its
+    range (32 or 64 bit) wrapped; one that drops from anywhere else was
+    reset (reload, or a clear we couldn't see) and counts from zero.
+    """
+    if cleared:
+        return new, 'cleared'
+    if new >= old:
+        return new - old, None
+    modulus = 2 ** 32 if old < 2 ** 32 else 2 ** 64
+    if old >= modulus // 2:
+        return new + modulus - old, 'wrapped'
+    return new, 'reset'
+
+
+def SampleRate(old, new):
+    """Rate between two Samples of the same port"""
+    cleared = (new.cleared is not None and
+               (old.cleared is None or new.cleared < old.cleared))
+    seconds = new.time - old.time
+    if cleared:
+        # only what was counted since the clear is in the counters
+        seconds = min(seconds, new.cleared) or seconds
+    event = 'cleared' if cleared else None
+    deltas = []
+    for before, after in zip(old.counters, new.counters):
+        if before is None or after is None:
+            deltas.append(0)
+            continue
+        delta, what = CounterDelta(before, after, cleared)
+        event = event or what
+        deltas.append(delta)
+    # bytes to bits
+    deltas[0] *= 8
+    deltas[1] *= 8
+    seconds = max(seconds, 1e-3)
+    return Rate(seconds, [delta / float(seconds) for delta in deltas],
+                event)
+
+
+class CounterHistory(object):
+    """
+        The last `samples` polls of every port seen, in a ring buffer per
+        port, keyed by (switch ip, port name).
+    """
+    def __init__(self, samples=DEFAULT_SAMPLES):
+        self.samples = max(2, samples)
+        self.ports = {}
+
+    def add(self, switch, when=None):
+        """
+        Record a poll of switch (after _get_interfaces()).  Yield
+        (port name, Rate, window Rate) for each port whose counters moved
+        since its previous sample.  The window Rate covers every sample
+        still in the ring buffer.
+        """
+        if when is None:
+            when = time.time()
+        for interface in sorted(switch.ports):
+            stats = interface.stats
+            sample = Sample(when, ParseDuration(stats.get('StatDuration')),
+                            tuple(stats.get(key) for key in POLLED))
+            key = (switch.ip, interface.name)
+            history = self.ports.get(key)
+            if history is None:
+                history = self.ports[key] = deque(maxlen=self.samples)
+            history.append(sample)
+            if len(history) < 2:
+                continue
+            rate = SampleRate(history[-2], sample)
+            if rate.event is None and history[-2].counters == sample.counters:
+                continue
+            yield interface.name, rate, self.window(history)
+
+    @staticmethod
+    def window(history):
+        """Rate over a whole ring buffer, pair by pair"""
+        seconds, totals, event = 0.0, [0.0] * len(POLLED), None
+        for old, new in zip(list(history)[:-1], list(history)[1:]):
+            rate = SampleRate(old, new)
+            seconds += rate.seconds
+            for n, value in enumerate(rate.rates):
+                totals[n] += value * rate.seconds
+            event = event or rate.event
+        return Rate(seconds, [total / seconds for total in totals], event)
+
+
+def FormatRate(ip, port, rate, window):
+    """One line of poll output"""
+    line = ('{0} {1} {2}: in {3:.0f} bps {5:.0f} pps, out {4:.0f} bps '
+            '{6:.0f} pps, errors {7:.2f}/{8:.2f} per sec'
+            ''.format(time.strftime('%H:%M:%S'), ip, port, *rate.rates))
+    line += ' ({0:.0f}s avg in {1:.0f} bps, out {2:.0f} bps)'.format(
+        window.seconds, window.rates[0], window.rates[1])
+    if rate.event:
+        line += ' [counters {0}]'.format(rate.event)
+    return line + '\n'
+
+
+def Poll(hosts, creds, interval, samples, fOut, csvWriter=None,
+         rounds=None):
+    """
+    Run 'show interface' on hosts every interval seconds and write the
+    rates of every port that changed.  Runs until ^C, or for `rounds`
+    polls if given.
+    """
+    history = CounterHistory(samples)
+    count = 0
+    while rounds is None or count < rounds:
+        start = time.time()
+        switches = (Switch(ip=host, creds=creds) for host in hosts)
+        for switch in collector.iter_populated(switches, MAX_THREADS,
+                                               '_get_interfaces'):
+            if switch.state != 'UP':
+                DebugPrint('interfacestats: {0} is {1}'
+                           ''.format(switch.ip, switch.state), 3)
+                continue
+            for port, rate, window in history.add(switch):
+                fOut.write(FormatRate(switch.ip, port, rate, window))
+                if csvWriter:
+                    csvWriter.writerow(
+                        [time.strftime('%Y-%m-%d %H:%M:%S'), switch.ip, port,
+                         '{0:.1f}'.format(rate.seconds)] +
+                        ['{0:.1f}'.format(value) for value in rate.rates] +
+                        [rate.event or ''])
+            fOut.flush()
+        count += 1
+        if rounds is None or count < rounds:
+            time.sleep(max(0, interval - (time.time() - start)))
+    return history
 
 
 def main(argv):
@@ -23,7 +225,8 @@ def main(argv):
         or more switches.
 
     interfacestats.py -h | ([-t <host>] | -T <hostfile) [-u <username>]
-        [-o Output file] [-c CSV Output File] [-d <maximum thread count>])
+        [-o Output file] [-c CSV Output File] [-d <maximum thread count>]
+        [-i <seconds> [-n <samples>]] [--top <counter>[:<count>]])
 
     --host or -t     -- hostname or IP address of switch *Will prompt if
         neither host nor hostfile are provided.
@@ -31,10 +234,18 @@ def main(argv):
         addresses, one per line.
     --username or -u -- username to use to connect. *Will assume currently
         logged in user if not provided.
-    --threads or -d  -- Number of threads to use for DNS resolution (or other
-        tasks).
+    --threads or -d  -- Number of switches to collect from at once (default
+        64).  Output is written as each one finishes.
     --outfile or -o  -- primary output to listed file.
     --csv or -c  --primary output to listed CSV file
+    --interval or -i -- keep polling every this many seconds and print the
+        bps/pps/error rates of every port that changed, until ^C.
+    --samples or -n  -- with -i, samples kept per port for the averages
+        (default 10).
+    --top            -- after collecting, list the ports with the highest
+        value of a counter (e.g. InputErrors:20, default 50 ports).  Keeps
+        every port's counters until the end of the run, in a columnar store
+        (see counterstore.py) that needs NumPy.
     --help or -h -- print this usage information.
      """
     global CREDENTIALS
@@ -46,14 +257,20 @@ def main(argv):
     username = None
     outfile = ''
     csvfile = ''
+    interval = None
+    samples = DEFAULT_SAMPLES
+    top = None
     try:
-        opts, _ = getopt.getopt(argv, "ht:T:u:d:o:c:", ["host=",
-                                                        "hostfile=",
-                                                        "username=",
-                                                        "threads=",
-                                                        "outfile=",
-                                                        "csv=",
-                                                        "help"])
+        opts, _ = getopt.getopt(argv, "ht:T:u:d:o:c:i:n:", ["host=",
+                                                            "hostfile=",
+                                                            "username=",
+                                                            "threads=",
+                                                            "outfile=",
+                                                            "csv=",
+                                                            "interval=",
+                                                            "samples=",
+                                                            "top=",
+                                                            "help"])
     except getopt.GetoptError:
         print('error in processing arguments')
         sys.exit(2)
@@ -80,6 +297,17 @@ def main(argv):
             outfile = arg
         elif opt in ('-c', '--csv'):
             csvfile = arg
+        elif opt in ('-i', '--interval'):
+            interval = float(arg)
+        elif opt in ('-n', '--samples'):
+            samples = int(arg)
+        elif opt == '--top':
+            top = arg.split(':')
+            if top[0] not in counterstore.COUNTERS:
+                raise Exception('--top: no counter {0}, try one of {1}'
+                                ''.format(top[0],
+                                          ', '.join(counterstore.COUNTERS)))
+            top = (top[0], int(top[1]) if len(top) > 1 else 50)
 
     if hostfile is not None:
         with open(hostfile, 'r') as fHosts:
@@ -94,53 +322,57 @@ def main(argv):
 
     CREDENTIALS = get_credentials(username)
 
-    oBuffer = ''
     hosts = deduplicate_list(hosts)
-    switches = []
-    for host in hosts:
-        switch = Switch(ip=host, creds=CREDENTIALS)
-        switches.append(switch)
-        # we're getting ALL interfaces here, as opposed to non-trunks typically
-        DebugPrint('Switch._get_interfaces(): {0}'
-                   ''.format(str(switch)))
-        switch._get_interfaces()
-        oBuffer += switch.ip + '\n'
-        for interface in sorted(switch.ports):
-            oBuffer += ':' + interface.name + '\n'
-            for key in sorted(interface.stats):
-                oBuffer += '---' + key + ":  " + str(interface.stats[key])\
-                    + '\n'
-        oBuffer += '\n'
-
-    DebugPrint('interfacestats.switches: {0}'
-               ''.format(map(str, switches)))
-    if outfile:
-        fOut = open(outfile, 'w')
-        fOut.write(oBuffer)
-        fOut.close()
-    else:
-        print oBuffer
-
-    print csvfile
-    if csvfile:
-        stats = ['StatDuration', '5MinInputBPS', '5MinInputPPS',
-                 '5MinOutputBPS', '5MinOutputPPS', 'InputPackets',
-                 'InputBytes', 'OutputPackets', 'OutputBytes',
-                 'InputErrors', 'OutputErrors']
-
-        with open(csvfile, 'w') as fCSV:
+    # Switches are created as they're needed and dropped once written, so
+    # only MAX_THREADS of them are ever held at a time.
+    switches = (Switch(ip=host, creds=CREDENTIALS) for host in hosts)
+
+    fOut = open(outfile, 'w') if outfile else sys.stdout
+    fCSV = open(csvfile, 'w') if csvfile else None
+    try:
+        csvWriter = None
+        if fCSV:
             csvWriter = csv.writer(fCSV, delimiter=',', quotechar='|',
                                    quoting=csv.QUOTE_MINIMAL)
-            csvWriter.writerow(['Switch', 'Interface'] + stats)
-            # print switches
-            for switch in switches:
-                # print sorted(switch.ports)
-                for interface in sorted(switch.ports):
-                    values = []
-                    for stat in stats:
-                        values.append(interface.stats[stat])
-                    # print values
-                    csvWriter.writerow([switch.ip, interface.name] + values)
+        if interval:
+            if csvWriter:
+                csvWriter.writerow(['Time', 'Switch', 'Interface', 'Seconds']
+                                   + RATE_FIELDS + ['Event'])
+            try:
+                Poll(hosts, CREDENTIALS, interval, samples, fOut, csvWriter)
+            except KeyboardInterrupt:
+                pass
+        else:
+            if csvWriter:
+                csvWriter.writerow(['Switch', 'Interface'] + STATS)
+            # Only --top needs every port at the end; without it nothing is
+            # kept once a switch has been written.
+            store = counterstore.CounterStore() if top else None
+            # we're getting ALL interfaces here, as opposed to non-trunks
+            # typically
+            count = 0
+            for switch in collector.iter_populated(switches, MAX_THREADS,
+                                                   '_get_interfaces'):
+                DebugPrint('Switch._get_interfaces(): {0} {1}'
+                           ''.format(str(switch), switch.state))
+                count += 1
+                fOut.write(FormatSwitch(switch))
+                fOut.flush()
+                if store is not None:
+                    store.add_switch(switch)
+                if fCSV:
+                    csvWriter.writerows(CSVRows(switch))
+                    fCSV.flush()
+            DebugPrint('interfacestats.switches: {0}'.format(count))
+            if top:
+                fOut.write('Top {0} ports by {1}:\n'.format(top[1], top[0]))
+                for row in store.top(top[0], top[1]):
+                    fOut.write('{0} {1}: {2}\n'.format(*row))
+    finally:
+        if outfile:
+            fOut.close()
+        if fCSV:
+            fCSV.close()
 
     PrintMetrics()
 
@@ -0,0 +1,218 @@
+#! /usr/bin/python
+"""
+Created on Oct 18, 2026
+
+Fleet-wide MAC location index: MAC -> [(switch, port, vlan, edge, seen)].
+
+The collector side pulls MAC tables (plus switchport modes and CDP, to tell
+edge ports from uplinks) from many switches at once through collector and
+files every entry in a local SQLite database.  macsearch answers from it
+with --index and only walks the network when the index has nothing recent.
+
+macindex.py (-t <host> | -T <hostfile>) [-u <username>] [-d <threads>]
+    [-f <index file>] [-i <seconds between collections>]
+"""
+# Standard Library Imports
+import os
+import sys
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from optparse import OptionParser
+
+# Imports from other scripts in this project
+from sshutil import Switch, MACAddress, get_credentials
+from metrics import UpdateMetric, DebugPrint
+import metrics
+import collector
+
+DEFAULT_PATH = os.path.expanduser('~/.sshutil_macindex.sqlite')
+DEFAULT_MAX_AGE = 3600
+
+Location = namedtuple('Location', 'mac, switch, port, vlan, edge, seen')
+
+
+class MACIndex(object):
+    """
+        MAC locations in SQLite.  Safe to share between threads.
+        Partial MACs ('last 4') are looked up by their low 16 bits.
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._db.execute('CREATE TABLE IF NOT EXISTS location ('
+                             'mac INTEGER, tail INTEGER, switch TEXT, '
+                             'port TEXT, vlan TEXT, edge INTEGER, seen REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS location_mac '
+                             'ON location (mac)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS location_tail '
+                             'ON location (tail)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS location_switch '
+                             'ON location (switch)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS collected ('
+                             'switch TEXT PRIMARY KEY, seen REAL)')
+            self._db.commit()
+
+    def record(self, switch, seen=None):
+        """
+        Replace everything known about switch with its current MAC table.
+        switch needs its MAC table, and for edge detection its ports'
+        switchport modes and CDP neighbors, e.g. from populate() or
+        populate_mac_locations().
+        """
+        if seen is None:
+            seen = time.time()
+        rows = [(mac.value, mac.value & 0xffff, switch.ip, port, vlan,
+                 int(edge), seen)
+                for vlan, mac, port, edge in switch.mac_locations()]
+        with self._lock:
+            self._db.execute('DELETE FROM location WHERE switch = ?',
+                             (switch.ip, ))
+            self._db.executemany('INSERT INTO location VALUES '
+                                 '(?, ?, ?, ?, ?, ?, ?)', rows)
+            self._db.execute('INSERT OR REPLACE INTO collected VALUES (?, ?)',
+                             (switch.ip, seen))
+            self._db.commit()
+        UpdateMetric('macindex.record')
+        return len(rows)
+
+    def lookup(self, mac, maxAge=None):
+        """
+        Every place mac has been seen, edge ports first, newest first.
+        maxAge (seconds) drops entries older than that.
+        """
+        mac = MACAddress(mac)
+        if mac.bits == 48:
+            query, value = 'mac = ?', mac.value
+        else:
+            query, value = 'tail = ?', mac.value
+        oldest = 0 if maxAge is None else time.time() - maxAge
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT mac, switch, port, vlan, edge, seen FROM location '
+                'WHERE ' + query + ' AND seen >= ? '
+                'ORDER BY edge DESC, seen DESC', (value, oldest)).fetchall()
+        UpdateMetric('macindex.lookup')
+        return [Location(MACAddress(row[0]), str(row[1]), str(row[2]),
+                         str(row[3]), bool(row[4]), row[5]) for row in rows]
+
+    def locate(self, mac, maxAge=DEFAULT_MAX_AGE):
+        """The edge port mac was most recently seen on, or None"""
+        for location in self.lookup(mac, maxAge):
+            if location.edge:
+                UpdateMetric('macindex.hit')
+                return location
+        UpdateMetric('macindex.miss')
+        return None
+
+    def collected(self):
+        """{switch ip: time its MAC table was last recorded}"""
+        with self._lock:
+            rows = self._db.execute('SELECT switch, seen FROM collected')
+            return dict((str(switch), seen) for switch, seen in rows)
+
+    def stale(self, hosts, maxAge=DEFAULT_MAX_AGE):
+        """Those of hosts not recorded in the last maxAge seconds"""
+        collected = self.collected()
+        oldest = time.time() - maxAge
+        return [host for host in hosts if collected.get(host, 0) < oldest]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def collect(index, hosts, creds, maxInFlight=collector.DEFAULT_MAX_IN_FLIGHT):
+    """
+    Pull MAC tables from hosts, maxInFlight at a time, into index.
+    Return the number of switches recorded.
+    """
+    switches = (Switch(ip=host, creds=creds) for host in hosts)
+    count = 0
+    for switch in collector.iter_populated(switches, maxInFlight,
+                                           'populate_mac_locations'):
+        if switch.state != 'UP':
+            DebugPrint('macindex: skipping {0} ({1})'
+                       ''.format(switch.ip, switch.state), 2)
+            continue
+        entries = index.record(switch)
+        DebugPrint('macindex: {0} entries from {1}'
+                   ''.format(entries, switch.ip), 1)
+        count += 1
+    return count
+
+
+def add_options(parser):
+    """Add --index, --index-file and --index-age to an OptionParser"""
+    parser.add_option('--index', action='store_true', default=False,
+                      help='Answer from the MAC location index (see '
+                      'macindex.py) when it has a recent edge port entry.')
+    parser.add_option('--index-file', dest='index_file', default=DEFAULT_PATH,
+                      help='MAC index location (default: {0})'
+                      ''.format(DEFAULT_PATH))
+    parser.add_option('--index-age', dest='index_age', type='int',
+                      default=DEFAULT_MAX_AGE,
+                      help='With --index, ignore entries older than this many '
+                      'seconds (default: {0})'.format(DEFAULT_MAX_AGE))
+
+
+def createParser():
+    usage = ('macindex.py -h | (-t <host> | -T <hostfile>) [-u <username>] '
+             '[-d <threads>] [-f <index file>] [-i <interval>]')
+
+    description = ('Collect MAC address tables from switches into the MAC '
+                   'location index used by "macsearch.py --index".')
+
+    parser = OptionParser(usage=usage, description=description)
+    parser.add_option('-t', '--host', help='Hostname or IP address of switch')
+    parser.add_option('-T', '--hostfile', help='File containing list of switch'
+                      ' hostnames or IP addresses, one per line.')
+    parser.add_option('-u', '--username', help='Username to use to connect.'
+                      ' *Will assume currently logged in user if not provided.'
+                      )
+    parser.add_option('-d', '--threads', type='int', help='Number of switches '
+                      'to collect from at once.',
+                      default=collector.DEFAULT_MAX_IN_FLIGHT)
+    parser.add_option('-f', '--file', default=DEFAULT_PATH,
+                      help='Index location (default: {0})'.format(DEFAULT_PATH))
+    parser.add_option('-i', '--interval', type='int', help='Keep running, '
+                      'collecting again every this many seconds.')
+    parser.add_option('-v', '--verbose', action='count', help='Increase output'
+                      ' verbosity (e.g., -vv is more than -v) up to 3',
+                      default=0)
+    return parser
+
+
+def main(argv):
+    parser = createParser()
+    (options, args) = parser.parse_args(argv)
+    metrics.VERBOSITY = options.verbose
+
+    if options.hostfile:
+        if options.host:
+            raise Exception('Cannot specify both HOST and HOSTFILE')
+        with open(options.hostfile, 'r') as fHosts:
+            hosts = [line.strip() for line in fHosts if line.strip()]
+    elif options.host:
+        hosts = [options.host]
+    else:
+        parser.error('need a host or hostfile')
+
+    creds = get_credentials(options.username)
+    index = MACIndex(options.file)
+    while True:
+        start = time.time()
+        count = collect(index, hosts, creds, options.threads)
+        print 'Indexed {0} of {1} switches in {2:.1f} seconds.'.format(
+            count, len(hosts), time.time() - start)
+        if not options.interval:
+            break
+        time.sleep(max(0, options.interval - (time.time() - start)))
+    metrics.PrintMetrics()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -7,19 +7,27 @@ Created on Nov 12, 2014
 
 # Standard Library Imports
 import sys
+import csv
+import time
+import threading
+from collections import namedtuple
 from optparse import OptionParser
 
 
 # Imports from other scripts in this project
 from sshexecute import sshrun
 import metrics
+import cmdcache
+import macindex
+import collector
 from sshutil import listify, format_mac_address, get_credentials  # , resolve_mac
 import sshutil
 
 
 def createParser():
     usage = ('macsearch.py -h | (-t <host> | -T <hostfile) (-m MAC | -i IP) '
-             '[-u <username>] [-o <optimal>] [-g <default gateway>]')
+             '[-u <username>] [-o <optimal>] [-g <default gateway>] '
+             '[--index] [-p <parallel>] [-M <macfile> [--csv <outfile>]]')
 
     description = ('Use mac table and CDP information to identify what port'
                    ' on what switch a device is connected to.')
@@ -55,6 +63,16 @@ def createParser():
     parser.add_option('-g', '--defaultgateway', help='Used for ARP resolution '
                       'between IP and MAC.  Only used if -i present.  If not '
                       'specified, will default to first switch in list.')
+    parser.add_option('-M', '--macfile', help='File of MAC addresses to '
+                      'find, one per line.  Every switch is read once and '
+                      'the results written as CSV.')
+    parser.add_option('--csv', help='With -M, write the CSV here instead of '
+                      'to the screen.')
+    parser.add_option('-p', '--parallel', type='int',
+                      help='Search this many switches at once, following CDP'
+                      ' next hops as soon as they turn up.  Implies optimal.')
+    cmdcache.add_options(parser)
+    macindex.add_options(parser)
     return parser
 
 
@@ -63,7 +81,8 @@ def CollectMACAddressTableEntry(mac, sw, creds):
     # print 'On {0}:'.format(sw)
     result = ''
     try:
-        result = sshrun(command=cmdShMac, host=sw, creds=creds)
+        result = cmdcache.cached(sw, cmdShMac, lambda: sshrun(
+            command=cmdShMac, host=sw, creds=creds))
     except Exception as E:
         print 'Can\'t run commands on this device!'
         print cmdShMac
@@ -80,19 +99,167 @@ def CollectMACAddressTableEntry(mac, sw, creds):
                            ''.format(str(sw)))
 
         cmdShMac = 'show mac-address-table | inc {0}'.format(mac)
-        result = sshrun(command=cmdShMac, host=sw, creds=creds)
+        result = cmdcache.cached(sw, cmdShMac, lambda: sshrun(
+            command=cmdShMac, host=sw, creds=creds))
 
     return result
 
 
+def LookupIndex(mac, indexFile, maxAge):
+    """
+    Where the MAC location index last saw mac on an edge port, if that was
+    within maxAge seconds.  Otherwise None, and the caller searches live.
+    """
+    index = macindex.MACIndex(indexFile)
+    try:
+        location = index.locate(mac, maxAge)
+    finally:
+        index.close()
+    if location is None:
+        print 'Not in the MAC index (or too old), searching live.'
+    else:
+        print ('From MAC index ({0:.0f} seconds old): {1} on {2} {3}, vlan {4}'
+               ''.format(time.time() - location.seen, location.mac,
+                         location.switch, location.port, location.vlan))
+    return location
+
+
 def CollectCDPNeighbors(sw, switchport, creds):
     cmdShCDP = ('Show CDP Neighbor {0} detail | in (IP address|Platform)'
                 ''.format(switchport))
     # print 'On {0}:    Running: {1}'.format(sw,cmdShCDP)
-    rsltShCDP = sshrun(command=cmdShCDP, host=sw, creds=creds).strip()
+    rsltShCDP = cmdcache.cached(sw, cmdShCDP, lambda: sshrun(
+        command=cmdShCDP, host=sw, creds=creds)).strip()
     return rsltShCDP
 
 
+Hop = namedtuple('Hop', 'switch, port, neighbors, seconds')
+
+
+def SearchHop(mac, sw, creds, cancel):
+    """
+    Look for mac on sw and, if it's there, what CDP says is on that port.
+    Return a Hop; port is '' if mac isn't on sw or the search was cancelled
+    first.
+    """
+    start = time.time()
+    switchport = ''
+    neighbors = ''
+    try:
+        if not cancel.is_set():
+            entry = CollectMACAddressTableEntry(mac, sw, creds)
+            switchport = entry.strip(' \r\n\t').split(' ')[-1]
+        if switchport and not cancel.is_set():
+            neighbors = CollectCDPNeighbors(sw, switchport, creds)
+    except Exception as E:
+        metrics.DebugPrint('[{0}] search failed: {1}'.format(sw, E), 2)
+    seconds = time.time() - start
+    metrics.UpdateTiming('macsearch.hop', seconds)
+    return Hop(sw, switchport, neighbors, seconds)
+
+
+def ParallelSearch(mac, hosts, creds, maxInFlight):
+    """
+    Search hosts for mac, maxInFlight switches at a time.  A CDP next hop
+    jumps the queue as soon as it's seen, and once mac is on a port with no
+    switch behind it, nothing new is started and what's still running is
+    abandoned.  Return the list of Hops that led there, or [] if not found.
+    """
+    cancel = threading.Event()
+    runner = collector.Runner(lambda sw: SearchHop(mac, sw, creds, cancel),
+                              maxInFlight=maxInFlight, unique=True)
+    for host in hosts:
+        if host.strip():
+            runner.push(host.strip())
+    cameFrom = {}  # switch -> the Hop whose CDP neighbor it was
+    for _, hop, _ in runner:
+        if not hop.port:
+            continue
+        print "{0}: Port: {1}  ---> {2}".format(hop.switch, hop.port,
+                                               hop.neighbors)
+        if 'switch' not in hop.neighbors.lower():
+            cancel.set()
+            path = [hop]
+            while path[0].switch in cameFrom:
+                path.insert(0, cameFrom[path[0].switch])
+            return path
+        nextswitch = hop.neighbors.splitlines()[0].split()[2].strip()
+        if nextswitch not in runner.started:
+            cameFrom[nextswitch] = hop
+            runner.push(nextswitch, first=True)
+    return []
+
+
+def BatchSearch(macs, hosts, creds, maxInFlight):
+    """
+    Find every one of macs (MACAddresses, 'last 4' fragments allowed) in a
+    single pass over hosts, maxInFlight switches at a time.  Each switch's
+    MAC table, switchport modes and CDP are pulled once.
+    Return {mac: [(switch, port, vlan, edge), ...]}, edge ports first.
+    """
+    byValue = {}
+    byTail = {}
+    for mac in macs:
+        (byValue if mac.bits == 48 else byTail).setdefault(mac.value, mac)
+    locations = dict((mac, []) for mac in macs)
+
+    switches = (sshutil.Switch(ip=host.strip(), creds=creds)
+                for host in hosts if host.strip())
+    for switch in collector.iter_populated(switches, maxInFlight,
+                                           'populate_mac_locations'):
+        if switch.state != 'UP':
+            metrics.DebugPrint('Can\'t run commands on {0}!'
+                               ''.format(switch.ip), 2)
+            continue
+        for vlan, mac, port, edge in switch.mac_locations():
+            for wanted in (byValue.get(mac.value),
+                           byTail.get(mac.value & 0xffff)):
+                if wanted is not None:
+                    locations[wanted].append((switch.ip, port, vlan, edge))
+
+    for found in locations.values():
+        found.sort(key=lambda location: not location[3])
+    return locations
+
+
+def BatchMain(options, hosts, creds):
+    """-M: search for every MAC in options.macfile, write CSV"""
+    macs = []
+    invalid = []
+    with open(options.macfile, 'r') as fMacs:
+        for line in fMacs:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                macs.append(sshutil.MACAddress(line))
+            except ValueError:
+                invalid.append(line)
+
+    locations = BatchSearch(macs, hosts, creds, options.parallel or
+                            collector.DEFAULT_MAX_IN_FLIGHT)
+
+    fOut = open(options.csv, 'wb') if options.csv else sys.stdout
+    writer = csv.writer(fOut)
+    writer.writerow(['mac', 'switch', 'port', 'vlan', 'status'])
+    notFound = 0
+    for mac in macs:
+        found = locations[mac]
+        if not found:
+            writer.writerow([mac, '', '', '', 'not found'])
+            notFound += 1
+        elif found[0][3]:
+            writer.writerow([mac] + list(found[0][:3]) + ['edge'])
+        else:  # only ever seen behind a switch or router
+            writer.writerow([mac] + list(found[0][:3]) + ['uplink only'])
+    for line in invalid:
+        writer.writerow([line, '', '', '', 'invalid'])
+    if options.csv:
+        fOut.close()
+    metrics.DebugPrint('{0} MACs, {1} not found, {2} invalid'
+                       ''.format(len(macs), notFound, len(invalid)), 2)
+
+
 def main(argv):
     """
     Use mac table and CDP information to identify what port on the switch and
@@ -115,6 +282,13 @@ def main(argv):
     --defaultgateway or -g -- used for ARP resolution between IP and MAC.  Only
         used if -i present.  If not specified, will default to first switch
         in list.
+    --parallel or -p -- search this many switches at once, following CDP
+        next hops first, and stop as soon as an edge port is found.
+    --macfile or -M -- find every MAC listed in this file in one pass over
+        the switches, and write CSV (to --csv if given) of where each is.
+        -p sets how many switches are read at once.
+    --index -- answer from the MAC location index (see macindex.py) if it
+        has seen the mac on an edge port recently, otherwise search as below.
     --help or -h -- print this usage information.
 
     Default behavior is to search the list in order until the target mac shows
@@ -143,6 +317,7 @@ def main(argv):
     host = options.host
     hostfile = options.hostfile
     defaultGateway = options.defaultgateway
+    cmdcache.configure(options)
     if options.optimal == 'no':
         optimal = False
     else:
@@ -165,6 +340,10 @@ def main(argv):
         if creds[1] == '' or creds[1] is None:
             print ("blank password isn't what you want!")
 
+    if options.macfile:
+        BatchMain(options, hosts, creds)
+        return None
+
     if not mac:
         if ip:
             if not defaultGateway:
@@ -176,6 +355,23 @@ def main(argv):
             mac = raw_input('What MAC Address?')
     mac = format_mac_address(mac)
 
+    if options.index:
+        location = LookupIndex(mac, options.index_file, options.index_age)
+        if location is not None:
+            return True, False, location.switch, location.port
+
+    if options.parallel is not None and options.parallel > 1:
+        path = ParallelSearch(mac, hosts, creds, options.parallel)
+        if not path:
+            return False, True, rslt, switchport
+        print 'Hop path:'
+        for hop in path:
+            print '    {0} {1} ({2:.2f}s)'.format(hop.switch, hop.port,
+                                                 hop.seconds)
+        print ('{0}\r\nTHIS PORT CONNECTS TO SOMETHING THAT ISN\'T A '
+               'SWITCH!\r\nThis is probably it!\r\n{0}'.format('*'*15))
+        return True, False, path[-1].switch, path[-1].port
+
     i = 0
     while not abort and (not (found and optimal)):
 
@@ -252,7 +448,10 @@ def ResolveMAC(device, ip, creds):
 
 if __name__ == '__main__':
 
-    found, abort, sw, switchport = main(sys.argv[1:])
+    rslt = main(sys.argv[1:])
+    if rslt is None:  # -M writes its own report
+        sys.exit()
+    found, abort, sw, switchport = rslt
     print found, abort, sw, switchport
     print """
 To clarify the above possibly confusing output:
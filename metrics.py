@@ -7,6 +7,7 @@ import time
 
 DEBUG = False
 METRICS = {}
+TIMINGS = {}
 VERBOSITY = 0
 StartTime = 0
 
@@ -20,10 +21,27 @@ def UpdateMetric(metric='default'):
         print metric, METRICS[metric]
 
 
+def UpdateTiming(metric, seconds):
+    ''' Given a metric name as a string, record a duration (in seconds)'''
+    if metric not in TIMINGS:
+        TIMINGS[metric] = [0, 0.0, 0.0]  # count, total, max
+    timing = TIMINGS[metric]
+    timing[0] += 1
+    timing[1] += seconds
+    timing[2] = max(timing[2], seconds)
+    if DEBUG:
+        print metric, seconds
+
+
 def PrintMetrics():
-    ''' Print metrics previously stored with 'UpdateMetric' '''
+    ''' Print metrics previously stored with 'UpdateMetric' and
+    'UpdateTiming' '''
     for k in sorted(METRICS):
         print k, METRICS[k]
+    for k in sorted(TIMINGS):
+        count, total, peak = TIMINGS[k]
+        print '{0}: count={1} total={2:.3f}s avg={3:.3f}s max={4:.3f}s' \
+              ''.format(k, count, total, total / count, peak)
 
 
 def DebugPrint(msg, level=1):
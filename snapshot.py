@@ -0,0 +1,417 @@
+"""
+Created on Oct 18, 2026
+
+Save and reload a populated fleet of Switch objects.
+
+A snapshot is a single binary file:
+
+    header      magic, time created, number of strings, number of switches
+    strings     (nStrings + 1) uint32 offsets, then the strings back to back
+    index       per switch: string id of its ip, offset and length of record
+    records     one zlib-compressed record per switch
+
+Everything short and repetitive (interface names, models, descriptions,
+VLAN modes, CDP platforms, ...) is written once to the string table and
+referred to by id.  Bulky text that is only ever parsed ('sh ver', the MAC
+table, the startup config) stays in the switch's own record.
+
+load() only reads the header, index and string table offsets.  A switch is
+decoded the first time it's asked for, and strings are decoded (and
+interned) the first time a switch needs them, so pulling a handful of
+switches out of a fleet-sized snapshot is cheap.
+
+Credentials are never written; pass them to load() or reuse().
+"""
+# Standard Library Imports
+import struct
+import time
+import zlib
+
+# Imports from other scripts in this project
+from sshutil import (Switch, SwitchPort, EndDevice, CDPNeighbor,
+                     InterfaceCounters, MACAddress, FlashSpace,
+                     capability_flags)
+from metrics import UpdateMetric, DebugPrint
+
+MAGIC = 'SWSNAP\x00\x02'
+NONE = 0xffffffff  # string id of None
+
+_HEADER = struct.Struct('<8sdII')
+_INDEX = struct.Struct('<III')
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+_MAC = struct.Struct('<QB')
+
+# InterfaceCounters.values after StatDuration are all integers
+_COUNTERS = len(InterfaceCounters.KEYS) - 1
+_INTS = struct.Struct('<{0}q'.format(_COUNTERS))
+
+
+class _Writer(object):
+    """Builds the string table and the records that refer to it"""
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def sid(self, value):
+        if value is None:
+            return NONE
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        else:
+            value = str(value)
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return sid
+
+    def string_table(self):
+        offsets = [0]
+        for s in self.strings:
+            offsets.append(offsets[-1] + len(s))
+        return (struct.pack('<{0}I'.format(len(offsets)), *offsets) +
+                ''.join(self.strings))
+
+    def record(self, switch):
+        out = []
+        u32 = lambda n: out.append(_U32.pack(n))
+        sid = lambda s: u32(self.sid(s))
+
+        def text(value):
+            if value is None:
+                u32(NONE)
+            else:
+                u32(len(value))
+                out.append(value)
+
+        def i64(value):
+            out.append(_I64.pack(-1 if value is None else value))
+
+        def neighbors(entries):
+            u32(len(entries))
+            for neighbor in entries:
+                sid(neighbor.deviceID)
+                sid(neighbor.platform)
+                sid(neighbor.interface)
+                sid(neighbor.port)
+                u32(len(neighbor.addresses))
+                for address in neighbor.addresses:
+                    sid(address)
+                u32(len(neighbor.capabilities))
+                for capability in neighbor.capabilities:
+                    sid(capability)
+
+        sid(switch.state)
+        text(getattr(switch, '_version', None))
+        text(switch._mac_address_table)
+        text(getattr(switch, '_startup_config', None))
+        sid(getattr(switch, '_license', None))
+        sid(getattr(switch, '_supervisor', None))
+        flash = getattr(switch, '_flash', None) or (None, None)
+        i64(flash[0])
+        i64(flash[1])
+        populateTime = switch.populate_lite_time
+        out.append(_F64.pack(float('nan') if populateTime is None
+                             else populateTime))
+
+        u32(len(switch.ports))
+        for port in switch.ports:
+            sid(port.name)
+            sid(port.status)
+            sid(port.description)
+            sid(port._switchportMode)
+            sid(port.switchport)
+            i64(None if port.ifIndex is None else int(port.ifIndex))
+            values = port.stats.values
+            sid(values[0])
+            out.append(_INTS.pack(*[-1 if v is None else v
+                                    for v in values[1:]]))
+
+            neighbors(port.CDPneigh)
+
+            u32(len(port.devices))
+            for device in port.devices:
+                mac = device.mac
+                out.append(_MAC.pack(0, 0) if mac is None
+                           else _MAC.pack(mac.value, mac.bits))
+                sid(device.ip)
+                sid(device.dns)
+                sid(device.vlan)
+
+        # CDP neighbors on interfaces that never made it into switch.ports
+        attached = set(id(n) for port in switch.ports for n in port.CDPneigh)
+        neighbors([n for n in switch.cdp_information.values()
+                   if id(n) not in attached])
+        return zlib.compress(''.join(out))
+
+
+def save(switches, path):
+    """
+    Write switches (populated or not) to a snapshot at path.  Returns the
+    number of switches written.
+    """
+    writer = _Writer()
+    index = []
+    records = []
+    offset = 0
+    for switch in switches:
+        record = writer.record(switch)
+        index.append((writer.sid(switch.ip), offset, len(record)))
+        records.append(record)
+        offset += len(record)
+
+    with open(path, 'wb') as fOut:
+        fOut.write(_HEADER.pack(MAGIC, time.time(), len(writer.strings),
+                                len(index)))
+        fOut.write(writer.string_table())
+        for entry in index:
+            fOut.write(_INDEX.pack(*entry))
+        for record in records:
+            fOut.write(record)
+    UpdateMetric('snapshot.save')
+    DebugPrint('snapshot: wrote {0} switches, {1} strings to {2}'
+               ''.format(len(index), len(writer.strings), path), 1)
+    return len(index)
+
+
+class _Reader(object):
+    """Walks one decompressed record"""
+    __slots__ = ('data', 'pos', 'string')
+
+    def __init__(self, data, string):
+        self.data = data
+        self.pos = 0
+        self.string = string
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.pos)
+        self.pos += fmt.size
+        return values
+
+    def u32(self):
+        return self.unpack(_U32)[0]
+
+    def i64(self):
+        value = self.unpack(_I64)[0]
+        return None if value == -1 else value
+
+    def sid(self):
+        return self.string(self.u32())
+
+    def neighbors(self):
+        rslt = []
+        for _ in xrange(self.u32()):
+            neighbor = CDPNeighbor(deviceID=self.sid(), platform=self.sid(),
+                                   interface=self.sid(), port=self.sid())
+            neighbor.addresses = [self.sid() for _ in xrange(self.u32())]
+            neighbor.capabilities = [self.sid() for _ in xrange(self.u32())]
+            neighbor.flags = capability_flags(neighbor.capabilities)
+            rslt.append(neighbor)
+        return rslt
+
+    def text(self):
+        length = self.u32()
+        if length == NONE:
+            return None
+        self.pos += length
+        return self.data[self.pos - length:self.pos]
+
+
+class Snapshot(object):
+    """
+        A loaded snapshot.  Switches are decoded on first access:
+
+            snap = snapshot.load('fleet.snap', creds)
+            sw = snap.get('10.1.1.1')   # or snap['10.1.1.1']
+            for sw in snap: ...
+    """
+    def __init__(self, path, creds=None, switchClass=Switch):
+        self.path = path
+        self.creds = creds
+        self.switchClass = switchClass
+        with open(path, 'rb') as fIn:
+            self._data = fIn.read()
+        magic, self.created, nStrings, nSwitches = _HEADER.unpack_from(
+            self._data, 0)
+        if magic != MAGIC:
+            raise Exception('{0} is not a switch snapshot'.format(path))
+        pos = _HEADER.size
+        self._offsets = struct.unpack_from('<{0}I'.format(nStrings + 1),
+                                           self._data, pos)
+        pos += _U32.size * (nStrings + 1)
+        self._blob = pos
+        pos += self._offsets[-1]
+        self._strings = [None] * nStrings
+        self._index = []
+        self._byIP = {}
+        for n in xrange(nSwitches):
+            ipID, offset, length = _INDEX.unpack_from(
+                self._data, pos + n * _INDEX.size)
+            ip = self._string(ipID)
+            self._index.append((ip, offset, length))
+            self._byIP[ip] = n
+        self._records = pos + nSwitches * _INDEX.size
+        self._switches = [None] * nSwitches
+
+    def _string(self, sid):
+        if sid == NONE:
+            return None
+        value = self._strings[sid]
+        if value is None:
+            start = self._blob + self._offsets[sid]
+            end = self._blob + self._offsets[sid + 1]
+            value = self._strings[sid] = intern(self._data[start:end])
+        return value
+
+    def _decode(self, n):
+        ip, offset, length = self._index[n]
+        start = self._records + offset
+        r = _Reader(zlib.decompress(self._data[start:start + length]),
+                    self._string)
+        UpdateMetric('snapshot.decoded')
+
+        # NetworkDevice insists on creds; a snapshot opened without any
+        # still decodes, it just can't refresh anything.
+        switch = self.switchClass(ip=ip, creds=self.creds or ())
+        switch.credentials = self.creds
+        switch.state = r.sid()
+        version = r.text()
+        if version is not None:
+            switch._version = version
+        switch._mac_address_table = r.text() or ''
+        startupConfig = r.text()
+        if startupConfig is not None:
+            switch._startup_config = startupConfig
+        license = r.sid()
+        if license is not None:
+            switch._license = license
+        switch._supervisor = r.sid()
+        free, total = r.i64(), r.i64()
+        if free is not None:
+            switch._flash = FlashSpace(free, total)
+        populateTime = r.unpack(_F64)[0]
+        if populateTime == populateTime:  # not NaN
+            switch.populate_lite_time = populateTime
+
+        ports = []
+        cdp = {}
+        devices = []
+        for _ in xrange(r.u32()):
+            port = SwitchPort(switch=switch)
+            port._name = r.sid()
+            port.status = r.sid()
+            port.description = r.sid()
+            port._switchportMode = r.sid()
+            port.switchport = r.sid()
+            port.ifIndex = r.i64()
+            values = [r.sid()]
+            values.extend(None if v == -1 else v for v in r.unpack(_INTS))
+            port.stats.values = values
+
+            port.CDPneigh = r.neighbors()
+            for neighbor in port.CDPneigh:
+                if neighbor.interface is not None:
+                    cdp[neighbor.interface.lower()] = neighbor
+
+            for _ in xrange(r.u32()):
+                value, bits = r.unpack(_MAC)
+                device = EndDevice(ip=r.sid(), dns=r.sid(), vlan=r.sid())
+                if bits:
+                    mac = MACAddress.__new__(MACAddress)
+                    mac.value, mac.bits = value, bits
+                    device._mac = mac
+                # Same wiring _get_end_devices() does
+                device._switch = switch
+                device._switchport = port
+                port.devices.append(device)
+                devices.append(device)
+            ports.append(port)
+        for neighbor in r.neighbors():
+            cdp[neighbor.interface.lower()] = neighbor
+
+        switch.ports = ports
+        switch.devices = devices
+        switch.cdp_information = cdp
+        return switch
+
+    def get(self, ip, default=None):
+        n = self._byIP.get(ip)
+        if n is None:
+            return default
+        switch = self._switches[n]
+        if switch is None:
+            switch = self._switches[n] = self._decode(n)
+        return switch
+
+    def __getitem__(self, ip):
+        switch = self.get(ip)
+        if switch is None:
+            raise KeyError(ip)
+        return switch
+
+    def __contains__(self, ip):
+        return ip in self._byIP
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        for ip, _, _ in self._index:
+            yield self.get(ip)
+
+    def ips(self):
+        return [ip for ip, _, _ in self._index]
+
+    @property
+    def age(self):
+        """Seconds since the snapshot was saved"""
+        return time.time() - self.created
+
+    def __repr__(self):
+        return ('Snapshot({0!r}, {1} switches, {2:.0f}s old)'
+                ''.format(self.path, len(self), self.age))
+
+
+def load(path, creds=None, switchClass=Switch):
+    """Open the snapshot at path.  Switches are decoded as they're used."""
+    return Snapshot(path, creds, switchClass)
+
+
+def reuse(snap, hosts, creds, switchClass=Switch):
+    """
+    Return (switches, stale): one switch per host, in order, taken from snap
+    where it has a good one, otherwise a fresh unpopulated switchClass.
+    stale lists the fresh ones, i.e. what still needs populate().
+    """
+    switches = []
+    stale = []
+    for host in hosts:
+        switch = snap.get(host) if snap is not None else None
+        if switch is None or switch.state not in switch.goodstates:
+            switch = switchClass(ip=host, creds=creds)
+            stale.append(switch)
+        else:
+            switch.credentials = creds
+        switches.append(switch)
+    DebugPrint('snapshot: reusing {0} of {1} switches'
+               ''.format(len(switches) - len(stale), len(switches)), 1)
+    return switches, stale
+
+
+def add_options(parser):
+    """Add --snapshot and --save-snapshot to an OptionParser"""
+    parser.add_option('--snapshot', help='Load switches from this snapshot '
+                      'instead of populating them; only switches missing '
+                      'from it (or down in it) are contacted.')
+    parser.add_option('--save-snapshot', dest='save_snapshot',
+                      help='Save the populated switches to this file for '
+                      'later use with --snapshot.')
+
+
+def configure(options, creds=None):
+    """Return the Snapshot named by options (from add_options), or None"""
+    if options.snapshot:
+        return load(options.snapshot, creds)
+    return None
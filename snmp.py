@@ -11,6 +11,7 @@ from itertools import starmap, repeat
 
 # Third Party
 from pysnmp.entity.rfc3413.oneliner import cmdgen
+from pyasn1.type import univ
 import prettytable
 
 # Local
@@ -122,16 +123,32 @@ class SNMPInterfaceStats(object):
         Use self._interpreted_results if that's not desirable.
         :return: [['interface name', bytes_in, bytes_out]]
         """
-        vc = self.vc
         if self.update_permitted:
-            interfaces = []
-            for raw_interface in self.raw_snmp_results:
-                interface = [vc.convert(x[1]) for x in raw_interface]
-                interfaces.append(interface)
-            self._interpreted_results = interfaces
+            self._interpreted_results = self._interpret(self.raw_snmp_results)
 
         return self._interpreted_results
 
+    def _interpret(self, raw_snmp_result):
+        vc = self.vc
+        interfaces = []
+        for raw_interface in raw_snmp_result:
+            interface = [vc.convert(x[1]) for x in raw_interface]
+            interfaces.append(interface)
+        return interfaces
+
+    def store_results(self, errorData, raw_snmp_result, collection_time):
+        """
+        Take results pulled by someone else (see SNMPPoller) as if this
+        object had pulled them itself at collection_time.
+        :param errorData: (errorIndication, errorStatus, errorIndex)
+        :param raw_snmp_result: varBindTable, as from cmdGen.bulkCmd()
+        :param collection_time: time.time() the results arrived
+        """
+        self.errorData = errorData
+        self._raw_snmp_result = raw_snmp_result
+        self._interpreted_results = self._interpret(raw_snmp_result)
+        self.collection_time = collection_time
+
     @property
     def result_dict(self):
         """
@@ -175,6 +192,80 @@ class SNMPInterfaceStats(object):
         """ Pass index operations through to result_dict"""
         return self.result_dict[item]
 
+
+class SNMPPoller(object):
+    """
+    Polls many SNMPInterfaceStats at once.  Every host's GETBULK walk is
+    sent before any response is read, and all of them are serviced by one
+    asyncore dispatcher, so a poll cycle takes about as long as the slowest
+    host rather than the sum of all of them.
+    """
+    def __init__(self, targets, max_repetitions=100):
+        """
+        :param targets: SNMPInterfaceStats objects to poll
+        :param max_repetitions: GETBULK max-repetitions, rows per response
+        """
+        self.targets = list(targets)
+        self.max_repetitions = max_repetitions
+        self.cmd_gen = cmdgen.AsynCommandGenerator()
+
+    def _walk_response(self, sendRequestHandle, errorIndication, errorStatus,
+                       errorIndex, varBindTable, walk):
+        """
+        Callback for each GETBULK response of one host's walk.  Keeps rows
+        while every column is still inside the MIB objects asked for (like
+        cmdGen.bulkCmd() does), stamps the walk with the arrival time.
+        :return: True to ask for more rows, False when the walk is done
+        """
+        walk['time'] = time.time()
+        if errorIndication or errorStatus:
+            walk['errorData'] = (errorIndication, errorStatus, errorIndex)
+            return False
+
+        oids = walk['oids']
+        for row in varBindTable:
+            if len(row) != len(oids):
+                return False
+            for oid, (name, value) in zip(oids, row):
+                # univ.Null covers endOfMibView and friends
+                if isinstance(value, univ.Null) or not oid.isPrefixOf(name):
+                    return False
+            walk['rows'].append(row)
+        return bool(varBindTable)
+
+    def poll(self, force=False):
+        """
+        Walk every target concurrently and hand each its results (see
+        SNMPInterfaceStats.store_results()), timestamped with the arrival
+        of its last response.
+        :param force: poll targets whose minimum_age hasn't passed too
+        :return: dict of host_string: SNMPInterfaceStats, for every target
+            polled this time.  Check errorData for ones that failed.
+        """
+        walks = []
+        for target in self.targets:
+            if not (force or target.update_permitted):
+                continue
+            oids = [mib.resolveWithMib(self.cmd_gen.mibViewController)
+                    for mib in target.mibs]
+            walk = dict(target=target, oids=[x.getOid() for x in oids],
+                        rows=[], errorData=(0, 0, 0), time=None)
+            self.cmd_gen.asyncBulkCmd(
+                target.community, target.host, 0, self.max_repetitions,
+                target.mibs, (self._walk_response, walk))
+            walks.append(walk)
+
+        self.cmd_gen.snmpEngine.transportDispatcher.runDispatcher()
+
+        results = {}
+        for walk in walks:
+            target = walk['target']
+            target.store_results(walk['errorData'], walk['rows'],
+                                 walk['time'] or time.time())
+            results[target.host_string] = target
+        return results
+
+
 class ValueConverter(collections.defaultdict):
     """
     Class to convert/reduce variety of specialized pysnmp types into basic
@@ -280,6 +371,12 @@ def poll_and_compare(*targets, duration=30, swap_wan_lan=True, minute_sync=True)
     stats_dict = {}  # dict of stats
     runs = stats_dict['runs'] = []  # list of runs
     first_run = True
+    # every host is sampled at (nearly) the same moment, once per run
+    hosts = []
+    for interface_stats, _ in targets:
+        if interface_stats not in hosts:
+            hosts.append(interface_stats)
+    poller = SNMPPoller(hosts)
 
     while True:
         if int(time.time()) % 60:
@@ -295,6 +392,7 @@ def poll_and_compare(*targets, duration=30, swap_wan_lan=True, minute_sync=True)
 
         run = []  # list of hosts
         runs.append(run)
+        poller.poll()
         for interface_stats, interface_name in targets:
             swap = not swap
             label = interface_stats.host_string
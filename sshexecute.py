@@ -5,6 +5,13 @@ Created on Dec 1, 2014
 '''
 # Standard Library Imports
 import time
+import re
+import select
+import threading
+import atexit
+import uuid
+from collections import deque
+from contextlib import contextmanager
 
 # External Library Imports
 import paramiko
@@ -12,15 +19,89 @@ import paramiko
 # Imports from other scripts in this project
 from metrics import UpdateMetric
 from metrics import DebugPrint
+from metrics import UpdateTiming
 
-# These are terrible.
-# Global lists that hold persistent connection information.
-# TODO: UnTerriblize
-SSH_SESSIONS = []
-SSH_CHANNELS = []
-SSH_HOSTS = []
 DEBUG = False
 
+# Any cisco-style prompt ("switch>", "switch#", "switch(config-if)#") sitting
+# alone on the last line of the stream.  Used until we've learned the real one.
+DEFAULT_PROMPT = re.compile(r'^[\w.\-@/:]+(\([\w.\-]+\))?[>#]\s*$')
+
+
+def prompt_regex(prompt):
+    '''Compile a regex matching a learned prompt, e.g. "switch#".
+
+    Mode suffixes ("(config)", "(config-if)") and the privilege character are
+    wildcarded so the same regex keeps working if the session changes modes.
+    '''
+    hostname = prompt.strip().rstrip('>#').split('(')[0]
+    if not hostname:
+        return DEFAULT_PROMPT
+    return re.compile(r'^{0}(\([\w.\-]+\))?[>#]\s*$'
+                      r''.format(re.escape(hostname)))
+
+
+def iter_recv(chan, timeout=1.5, recvSize=8192):
+    '''Yield data from chan as it arrives, up to recvSize at a time.
+
+    Blocks in select() instead of polling recv_ready().  Stops when timeout
+    seconds pass without receiving anything, or when the channel closes.
+    '''
+    while True:
+        if not chan.recv_ready():
+            ready, _, _ = select.select([chan], [], [], timeout)
+            if not ready:
+                return
+        data = chan.recv(recvSize)
+        if not data:  # channel closed on us
+            return
+        yield data
+
+
+def read_until_prompt(chan, prompt=DEFAULT_PROMPT, timeout=1.5,
+                      recvSize=8192, marker=None):
+    '''Read from chan until prompt matches the last line of the stream.
+
+    Returns as soon as the prompt shows up; timeout is only the ceiling on
+    how long we will sit without receiving any data before giving up and
+    returning what we have (see iter_recv).  If marker is given, prompts are
+    ignored until marker has been seen.
+
+    Returns (output, timeToPrompt), timeToPrompt is None if the prompt was
+    never seen.
+    '''
+    start = time.time()
+    chunks = []
+    lastLine = ''
+    seen = marker is None
+    for data in iter_recv(chan, timeout, recvSize):
+        chunks.append(data)
+        if not seen:
+            seen = marker in lastLine[-len(marker):] + data
+        lastLine = (lastLine + data).rsplit('\n', 1)[-1].lstrip('\r')
+        if seen and prompt.match(lastLine):
+            return ''.join(chunks), time.time() - start
+    return ''.join(chunks), None
+
+
+def split_batch(output, token, count, trim=True):
+    '''Split the output of a batch sent by SSHConnection.run_batch() into one
+    result per command, using the "!<token>-<n>" sentinel echoed after each.
+    '''
+    sentinel = re.compile(r'!{0}-(\d+)\s*$'.format(re.escape(token)))
+    rslts = []
+    current = []
+    for line in output.splitlines():
+        if sentinel.search(line):
+            rslts.append(current)
+            current = []
+        else:
+            current.append(line)
+    rslts += [[]] * (count - len(rslts))
+    if trim:  # first line is the command being echoed back
+        return ['\n'.join(lines[1:]) for lines in rslts[:count]]
+    return ['\n'.join(lines) for lines in rslts[:count]]
+
 
 class SSHConnection(object):
     '''Wrapper for paramiko ssh connections.
@@ -53,6 +134,10 @@ class SSHConnection(object):
         self.channel = None
         self.connectionTimeout = 5
         self.rcvTimeout = 1.5
+        self.recvSize = 8192
+        self.prompt = DEFAULT_PROMPT
+        self.timeToPrompt = None
+        self.keepalive = 0
         self.trim = True
         self.stdIn = None
         self.stdOut = None
@@ -72,50 +157,121 @@ class SSHConnection(object):
         else:
             return self._run(command)
 
+    def run_iter(self, command, timeout=None, trim=None, flush=None,
+                 recvSize=None):
+        '''Run a command, interactive or not, and return an iterator that
+        yields the output one line at a time as it arrives.
+
+            Nothing is accumulated beyond the current partial line, so this is
+        the way to handle very large outputs ('sh mac address-table' on a core,
+        'sh tech').  recvSize overrides self.recvSize, the most we ask the
+        channel for per read.
+        '''
+        if flush is None:
+            flush = self.autoflush
+
+        self._connect()
+        if self.interactive:
+            if flush:
+                self.buffer_flush()
+            return self._iterP(command, timeout, trim, recvSize)
+        else:
+            return self._iter(command)
+
+    def run_batch(self, commands, timeout=None, trim=None, flush=None):
+        '''Run several commands in one round trip, return a list of results.
+
+            In interactive mode every command is followed by a "!<token>-<n>"
+        comment line, which IOS ignores but echoes back, and the whole batch is
+        sent at once.  The single output stream is then split on those
+        sentinels.  Only use this for commands that don't prompt for input.
+        '''
+        if flush is None:
+            flush = self.autoflush
+
+        self._connect()
+        if not self.interactive:
+            return [self._run(command) for command in commands]
+        if flush:
+            self.buffer_flush()
+        return self._runP_batch(commands, timeout, trim)
+
+    def _runP_batch(self, commands, timeout=None, trim=None):
+        '''Run a list of commands in interactive mode'''
+        UpdateMetric('_runP_batch()')
+        chan = self.channel
+        if not timeout:
+            timeout = self.rcvTimeout
+        if trim is None:
+            trim = self.trim
+        token = uuid.uuid4().hex[:12]
+        lines = []
+        for n, command in enumerate(commands):
+            lines.append(command.rstrip('\n'))
+            lines.append('!{0}-{1}'.format(token, n))
+        DebugPrint('_runP_batch.host: {0}'.format(self.ip), 1)
+        DebugPrint('_runP_batch.commands: {0}'.format(commands), 1)
+
+        chan.send('\n'.join(lines) + '\n')
+        marker = '!{0}-{1}'.format(token, len(commands) - 1)
+        rbuffer, self.timeToPrompt = read_until_prompt(chan, self.prompt,
+                                                       timeout, self.recvSize,
+                                                       marker)
+        if self.timeToPrompt is None:
+            UpdateMetric('_runP_batch.PromptTimeout')
+        else:
+            UpdateTiming('TimeToPrompt : batch of {0}'.format(len(commands)),
+                         self.timeToPrompt)
+        if DEBUG:
+            print(rbuffer)
+        return split_batch(rbuffer, token, len(commands), trim)
+
     def _runP(self, command, timeout=None, trim=None):
         '''Run a command in interactive mode'''
+        return '\n'.join(self._iterP(command, timeout, trim))
+
+    def _iterP(self, command, timeout=None, trim=None, recvSize=None):
+        '''Run a command in interactive mode, yield lines as they arrive'''
         UpdateMetric('_runP()')
         chan = self.channel
         if not timeout:
             timeout = self.rcvTimeout
-        rbuffer = ''
         if trim is None:
             trim = self.trim
+        if not recvSize:
+            recvSize = self.recvSize
         if not command[-1] == '\n':
             command += '\n'
 
-        chan.send(command)
-
-        n = 0
-        # Max time to wait in any given stretch is timeout seconds
-        # Sleep .05s at a time, timeout/.05 intervals
-        interval = .05
         DebugPrint('_runP.host: {0}'.format(self.ip, True))
         DebugPrint('_runP.command: {0}'.format(command, True))
-        while True:
-            if not chan.recv_ready():
-                if n == timeout/interval:
-                    UpdateMetric('Delay : {0}'.format(n))
-                    break
-                if n > 3 and len(rbuffer) > 0 and rbuffer[-1] == '#':
-                    break
-                n += 1
-                time.sleep(interval)
+        chan.send(command)
+        start = time.time()
+        self.timeToPrompt = None
+        echo = trim  # first line is the command being echoed back
+        pending = ''  # current partial line
+        for data in iter_recv(chan, timeout, recvSize):
+            lines = (pending + data).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                if echo:
+                    echo = False
+                    continue
                 if DEBUG:
-                    print ("waiting for data... ", n)
-            else:
-                rbuffer += chan.recv(1000)
-                if n > 0:
-                    UpdateMetric('Delay : {0}ms'.format((n * 1000)*interval))
-                n = 0
+                    print(line)
+                yield line.rstrip('\r')
+            if self.prompt.match(pending.lstrip('\r')):
+                self.timeToPrompt = time.time() - start
+                break
 
-        if trim:
-            rslt = '\n'.join(rbuffer.splitlines()[1:-1])
+        if self.timeToPrompt is None:
+            UpdateMetric('_runP.PromptTimeout')
         else:
-            rslt = rbuffer
-        if DEBUG:
-            print(rbuffer)
-        return rslt
+            UpdateTiming('TimeToPrompt : {0}'.format(command.strip()),
+                         self.timeToPrompt)
+        # With trim, the last line is the prompt for the next command
+        if pending and not trim:
+            yield pending.rstrip('\r')
 
     def _run(self, command):
         '''Run a command without interactive mode'''
@@ -130,17 +286,46 @@ class SSHConnection(object):
             return rslt
         pass
 
+    def _iter(self, command):
+        '''Run a command without interactive mode, yield lines as they
+        arrive'''
+
+        UpdateMetric('_run()')
+        DebugPrint("_run.host: {0}".format(self.ip), 0)
+        DebugPrint("_run.command: {0}".format(command), 0)
+        self.stdIn, self.stdOut, self.stdErr = self.session.exec_command(
+            command)
+        for line in self.stdOut:
+            yield line.rstrip('\r\n')
+
+    @property
+    def healthy(self):
+        '''True if the underlying session (and channel) are still usable'''
+        if not self.session:
+            return False
+        transport = self.session.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if self.interactive and (not self.channel or self.channel.closed):
+            return False
+        return True
+
     def _connect(self):
         '''Create and properly initialize session and channel as necessary'''
-        
-        if not self.session or \
-                (self.interactive and
-                    (not self.channel or
-                     not self.channel.transport.is_active() or
-                     self.channel.closed)
-                    ):
+
+        if not self.healthy:
             self._NewSSH()
 
+    def close(self):
+        '''Tear down session and channel.  The next run() will reconnect.'''
+        if self.session:
+            try:
+                self.session.close()
+            except Exception:
+                pass
+        self.session = None
+        self.channel = None
+
     def _NewSSH(self):
         '''Create a new SSH Connection'''
 
@@ -161,10 +346,28 @@ class SSHConnection(object):
             raise Exception('Couldn\'t Connect to {host}!'.format(host=ip))
 
         self.session = ssh
+        if self.keepalive:
+            ssh.get_transport().set_keepalive(self.keepalive)
         if interactive:
             self.channel = ssh.invoke_shell()
+            self.learn_prompt()
             self.disable_paging_h()
 
+    def learn_prompt(self):
+        '''Read the login banner and remember the prompt that follows it.
+
+        Falls back to DEFAULT_PROMPT if the device doesn't show us anything
+        prompt-like within self.rcvTimeout.
+        '''
+        banner, elapsed = read_until_prompt(self.channel, DEFAULT_PROMPT,
+                                            self.rcvTimeout, self.recvSize)
+        if elapsed is None:
+            DebugPrint('learn_prompt: no prompt from {0}'.format(self.ip), 3)
+            self.prompt = DEFAULT_PROMPT
+        else:
+            self.prompt = prompt_regex(banner.splitlines()[-1])
+        return self.prompt
+
     def disable_paging_h(self):
         '''disable paging behavior for interactive cisco sessions
             "press any key to continue" etc...
@@ -173,12 +376,157 @@ class SSHConnection(object):
         command = "terminal length 0\n"
         self.run(command)
 
+    def drain(self, timeout=None):
+        '''Read and discard output until the prompt comes back, e.g. after
+        the caller of run_iter() stopped reading halfway through.'''
+        if self.channel is None:
+            return
+        if not timeout:
+            timeout = self.rcvTimeout
+        UpdateMetric('drain()')
+        read_until_prompt(self.channel, self.prompt, timeout, self.recvSize)
+
     def buffer_flush(self):
         rslt = ''
         while self.channel.recv_ready():
             rslt += self.channel.recv(1000)
         return rslt
 
+class SSHConnectionPool(object):
+    '''Thread-safe, process-wide cache of SSHConnection objects.
+
+        Connections are keyed by (host, username, mode) and handed out one
+    caller at a time; a second thread asking for the same key waits until the
+    first gives it back.  At most maxSessions connections are held open.  When
+    we're at the cap, the least recently used idle connection is closed to make
+    room, and connections idle longer than maxIdle seconds are closed on the
+    next checkout.  Every transport sends a keepalive every `keepalive`
+    seconds, and connections are health checked before being handed out.
+
+        Use it through connection():
+
+        with POOL.connection(host, creds) as conn:
+            conn.run('sh ver')
+    '''
+
+    def __init__(self, maxSessions=64, maxIdle=300, keepalive=30):
+        self.maxSessions = maxSessions
+        self._reserved = []  # see reserve()
+        self.maxIdle = maxIdle
+        self.keepalive = keepalive
+        self._lock = threading.Condition()
+        self._idle = {}             # key: (SSHConnection, lastUsed)
+        self._lru = deque()         # keys of self._idle, LRU first
+        self._busy = {}             # key: SSHConnection
+
+    @staticmethod
+    def key(host, credentials, interactive=True):
+        mode = 'interactive' if interactive else 'exec'
+        return (host, credentials[0], mode)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._idle) + len(self._busy)
+
+    def acquire(self, host, credentials, interactive=True):
+        '''Check out the connection for (host, user, mode), creating it if
+        needed.  Blocks while that key is in use elsewhere, or while the pool
+        is full of busy connections.  Must be paired with release().
+        '''
+        key = self.key(host, credentials, interactive)
+        with self._lock:
+            self._reap()
+            while True:
+                if key in self._busy:
+                    self._lock.wait()
+                    continue
+                if key in self._idle:
+                    conn, _ = self._idle.pop(key)
+                    self._lru.remove(key)
+                    break
+                if len(self._idle) + len(self._busy) < self._cap():
+                    conn = None
+                    break
+                if self._idle:
+                    lru, _ = self._idle.pop(self._lru.popleft())
+                    UpdateMetric('SSHConnectionPool.evict')
+                    lru.close()
+                    continue
+                UpdateMetric('SSHConnectionPool.wait')
+                self._lock.wait()
+            if conn is None:
+                UpdateMetric('SSHConnectionPool.miss')
+                conn = SSHConnection(host, credentials, interactive)
+                conn.keepalive = self.keepalive
+            else:
+                UpdateMetric('SSHConnectionPool.hit')
+            self._busy[key] = conn
+
+        if conn.session and not conn.healthy:
+            UpdateMetric('SSHConnectionPool.unhealthy')
+            conn.close()  # run() will transparently reconnect
+        return conn
+
+    def release(self, conn):
+        '''Return a connection obtained from acquire() to the pool'''
+        key = self.key(conn.ip, conn.credentials, conn.interactive)
+        with self._lock:
+            if self._busy.get(key) is conn:
+                del self._busy[key]
+                self._idle[key] = (conn, time.time())
+                self._lru.append(key)
+            self._lock.notify_all()
+
+    def _cap(self):
+        '''Most connections to hold open right now.  Hold the lock.'''
+        return max([self.maxSessions] + self._reserved)
+
+    @contextmanager
+    def reserve(self, count):
+        '''Allow at least count connections while in the block, e.g. for a
+        collector running count devices at once.  maxSessions itself is left
+        alone, so nothing changes for the rest of the process afterwards.
+        '''
+        with self._lock:
+            self._reserved.append(count)
+            self._lock.notify_all()  # anyone waiting for room has it now
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._reserved.remove(count)
+
+    @contextmanager
+    def connection(self, host, credentials, interactive=True):
+        conn = self.acquire(host, credentials, interactive)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def _reap(self):
+        '''Close idle connections older than self.maxIdle.  Hold the lock.'''
+        cutoff = time.time() - self.maxIdle
+        while self._lru:
+            conn, lastUsed = self._idle[self._lru[0]]
+            if lastUsed > cutoff:
+                break
+            del self._idle[self._lru.popleft()]
+            UpdateMetric('SSHConnectionPool.expire')
+            conn.close()
+
+    def closeall(self):
+        '''Close every idle connection.  Busy ones are left to their owners.'''
+        with self._lock:
+            while self._lru:
+                conn, _ = self._idle.pop(self._lru.popleft())
+                conn.close()
+
+
+POOL = SSHConnectionPool()
+atexit.register(POOL.closeall)
+
+
 def NewSSH(host, creds, interactive=False):
     '''Initialize ssh connection object to specified host'''
     
@@ -216,7 +564,7 @@ def DisablePagingH(host, creds):
 
 
 def sshrun(command, host=None, creds=None, ssh=None, TextOnly=True):
-    '''Run a single command on a single host via SSH_SESSIONS.
+    '''Run a single command on a single host via a new, non-persistent session.
 
     command  -- string defining command to be ran (e.x. 'show run | inc vty')
     host     -- hostname or IP address.  Only valid if ssh is None
@@ -251,7 +599,7 @@ def sshrun(command, host=None, creds=None, ssh=None, TextOnly=True):
 
 
 def sshrunP(command, host, creds, trim=True, timeout=1.5):
-    '''Run a command using persistent session via SSH_SESSIONS.
+    '''Run a command using a persistent session from POOL.
     
     THE SESSION IS SUBJECT TO TIMEOUT, and WILL EXPIRE.  If session expires, it 
     will be recreated the next time a command is ran.
@@ -264,70 +612,15 @@ def sshrunP(command, host, creds, trim=True, timeout=1.5):
     trim     -- remove first and last lines of output, which typically echo the 
         command and give the prompt for next command.  (default True)
 
-    timeout  -- How long to wait without receiving data before returning output.
+    timeout  -- How long to wait without receiving data before giving up on
+        the prompt and returning output.
     '''
 
-    global SSH_SESSIONS
-    global SSH_CHANNELS
-    rbuffer = ''
     UpdateMetric('sshrunP')
-    if not command[-1] == '\n':
-        command += '\n'
-    if host in SSH_HOSTS:
-        index = SSH_HOSTS.index(host)
-    else:
-        index = len(SSH_HOSTS)
-        try:
-            bssh, bchan = NewSSH(host, creds, interactive=1)
-            # DisablePagingC(bchan)
-        except:
-            raise
-        else:
-            SSH_SESSIONS.append(bssh)
-            SSH_CHANNELS.append(bchan)
-            SSH_HOSTS.append(host)
-            DisablePagingH(host, creds)
-        if DEBUG:
-            print index
-            print SSH_SESSIONS
-            print SSH_CHANNELS
-            print SSH_HOSTS
-
-    if not SSH_CHANNELS[index].transport.is_active():
-        SSH_SESSIONS[index], SSH_CHANNELS[index] = NewSSH(host, creds,
-                                                          interactive=1)
-
-    SSH_CHANNELS[index].send(command)
-    n = 0
-    # Max time to wait in any given stretch is timeout seconds
-    # Sleep .05s at a time, timeout/.05 intervals
-    interval = .05
     DebugPrint('sshrunP.host: {0}'.format(host, True))
     DebugPrint('sshrunP.command: {0}'.format(command, True))
-    while True:
-        if not SSH_CHANNELS[index].recv_ready():
-            if n == timeout/interval:
-                UpdateMetric('Delay : {0}'.format(n))
-                break
-            if n > 3 and len(rbuffer) > 0 and rbuffer[-1] == '#':
-                break
-            n += 1
-            time.sleep(interval)
-            if DEBUG:
-                print ("waiting for data... ", n)
-        else:
-            rbuffer += SSH_CHANNELS[index].recv(1000)
-            if n > 0:
-                UpdateMetric('Delay : {0}ms'.format((n * 1000)*interval))
-            n = 0
-
-    if trim:
-        rslt = '\n'.join(rbuffer.splitlines()[1:-1])
-    else:
-        rslt = rbuffer
-    if DEBUG:
-        print(rbuffer)
-    return rslt
+    with POOL.connection(host, creds, interactive=True) as conn:
+        return conn.run(command, timeout=timeout, trim=trim, flush=False)
 
 if __name__ == '__main__':
     pass
@@ -7,9 +7,14 @@ Library of functions and classes to use in other scripts.
 """
 # Standard Library Imports
 import getpass
+import json
+import os
 import time
 import multiprocessing
+import multiprocessing.pool
 import socket
+import struct
+import threading
 import re
 from collections import namedtuple
 
@@ -17,6 +22,7 @@ from collections import namedtuple
 from metrics import UpdateMetric
 from sshexecute import sshrunP
 import sshexecute
+import cmdcache
 from metrics import DebugPrint
 import metrics
 from collections import namedtuple
@@ -24,7 +30,6 @@ from collections import namedtuple
 
 # TODO:  FIX THIS MESS
 DEBUG = True
-ARP_TABLE = []
 DEFAULT_GATEWAY = None
 CREDENTIALS = None  # SET THESE IN MAIN()!
 CURRENT_SWITCH = None
@@ -33,17 +38,21 @@ CURRENT_SWITCH = None
 def deduplicate_list(oList, tag=None):
     """Given oList, search for duplicates.
     If found, print information to screen to assist in troubleshooting
+    Items must be hashable; a later duplicate replaces the earlier one, in
+    the earlier one's position.
 
     """
     nList = []
+    positions = {}
     for item in oList:
-        if item in nList:
-            index = nList.index(item)
+        index = positions.get(item)
+        if index is not None:
             if DEBUG:
                 print ('******\n{2}\nDuplicate Entry!!\nOld:{0}\nNew:{1}\n'
                        '******'.format(repr(nList[index]), repr(item), tag))
             nList[index] = item
         else:
+            positions[item] = len(nList)
             nList.append(item)
     return nList
 
@@ -59,67 +68,249 @@ def listify(obj):
     return rslt
 
 
+class MACAddress(object):
+    """
+        MAC address stored as an int.  Accepts the Cisco (0026.b9f0.095e),
+        colon, dash and bare hex formats, or an int; prints the Cisco way.
+        A 4 hex digit 'last 4' fragment is kept as a 16 bit suffix.
+
+        == is exact, only holds between MACAddresses (parse a string
+        first) and hashes like the int, so MACAddresses are cheap dict keys
+        and set members.  Use matches() for 'last 4' style matching.
+    """
+    __slots__ = ('value', 'bits')
+    _HEX = re.compile(r'^[0-9a-fA-F]+$')
+
+    def __init__(self, value):
+        if isinstance(value, MACAddress):
+            self.value, self.bits = value.value, value.bits
+            return
+        if isinstance(value, (int, long)):
+            if not 0 <= value < 1 << 48:
+                raise ValueError('MAC address out of range: {0}'
+                                 ''.format(value))
+            self.value, self.bits = value, 48
+            return
+        digits = (value.strip().replace('.', '').replace(':', '')
+                  .replace('-', ''))
+        if not self._HEX.match(digits):
+            # int(x, 16) would take '0x12', '+abc' or ' 12'
+            raise ValueError('Not a MAC Address: {0}'.format(value))
+        if len(digits) == 12:
+            self.bits = 48
+        elif len(digits) == 4:
+            self.bits = 16
+        else:
+            raise ValueError('I don\'t know how to process this MAC Address! '
+                             '{0}'.format(value))
+        self.value = int(digits, 16)
+
+    def matches(self, other):
+        """
+            True if other is the same address, or if either one is a 'last 4'
+            fragment of the other.
+        """
+        if not isinstance(other, MACAddress):
+            other = MACAddress(other)
+        if self.bits == other.bits:
+            return self.value == other.value
+        return (self.value & 0xffff) == (other.value & 0xffff)
+
+    def __str__(self):
+        value = self.value
+        if self.bits == 16:
+            return '{0:04x}'.format(value)
+        return '{0:04x}.{1:04x}.{2:04x}'.format(value >> 32,
+                                                (value >> 16) & 0xffff,
+                                                value & 0xffff)
+
+    def __repr__(self):
+        return 'MACAddress({0!r})'.format(str(self))
+
+    def __int__(self):
+        return self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __eq__(self, other):
+        if not isinstance(other, MACAddress):
+            return NotImplemented
+        return self.value == other.value and self.bits == other.bits
+
+    def __ne__(self, other):
+        if not isinstance(other, MACAddress):
+            return NotImplemented
+        return not (self == other)
+
+    def __lt__(self, other):
+        if not isinstance(other, MACAddress):
+            return NotImplemented
+        return (self.bits, self.value) < (other.bits, other.value)
+
+
 def format_mac_address(oMac):
     """Ensure a MAC address (or fragment) is formatted consistent with the
     
-    Cisco show commands.  If it's 4 characters, return it unmodified.
-    If it's 12 or more characters, remove any '.' or '-', and format it
-    'the Cisco Way'; return.
+    Cisco show commands.  If it's 4 characters, return it (lowercase).
+    If it's 12 hex digits in any common format, format it 'the Cisco Way';
+    return.
     
     """
     if oMac is None:
         return None
-    elif len(oMac) == 4:
-        rslt = oMac
-    elif len(oMac) >= 12:
-        wMac = oMac.replace('-', '')
-        wMac = wMac.replace('.', '')
-        rslt = '.'.join([wMac[:4], wMac[4:8], wMac[8:]])
+    return str(MACAddress(oMac))
+
+
+# (short, long) form of every interface type format_interface_name() knows
+INTERFACE_FORMATS = [
+    ('Gi', 'GigabitEthernet'),
+    ('Fa', 'FastEthernet'),
+    ('E', 'Ethernet'),
+    ('Vl', 'Vlan'),
+    ('Se', 'Serial'),
+    ('Te', 'TenGigabitEthernet'),
+    ('Po', 'Port-Channel'),
+    ('Tu', 'Tunnel'),
+]
+FIN_CACHE_SIZE = 8192
+_FIN_CACHE = {}
+
+
+def _intern(value):
+    # intern() only takes str in py2
+    return intern(value) if type(value) is str else value
+
+
+def _build_interface_trie(formats):
+    """
+       Map every prefix of every (lowercase) long name to the formats it could
+       still be the start of.  Each node is [children, set of formats].
+    """
+    root = {}
+    for sName, lName in formats:
+        children = root
+        for char in lName.lower():
+            node = children.setdefault(char, [{}, set()])
+            node[1].add((_intern(sName), _intern(lName)))
+            children = node[0]
+    return root
+
+_INTERFACE_TRIE = _build_interface_trie(INTERFACE_FORMATS)
+
+
+def _interface_forms(oInterface):
+    """
+       Return (short, long) forms of oInterface, or None if it isn't an
+       interface name we know.  Results are cached by raw name.
+    """
+    forms = _FIN_CACHE.get(oInterface, False)
+    if forms is not False:
+        return forms
+
+    iInterface = oInterface.strip().lower()
+    children, formats = _INTERFACE_TRIE, None
+    end = 0
+    for char in iInterface:
+        node = children.get(char)
+        if node is None:
+            break
+        children, formats = node
+        end += 1
+    suffix = iInterface[end:]
+    # The prefix must lead to exactly one type ('t' could be Te or Tu), and
+    # what's left must be the port number ('em0' isn't Ethernet 'm0').
+    if (formats is None or len(formats) != 1 or
+            (suffix and not suffix[0].isdigit())):
+        forms = None
     else:
-        raise Exception('I don\'t know how to process this MAC Address!')
-    return rslt.lower()
+        sName, lName = next(iter(formats))
+        forms = (_intern(sName + suffix), _intern(lName + suffix))
+
+    if len(_FIN_CACHE) >= FIN_CACHE_SIZE:
+        _FIN_CACHE.clear()
+    _FIN_CACHE[oInterface] = forms
+    return forms
 
 
 def format_interface_name(oInterface, short=False):
     """
        Ensure consistent formatting of interface names.
        long form unless short == True
+       Any unambiguous abbreviation of a known type is accepted ('gigab1/0/1').
+       Raises ValueError for anything else; see try_normalize().
     """
-    # TODO: The whole way this works is dumb, and will match any string that starts with the letter 'e'.
-
-    Formats = {
-        'gi': ['Gi', 'GigabitEthernet'],
-        'fa': ['Fa', 'FastEthernet'],
-        'e':  ['E', 'Ethernet'],
-        'vl': ['Vl', 'Vlan'],
-        'se': ['Se', 'Serial'],
-        'te': ['Te', 'TenGigabitEthernet'],
-        'po': ['Po', 'Port-Channel'],
-        'tu': ['Tu', 'Tunnel']
-        }
     if oInterface in ['', None]:
         return oInterface
+    forms = _interface_forms(oInterface)
+    if forms is None:
+        raise ValueError('Unknown interface name: {0}'.format(oInterface))
+    return forms[0] if short else forms[1]
 
-    iInterface = oInterface.lower()
-    prefix = iInterface[:2]
-    if prefix in Formats:
-        lName = Formats[prefix][1]
-        sName = Formats[prefix][0]
-    elif prefix[0] in Formats:
-        prefix = prefix[0]
-        lName = Formats[prefix][1]
-        sName = Formats[prefix][0]
-    else:
-        raise Exception(ValueError)
 
-    buff = iInterface.strip(lName.lower())
-    if short:
-        nName = sName
-    else:
-        nName = lName
-    nInterface = nName + buff
+def try_normalize(oInterface, short=False, default=None):
+    """
+       format_interface_name() that returns default instead of raising for
+       names it doesn't know (Loopback0, Null0, lines that aren't interfaces).
+    """
+    if oInterface in ['', None]:
+        return oInterface
+    forms = _interface_forms(oInterface)
+    if forms is None:
+        return default
+    return forms[0] if short else forms[1]
+
+
+# Type and number of an interface name, e.g. ('Loopback', '0')
+_UNKNOWN_INTERFACE = re.compile(r'^([A-Za-z][A-Za-z-]*)(\d\S*)$')
+
+
+def short_interface_key(oInterface):
+    """
+       Lowercase short form of an interface name, for matching names across
+       commands that spell them differently.  Types format_interface_name()
+       doesn't know are cut to their first two letters the way IOS
+       abbreviates them: 'Loopback0' and 'Lo0' are both 'lo0'.
+    """
+    forms = _interface_forms(oInterface)
+    if forms is not None:
+        return forms[0].lower()
+    match = _UNKNOWN_INTERFACE.match(oInterface.strip())
+    if match is None:
+        return oInterface.strip().lower()
+    return (match.group(1)[:2] + match.group(2)).lower()
+
+
+def iter_lines(data):
+    """
+       Accept command output either as a single string or as an iterable of
+       lines (e.g. from NetworkDevice.execute_iter()), return an iterable of
+       lines.
+    """
+    if isinstance(data, basestring):
+        return data.splitlines()
+    return data
 
-    return nInterface
+
+# First line of each block in 'show interface', e.g.
+# "FastEthernet1/0/1 is up, line protocol is up (connected)"
+INTERFACE_HEADER = re.compile(r'^\S+ is .*line protocol is ')
+
+
+def iter_interface_blocks(lines):
+    """
+       Split 'show interface' output into one list of lines per interface,
+       yielding each block as soon as the header of the next one arrives, so
+       ports can be built while the rest of the output is still on the wire.
+    """
+    block = []
+    for line in lines:
+        if block and INTERFACE_HEADER.match(line):
+            yield block
+            block = []
+        block.append(line)
+    if block:
+        yield block
 
 
 def get_credentials(user=None):
@@ -152,12 +343,13 @@ def Date():
 class EndDevice(object):
     """Represent an end device"""
     def __init__(self, mac=None, ip=None, switchport=None, switch=None,
-                 dns=None):
+                 dns=None, vlan=None):
         self.mac = mac
         self.ip = ip
         self._switch = switch
         self._switchport = switchport
         self.dns = dns
+        self.vlan = vlan  # where the switch learned it, if known
 
     @property
     def mac(self):
@@ -165,7 +357,7 @@ class EndDevice(object):
 
     @mac.setter
     def mac(self, value):
-        self._mac = format_mac_address(value)
+        self._mac = None if value is None else MACAddress(value)
 
     @property
     def switchport(self):
@@ -184,17 +376,18 @@ class EndDevice(object):
             # if it's a string, make sure it's formatted properly
         # even if it's a string, we don't create an object yet, because it
         # could already be created and in place
-        if port not in self.switch.ports:
+        switchport = self.switch.ports.get(port)
+        if switchport is None:
             if type(port) == str:
-                self.switch.ports += [SwitchPort(name=port)]
+                switchport = SwitchPort(name=port)
             else:
-                self.switch.ports += port
-        index = self.switch.ports.index(port)
-        devices = self.switch.ports[index].devices
+                switchport = port
+            self.switch.ports.append(switchport)
+        devices = switchport.devices
 
         if self not in devices:
             devices += [self]
-        self._switchport = self.switch.ports[index]
+        self._switchport = switchport
 
     @property
     def switch(self):
@@ -223,10 +416,23 @@ class EndDevice(object):
                                          self.switch, self.switchport))
 
     def __str__(self):
-        return self.mac
+        return str(self.mac)
+
+    def _key(self):
+        return self.ip if self._mac is None else self._mac
+
+    def __hash__(self):
+        return hash(self._key())
 
     def __eq__(self, other):
-        return (self.mac == str(other)) or (self.ip == str(other))
+        if isinstance(other, EndDevice):
+            return self._key() == other._key()
+        try:
+            mac = MACAddress(other)
+        except (ValueError, TypeError, AttributeError):
+            mac = None
+        return (mac is not None and self.mac == mac) or \
+            (self.ip == str(other))
 
     def __ne__(self, other):
         return not (self == other)
@@ -253,7 +459,6 @@ class NetworkDevice(object):
         self.credentials = creds
         self.goodstates = ['UNK', 'UP']
         self.state = 'UNK'  # valid states: ['UNK', 'UP', 'DOWN']
-        self.connection = None
 
     @property
     def ip(self):
@@ -269,27 +474,126 @@ class NetworkDevice(object):
                             ''.format(self, type(arg)))
 
     def _connect(self):
-        if self.connection is None:
-            self.connection = sshexecute.SSHConnection(self.ip,
-                                                         self.credentials,
-                                                         True)
+        """
+        Check out this device's session from the shared connection pool.
+        Use as a context manager; the session goes back to the pool on exit.
+        """
+        return sshexecute.POOL.connection(self.ip, self.credentials, True)
 
     def execute(self, command, trim=True, timeout=1.5):
         """
         Connect to switch and execute 'command'
         """
-        self._connect()
         UpdateMetric('Switch.execute')
+        if cmdcache.CACHE is not None:
+            lines = cmdcache.CACHE.get(self.ip, command, trim)
+            if lines is not None:
+                self.state = 'UP'
+                return lines
         try:
-            lines = self.connection.run(command=command,
+            with self._connect() as connection:
+                lines = connection.run(command=command,
+                                       trim=trim,
+                                       timeout=timeout)
+                # read it while the session is still ours
+                complete = connection.timeToPrompt is not None
+        except Exception:
+            self.state = 'DOWN'
+            raise
+        else:
+            self.state = 'UP'
+            # output cut short by the read timeout isn't worth keeping
+            if cmdcache.CACHE is not None and complete:
+                cmdcache.CACHE.put(self.ip, command, lines, trim)
+            return lines
+
+    def execute_iter(self, command, trim=True, timeout=1.5):
+        """
+        Connect to switch and execute 'command', return an iterator over the
+        lines of output as they arrive.  The session stays checked out of the
+        connection pool until the iterator is exhausted or closed.
+        """
+        UpdateMetric('Switch.execute_iter')
+        if cmdcache.CACHE is not None:
+            output = cmdcache.CACHE.get(self.ip, command, trim)
+            if output is not None:
+                self.state = 'UP'
+                return iter(output.splitlines())
+        connection = sshexecute.POOL.acquire(self.ip, self.credentials, True)
+        try:
+            lines = connection.run_iter(command=command,
                                         trim=trim,
                                         timeout=timeout)
+        except Exception:
+            sshexecute.POOL.release(connection)
+            self.state = 'DOWN'
+            raise
+        self.state = 'UP'
+        return self._release_after(connection, lines, command, trim)
+
+    def _release_after(self, connection, lines, command=None, trim=True):
+        # Only output read all the way to the prompt goes in the cache
+        cache = cmdcache.CACHE if command is not None else None
+        seen = []
+        done = False
+        try:
+            for line in lines:
+                if cache is not None:
+                    seen.append(line)
+                yield line
+            done = True
         except Exception:
             self.state = 'DOWN'
             raise
         else:
+            if cache is not None and connection.timeToPrompt is not None:
+                cache.put(self.ip, command, '\n'.join(seen), trim)
+        finally:
+            if not done:
+                # Abandoned (or failed) part way: whatever is still coming
+                # would otherwise end up in the next command's output
+                lines.close()
+                if connection.interactive and connection.timeToPrompt is None:
+                    try:
+                        connection.drain()
+                    except Exception:
+                        DebugPrint('[{0}] drain failed'.format(self.ip), 1)
+            sshexecute.POOL.release(connection)
+
+    def execute_batch(self, commands, trim=True, timeout=1.5):
+        """
+        Connect to switch and execute several 'commands' in one round trip.
+        Returns a list of outputs, one per command.
+        """
+        UpdateMetric('Switch.execute_batch')
+        rslts = [None] * len(commands)
+        if cmdcache.CACHE is not None:
+            for n, command in enumerate(commands):
+                rslts[n] = cmdcache.CACHE.get(self.ip, command, trim)
+        missing = [n for n, rslt in enumerate(rslts) if rslt is None]
+        if not missing:
             self.state = 'UP'
-            return lines
+            return rslts
+        try:
+            with self._connect() as connection:
+                pulled = connection.run_batch(
+                    commands=[commands[n] for n in missing],
+                    trim=trim,
+                    timeout=timeout)
+                complete = connection.timeToPrompt is not None
+        except Exception:
+            self.state = 'DOWN'
+            raise
+        else:
+            self.state = 'UP'
+            # without the final prompt, any of the outputs may be cut short
+            # or missing altogether
+            store = cmdcache.CACHE is not None and complete
+            for n, output in zip(missing, pulled):
+                rslts[n] = output
+                if store:
+                    cmdcache.CACHE.put(self.ip, commands[n], output, trim)
+            return rslts
 
 
 class Riverbed(NetworkDevice):
@@ -355,7 +659,6 @@ class Switch(NetworkDevice):
         if _flash is not None:
             return _flash
 
-        FlashSpace = namedtuple('FlashSpace', 'free, total')
         # filesystems = ['bootdisk:', 'flash:', 'bootflash:',
         #                'sup-bootflash:', 'slot0:']
 
@@ -387,22 +690,7 @@ class Switch(NetworkDevice):
         if not self.supported:
             return 'UNK'
 
-        regex = re.compile(r'[^K/0-9.]').search
-        search = lambda x: 'K' in x and not bool(regex(x))
-        # looking for '#####K' or '#####K/#####K' etc.
-        for line in self.version.splitlines():
-            if 'bytes of memory' in line or \
-                    'bytes of physical memory' in line:
-                for word in line.split():
-                    if search(word):
-                        break
-                break
-        else:
-            return ''
-        word = word.split('/')
-        add = lambda x, y: x + int(y.strip('K'))
-        rslt = reduce(add, word, 0)
-        return rslt
+        return self.version_info.ram
 
     @property
     def model(self):
@@ -413,9 +701,7 @@ class Switch(NetworkDevice):
         :return:
         """
         if self.state == 'UP':
-            for line in self.version.splitlines():
-                if 'bytes of' in line.lower():
-                    return line.split()[1]
+            return self.version_info.model
         return 'UNK'
 
     @property
@@ -434,23 +720,7 @@ class Switch(NetworkDevice):
         if not self.supported:
             return 'UNK'
 
-        version = self.version
-        stackable = False
-        stacklines = []
-        for index, line in enumerate(version.splitlines()):
-            if stackable:
-                if not line:
-                    break
-                elif '-' in line.split()[0]:
-                    continue
-                stacklines.append(line)
-                continue
-            if 'switch ports model' in line.lower():
-                stackable = True
-
-        if len(stacklines) > 1:
-            return True
-        return False
+        return len(self.version_info.stack_members) > 1
 
     @property
     def license(self):
@@ -465,23 +735,10 @@ class Switch(NetworkDevice):
 
     def _collect_license(self):
 
-        regex = re.compile(r'\(..*\),')
-
-        try:
-            word = regex.findall(self.version)[0]
-        except IndexError:
-            word = 'UNK'
-        else:
-            # sanity checks, if we're not sure, just suppress.
-            for char in ['(', ')', ',']:
-                if word.count(char) > 1:
-                    word = 'UNK'
-                    break
-            else:
-                word = word.split('-')[1]
-                if 'UNIVERSAL' in word.upper():
-                    rslt = self._read_universal_license()
-                    word = '{0} ({1})'.format(word, rslt)
+        word = self.version_info.license
+        if 'UNIVERSAL' in word.upper():
+            rslt = self._read_universal_license()
+            word = '{0} ({1})'.format(word, rslt)
 
         self._license = word
 
@@ -539,19 +796,7 @@ class Switch(NetworkDevice):
         if not self.supported:
             return 'UNK'
 
-        _sw_version = getattr(self, '_sw_version', None)
-        if _sw_version is not None:
-            return _sw_version
-
-        version = self.version
-        if 'IOS-XE' in version:
-            regex = re.compile(r'Version.*RELEASE')
-        else:
-            regex = re.compile(r'Version.*,')
-
-        _sw_version = regex.findall(self.version)[0].strip(',').split()[1]
-        self._sw_version = _sw_version
-        return _sw_version
+        return self.version_info.software_version
 
     @property
     def version(self):
@@ -565,6 +810,24 @@ class Switch(NetworkDevice):
             self._collect_version()
             return self._version
 
+    @property
+    def version_info(self):
+        """
+        'sh ver' parsed once into a VersionInfo
+        :return:
+        """
+        _version_info = getattr(self, '_version_info', None)
+        if _version_info is None:
+            _version_info = parse_version(self.version)
+            self._version_info = _version_info
+        return _version_info
+
+    @property
+    def uptime(self):
+        if not self.supported:
+            return 'UNK'
+        return self.version_info.uptime or 'UNK'
+
     @property
     def startup_config(self):
         """
@@ -584,18 +847,19 @@ class Switch(NetworkDevice):
         """
         self._startup_config = self.execute('show startup-config')
 
-    def _collect_version(self, data=False):
+    def _collect_version(self, data=None):
         """
            Pull Version info
         """
         command = 'sh ver'
         UpdateMetric('Switch._collect_version')
-        try:
+        if data is not None:
+            rBuffer = data
+        else:
             rBuffer = self.execute(command)
-        except:
-            raise
 
         self._version = rBuffer
+        self._version_info = None
 
     @property
     def ports(self):
@@ -603,16 +867,15 @@ class Switch(NetworkDevice):
 
     @ports.setter
     def ports(self, arg):
-        if type(arg) == list:
-            self._ports = arg
-            i = 0
-            while i < len(arg):
-                if isinstance(arg[i], basestring):
-                    self.ports[i] = SwitchPort(name=self.ports[i],
-                                                 switch=self)
-                elif (self.ports[i].switch != self):
-                    self.ports[i].switch = self
-                i += 1
+        if isinstance(arg, list):  # includes PortTable
+            ports = PortTable()
+            for port in arg:
+                if isinstance(port, basestring):
+                    port = SwitchPort(name=port, switch=self)
+                elif (port.switch != self):
+                    port.switch = self
+                ports.append(port)
+            self._ports = ports
         else:
             raise Exception('can\'t set \'Switch({0}).ports\''
                             'with {1}'.format(self, type(arg)))
@@ -633,7 +896,8 @@ class Switch(NetworkDevice):
         """
         Run all of this switches 'collect' methods.  Typically faster
         than running them one by one at different times because you never
-        have to rebuild the connection, etc...
+        have to rebuild the connection, etc...  All of the show commands go
+        out in a single batch, so we only wait on the device once.
         """
         metrics.DebugPrint('[{0}].populate()'.format(self.ip))
 
@@ -643,26 +907,32 @@ class Switch(NetworkDevice):
                                'and/or creds', 3)
             raise Exception('missing IP or creds')
 
-        metrics.DebugPrint('[{0}].._get_interfaces()'.format(self.ip))
-        self._get_interfaces()
-        if self.state not in self.goodstates:
+        commands = ['show interface', 'sh int switchport', 'sh cdp ne det',
+                    'sh mac address-table', 'sh int description', 'sh ver']
+        try:
+            (interfaces, switchports, cdp, macTable, descriptions,
+             version) = self.execute_batch(commands)
+        except Exception:
             metrics.DebugPrint('[{0}].populate failed!  State: {1}'
                                ''.format(self.ip, self.state))
             return self.state
 
+        metrics.DebugPrint('[{0}].._get_interfaces()'.format(self.ip))
+        self._get_interfaces(data=interfaces)
+
         metrics.DebugPrint('[{0}].._classify_ports()'.format(self.ip))
-        self._classify_ports()
+        self._classify_ports(data=switchports)
 
         metrics.DebugPrint('[{0}].._collect_cdp_information()'.format(self.ip))
-        self._collect_cdp_information()
+        self._collect_cdp_information(data=cdp)
 
         metrics.DebugPrint('[{0}]..collect_mac_table()'.format(self.ip))
-        self.collect_mac_table()
+        self.collect_mac_table(data=macTable)
 
         metrics.DebugPrint('[{0}].._collect_interface_descriptions()'
                            ''.format(self.ip))
-        self._collect_interface_descriptions()
-        self._collect_version()
+        self._collect_interface_descriptions(data=descriptions)
+        self._collect_version(data=version)
 
         return self.state
 
@@ -681,15 +951,85 @@ class Switch(NetworkDevice):
         _ = self.flash
         _ = self.supervisor
 
-    def collect_mac_table(self):
+    def populate_cdp(self):
+        """
+        Just CDP neighbors and 'sh ver', in a single batch, for mapping the
+        network.  Only ports with a CDP neighbor are created.
+        """
+        if self.ip == 'None' or not self.credentials:
+            metrics.DebugPrint('Attempt to populate switch data missing IP'
+                               'and/or creds', 3)
+            raise Exception('missing IP or creds')
+
+        try:
+            cdp, version = self.execute_batch(['sh cdp ne det', 'sh ver'])
+        except Exception:
+            metrics.DebugPrint('[{0}].populate_cdp failed!  State: {1}'
+                               ''.format(self.ip, self.state))
+            return self.state
+
+        self._collect_cdp_information(data=cdp, addPorts=True)
+        self._collect_version(data=version)
+        return self.state
+
+    def populate_mac_locations(self):
+        """
+        Just enough to tell where MACs are: the MAC table, switchport modes
+        and CDP, in a single batch.  Only ports that show up in the MAC table
+        and 'sh int switchport' are created.  Used by macindex.
+        """
+        if self.ip == 'None' or not self.credentials:
+            metrics.DebugPrint('Attempt to populate switch data missing IP'
+                               'and/or creds', 3)
+            raise Exception('missing IP or creds')
+
+        commands = ['sh mac address-table dynamic', 'sh int switchport',
+                    'sh cdp ne det']
+        try:
+            macTable, switchports, cdp = self.execute_batch(commands)
+        except Exception:
+            metrics.DebugPrint('[{0}].populate_mac_locations failed!  '
+                               'State: {1}'.format(self.ip, self.state))
+            return self.state
+
+        self.collect_mac_table(data=macTable)
+        names = [port for _, _, port in
+                 parse_mac_table(self._mac_address_table)]
+        # and every L2 port, so _classify_ports() has somewhere to put modes
+        names.extend(line.split()[-1] for line in iter_lines(switchports)
+                     if line.startswith('Name:'))
+        for name in names:
+            if name not in self.ports:
+                self.ports.append(SwitchPort(name=name, switch=self))
+        self._classify_ports(data=switchports)
+        self._collect_cdp_information(data=cdp)
+        return self.state
+
+    def collect_mac_table(self, data=None):
         """
         Connect to switch and pull MAC Address table
         """
         command = 'sh mac address-table'
         UpdateMetric('Switch.collect_mac_table')
-        lines = self.execute(command)
+        if data is not None:
+            lines = iter_lines(data)
+        else:
+            lines = self.execute_iter(command)
         self._mac_address_table = '\n'.join(
-            [x for x in lines.splitlines() if 'dynamic' in x.lower()])
+            [x for x in lines if 'dynamic' in x.lower()])
+
+    def mac_locations(self):
+        """
+        Yield (vlan, MACAddress, short port, edge) for each MAC table entry.
+        A port the switch doesn't have (yet) counts as edge.
+        """
+        edges = {}
+        for vlan, mac, port in parse_mac_table(self._mac_address_table):
+            edge = edges.get(port)
+            if edge is None:
+                switchport = self.ports.get(port)
+                edge = edges[port] = (switchport is None or switchport.edge)
+            yield vlan, mac, port, edge
 
     @property
     def mac_table(self):
@@ -698,45 +1038,36 @@ class Switch(NetworkDevice):
         table = self._mac_address_table
         return table
 
-    def _get_interfaces(self, data=False):
+    def _get_interfaces(self, data=None):
         """
         Return all interfaces on a switch, including stats
         """
         command = 'show interface'
         UpdateMetric('Switch._get_interfaces')
-        if not data:
+        if data is None:
             try:
-                lines = self.execute(command).splitlines()
+                lines = self.execute_iter(command)
             except:
                 self.state = 'DOWN'
                 return []
         else:
-            lines = data.splitlines()
+            lines = iter_lines(data)
         self.state = 'UP'
-        detail = []
-        first = True
-        for line in lines:
-            try:
-                format_interface_name(line.split()[0], True)
-            except Exception:
-                pass
-            else:
-                if (not first and 'line protocol' in line):
-                    port = SwitchPort(detail=('\n'.join(detail)),
-                                        switch=self)
-                    self.ports.append(port)
-                    detail = []
-                else:
-                    first = False
-            detail.append(line)
-        # Don't forget the last one...
-        port = SwitchPort(detail=('\n'.join(detail)), switch=self)
-        self.ports.append(port)
+        try:
+            for block in iter_interface_blocks(lines):
+                self.ports.append(SwitchPort(detail='\n'.join(block),
+                                             switch=self))
+        except Exception:
+            DebugPrint('[{0}]._get_interfaces: lost connection mid-stream'
+                       ''.format(self.ip), 3)
+            self.state = 'DOWN'
 
-    def _collect_cdp_information(self, data=False):
+    def _collect_cdp_information(self, data=None, addPorts=False):
         """
-           Apply CDP neighbor information to self.ports[]
-           ex. switch.ports[1].CDPneigh[0] == (
+           Apply CDP neighbor information to self.ports[], adding any port
+           that isn't there yet if addPorts.
+           ex. switch.ports[1].CDPneigh[0] is a CDPNeighbor, which still
+           indexes like the old tuple: (
                NeighborID,
                NeighborIP,
                NeighborCapabilities,
@@ -744,42 +1075,25 @@ class Switch(NetworkDevice):
         """
         command = 'sh cdp ne det'
         UpdateMetric('Switch._collect_cdp_information')
-        try:
-            rBuffer = self.execute(command)
-        except:
-            raise
+        if data is not None:
+            spLines = iter_lines(data)
+        else:
+            spLines = self.execute_iter(command)
 
-        spLines = rBuffer.splitlines()
         CDPEntries = {}
-        for line in spLines:
-            # print line
-            if line.split() == []:
+        for neighbor in parse_cdp_neighbors(spLines):
+            if neighbor.interface is None:
                 continue
-            cat = line.split()[0].lower()
-            if 'device' in cat:
-                cdpid = ''.join(line.split()[2:])
-            elif 'ip' == cat:
-                ip = line.split()[2]
-            elif 'platform' in cat:
-                i = 0
-                while i < len(line.split()):
-                    word = line.split()[i]
-                    if 'capabilit' in word.lower():
-                        capindex = i + 1
-                    i += 1
-                caps = line.split()[capindex:]
-            elif 'interface' in cat:
-                interface = line.split()[1].strip(':,')
-                neighborinterface = line.split()[-1]
-                CDPEntries[interface.lower()] = (cdpid, ip, caps,
-                                                 neighborinterface)
-
-        for switchport in self.ports:
-            if switchport.name.lower() in CDPEntries:
-                switchport.CDPneigh.append(CDPEntries[switchport.name.lower()])
+            CDPEntries[neighbor.interface.lower()] = neighbor
+            switchport = self.ports.get(neighbor.interface)
+            if switchport is None and addPorts:
+                switchport = SwitchPort(name=neighbor.interface, switch=self)
+                self.ports.append(switchport)
+            if switchport is not None:
+                switchport.CDPneigh.append(neighbor)
         self.cdp_information = CDPEntries
 
-    def _classify_ports(self, data=False):
+    def _classify_ports(self, data=None):
         """
             Classify ports by switchport mode.
             ('access', 'trunk')
@@ -789,21 +1103,18 @@ class Switch(NetworkDevice):
         mode = ''
         command = 'sh int switchport'
         UpdateMetric('Switch._classify_ports')
-        if data:
-            rBuffer = data.strip()
+        if data is not None:
+            spLines = iter_lines(data)
         else:
             if self.state not in self.goodstates:
                 return
-            try:
-                rBuffer = self.execute(command)
-            except:
-                raise
+            spLines = self.execute_iter(command)
 
-        spLines = rBuffer.splitlines()
         DebugPrint('Switch.ports: {0}'.format(self.ports))
         for line in spLines:
             if 'Name:' in line:
-                name = format_interface_name(line.split()[-1])
+                name = line.split()[-1]
+                name = try_normalize(name, default=name)
                 switchport = ''
                 mode = ''
             elif 'Switchport:' in line:
@@ -812,17 +1123,15 @@ class Switch(NetworkDevice):
                 mode = line.split()[-1]
 #                if switchport == 'Enabled' and mode == 'access':
                 DebugPrint('Classifying {0}'.format(name))
-                try:
-                    i = self.ports.index(name)
-                except:
+                port = self.ports.get(name)
+                if port is None:
                     DebugPrint('TRYING TO CLASSIFY PORT {0} THAT DOESN\'T'
                                ' EXIST ON {1}'.format(name, self.ip), 3)
                     continue
-                port = self.ports[i]
                 port.switchportMode = mode
                 port.switchport = switchport
 
-    def _collect_interface_descriptions(self, data=False):
+    def _collect_interface_descriptions(self, data=None):
         """
             Apply existing interface descriptions to
             switch.ports[] ex. switch.ports[1].description = 'Trunk to
@@ -833,22 +1142,24 @@ class Switch(NetworkDevice):
         if not (self.state in self.goodstates):
             return
 
-        try:
-            rBuffer = self.execute(command)
-        except:
-            raise
-        spLines = rBuffer.splitlines()[1:]
+        if data is not None:
+            spLines = list(iter_lines(data))[1:]
+        else:
+            spLines = list(self.execute_iter(command))[1:]
+        # 'sh int description' lists each port once, by short name
+        byName = {}
+        for line in spLines:
+            words = line.split(None, 1)
+            if words:
+                byName.setdefault(short_interface_key(words[0]), line)
         for switchport in self.ports:
-            name = format_interface_name(str(switchport), short=True)
-            try:
-                line = next(x for x in spLines if name in x)
-            except StopIteration:
-                #print 'Unexpected StopIteration!'
-                #print 'switch =', self.ip
-                #print 'Port = ', name
-                #print 'Data:'
-                #print spLines
-                raise Exception('Failure in _collect_interface_descriptions')
+            line = byName.get(short_interface_key(str(switchport)))
+            if line is None:
+                DebugPrint('[{0}]._collect_interface_descriptions: no '
+                           'description line for {1}'
+                           ''.format(self.ip, switchport), 1)
+                switchport.description = ''
+                continue
 
             spLine = re.split('\s\s+', line)
             if len(spLine) >= 4:
@@ -858,42 +1169,63 @@ class Switch(NetworkDevice):
             switchport.description = description
 
     def _get_end_devices(self):
-        rslt = []
-        scrubbedInterfaceList = []
-        scrubbedMACAddressTable = []
-
+        """
+            Return an EndDevice for each MAC learned on an edge port, and
+            attach them to self.devices and each port's devices.  A MAC
+            learned on more than one port is reported by deduplicate_list()
+            and kept on the last port it showed up on.
+        """
+        edgePorts = {}
         for port in self.ports:
             metrics.DebugPrint('[{0}].[{1}].edge:  {2}'.format(self.ip,
                                                                port.name,
                                                                port.edge))
             if port.edge:
-                scrubbedInterfaceList.append(port)
-        DebugPrint('[{0}]._get_end_devices.len(scrubbedInterfaceList): {1}'
-                   ''.format(self.ip, len(scrubbedInterfaceList)), 1)
-        DebugPrint('[{0}]._get_end_devices.scrubbedInterfaceList: {1}'
-                   ''.format(self.ip, scrubbedInterfaceList), 0)
-
-        macAddressTable = self.mac_table
+                name = str(port)
+                edgePorts[try_normalize(name, short=True,
+                                        default=name)] = port
+        DebugPrint('[{0}]._get_end_devices.len(edgePorts): {1}'
+                   ''.format(self.ip, len(edgePorts)), 1)
+        DebugPrint('[{0}]._get_end_devices.edgePorts: {1}'
+                   ''.format(self.ip, edgePorts.values()), 0)
+
+        # One pass over the MAC table, grouped by (short) port name
+        macsByPort = {}
+        entries = parse_mac_table(self.mac_table)
+        for vlan, mac, port in entries:
+            if port in edgePorts:
+                macsByPort.setdefault(port, []).append((vlan, mac))
         DebugPrint('[{0}]._get_end_devices.len(macAddressTable): {1}'
-                   ''.format(self.ip, len(macAddressTable.splitlines())), 1)
-        DebugPrint('[{0}]._get_end_devices.macAddressTable: {1}'
-                   ''.format(self.ip, macAddressTable), 0)
-
-        for interface in scrubbedInterfaceList:
-            for line in macAddressTable.splitlines():
-                if line.strip().endswith(format_interface_name(str(interface),
-                                                             short=True)):
-                    scrubbedMACAddressTable.append(line.strip())
-
-        for line in scrubbedMACAddressTable:
-            mac = format_mac_address(line.split()[1])
-            port = line.split()[-1]
-            ed = EndDevice()
-            ed.mac = mac
-            ed.switch = self
-            ed.switchport = port
-            rslt.append(ed)
+                   ''.format(self.ip, len(entries)), 1)
+
+        rslt = []
+        for port in self.ports:  # same order as the port list
+            name = str(port)
+            for vlan, mac in macsByPort.get(try_normalize(name, short=True,
+                                                          default=name), []):
+                ed = EndDevice(mac=mac, vlan=vlan)
+                ed._switchport = port
+                rslt.append(ed)
         rslt = deduplicate_list(rslt, 'returning from _get_end_devices')
+
+        # Attach directly rather than through the EndDevice setters, which
+        # search the device lists one at a time.
+        known = dict((device, n) for n, device in enumerate(self.devices))
+        portDevices = {}
+        for ed in rslt:
+            ed._switch = self
+            n = known.get(ed)
+            if n is None:
+                known[ed] = len(self.devices)
+                self.devices.append(ed)
+            else:
+                self.devices[n] = ed
+            port = ed._switchport
+            if id(port) not in portDevices:
+                portDevices[id(port)] = set(port.devices)
+            if ed not in portDevices[id(port)]:
+                portDevices[id(port)].add(ed)
+                port.devices.append(ed)
         return rslt
 
     def __repr__(self):
@@ -910,6 +1242,465 @@ class Switch(NetworkDevice):
         return not (self == other)
 
 
+class InterfaceCounters(object):
+    """
+        Compact record of the counters 'show interface' gives for one port.
+        Values live in a single fixed-size list, indexed through KEYS.  Reads
+        like a (read-mostly) dict: stats['InputBytes'], sorted(stats), etc.
+        Counters the device didn't report raise KeyError, same as a dict.
+    """
+    KEYS = ('StatDuration', '5MinInputBPS', '5MinInputPPS', '5MinOutputBPS',
+            '5MinOutputPPS', 'InputPackets', 'InputBytes', 'OutputPackets',
+            'OutputBytes', 'InputErrors', 'OutputErrors')
+    INDEX = dict((key, i) for i, key in enumerate(KEYS))
+    __slots__ = ('values', )
+
+    def __init__(self):
+        self.values = [None] * len(self.KEYS)
+
+    def __getitem__(self, key):
+        value = self.values[self.INDEX[key]]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.values[self.INDEX[key]] = value
+
+    def get(self, key, default=None):
+        value = self.values[self.INDEX[key]]
+        return default if value is None else value
+
+    def keys(self):
+        return [k for k, v in zip(self.KEYS, self.values) if v is not None]
+
+    def items(self):
+        return [(k, v) for k, v in zip(self.KEYS, self.values)
+                if v is not None]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return 'InterfaceCounters({0})'.format(dict(self.items()))
+
+
+# Fast path for parse_interface_detail(): every counter we keep, in the order
+# IOS prints them, matched by one regex over the whole block.
+_DETAIL_FAST = re.compile(
+    r'Last clearing of [^\n]* counters (\S+)'
+    r'.*?5 minute input rate (\d+) bits/sec, (\d+) packets/sec'
+    r'.*?5 minute output rate (\d+) bits/sec, (\d+) packets/sec'
+    r'.*?\n\s*(\d+) packets input, (\d+) bytes'
+    r'.*?\n\s*(\d+) input errors'
+    r'.*?\n\s*(\d+) packets output, (\d+) bytes'
+    r'.*?\n\s*(\d+) output errors', re.S)
+_DETAIL_FAST_FIELDS = [InterfaceCounters.INDEX[field] for field in (
+    '5MinInputBPS', '5MinInputPPS', '5MinOutputBPS', '5MinOutputPPS',
+    'InputPackets', 'InputBytes', 'InputErrors', 'OutputPackets',
+    'OutputBytes', 'OutputErrors')]
+
+# Slow path, for blocks that are missing counters or print them in some other
+# order.  Lines are dispatched on their first word, or on their second word if
+# the first is a number ("0 input errors"), then matched against each (regex,
+# fields) pair for that word.  Each group in the regex fills the counter named
+# in the same position of fields.
+_DETAIL_TABLE = {
+    'Last': [(r'Last clearing of .* counters (\S+)', ['StatDuration'])],
+    'minute': [(r'5 minute input rate (\d+) bits/sec, (\d+) packets/sec',
+                ['5MinInputBPS', '5MinInputPPS']),
+               (r'5 minute output rate (\d+) bits/sec, (\d+) packets/sec',
+                ['5MinOutputBPS', '5MinOutputPPS'])],
+    'packets': [(r'(\d+) packets input, (\d+) bytes',
+                 ['InputPackets', 'InputBytes']),
+                (r'(\d+) packets output, (\d+) bytes',
+                 ['OutputPackets', 'OutputBytes'])],
+    'input': [(r'(\d+) input errors', ['InputErrors'])],
+    'output': [(r'(\d+) output errors', ['OutputErrors'])],
+}
+# Precompile: regex -> [(index into InterfaceCounters.values, converter)]
+for _parsers in _DETAIL_TABLE.values():
+    for _n, (_regex, _fields) in enumerate(_parsers):
+        _parsers[_n] = (re.compile(_regex),
+                        [(InterfaceCounters.INDEX[field],
+                          str if field == 'StatDuration' else int)
+                         for field in _fields])
+
+
+def _parse_detail_lines(lines, values):
+    """Slow path for parse_interface_detail(), one line at a time"""
+    table = _DETAIL_TABLE
+    for line in lines:
+        words = line.split(None, 2)
+        if not words:
+            continue
+        key = words[0]
+        if key.isdigit() and len(words) > 1:
+            key = words[1]
+        parsers = table.get(key)
+        if parsers is None:
+            continue
+        for regex, fields in parsers:
+            match = regex.match(line.lstrip())
+            if match is None:
+                continue
+            for (index, convert), value in zip(fields, match.groups()):
+                values[index] = convert(value)
+            break
+
+
+def parse_interface_detail(detail):
+    """
+       Parse one interface block of 'show interface'.
+       Returns (name, status, description, InterfaceCounters); name, status
+       and description are None if the block didn't include them.
+    """
+    detail = detail.strip()
+    name = status = description = None
+    counters = InterfaceCounters()
+    values = counters.values
+
+    header = detail.split('\n', 1)[0]
+    if 'line protocol' in header:
+        words = header.split()
+        name = words[0]
+        status = [x.lower() for x in words
+                  if x.lower() in ['up', 'down']][-1]
+
+    start = detail.find('\n  Description: ')
+    if start >= 0:
+        end = detail.find('\n', start + 1)
+        line = detail[start:end] if end >= 0 else detail[start:]
+        description = ' '.join(line.split()[1:])
+
+    match = _DETAIL_FAST.search(detail)
+    if match is None:
+        _parse_detail_lines(detail.splitlines()[1:], values)
+    else:
+        groups = match.groups()
+        values[0] = groups[0]  # StatDuration
+        for index, value in zip(_DETAIL_FAST_FIELDS, groups[1:]):
+            values[index] = int(value)
+    return name, status, description, counters
+
+
+# Free and total bytes of a switch's flash, from 'dir'
+FlashSpace = namedtuple('FlashSpace', 'free, total')
+
+# Everything the Switch properties want from 'sh ver', parsed once.
+# model, software_version and license are 'UNK' when not found, ram is '' and
+# uptime and hostname None; stack_members holds one line per member of the
+# stack table.
+VersionInfo = namedtuple('VersionInfo', 'model, software_version, license, '
+                                        'ram, stack_members, uptime, hostname')
+
+_VERSION_XE = re.compile(r'Version.*RELEASE')
+_VERSION = re.compile(r'Version.*,')
+_VERSION_LICENSE = re.compile(r'\(..*\),')
+_VERSION_RAM_WORD = re.compile(r'[^K/0-9.]').search
+
+
+def parse_version(data):
+    """
+        Given 'sh ver' output, return a VersionInfo.
+    """
+    version = data or ''
+    lines = version.splitlines()
+    model = 'UNK'
+    ram = ''
+    uptime = None
+    hostname = None
+    stack_members = []
+    stackable = False
+    for line in lines:
+        if stackable:
+            if not line.strip():
+                stackable = False
+            elif '-' not in line.split()[0]:
+                stack_members.append(line)
+            continue
+        lower = line.lower()
+        if model == 'UNK' and 'bytes of' in lower:
+            model = line.split()[1]
+        if ram == '' and ('bytes of memory' in line or
+                          'bytes of physical memory' in line):
+            # looking for '#####K' or '#####K/#####K' etc.
+            for word in line.split():
+                if 'K' in word and not _VERSION_RAM_WORD(word):
+                    ram = sum(int(x.strip('K')) for x in word.split('/'))
+                    break
+        if uptime is None and ' uptime is ' in line:
+            hostname, uptime = [x.strip() for x in
+                                line.split(' uptime is ', 1)]
+        if not stack_members and 'switch ports model' in lower:
+            stackable = True
+
+    regex = _VERSION_XE if 'IOS-XE' in version else _VERSION
+    found = regex.findall(version)
+    if found and len(found[0].strip(',').split()) > 1:
+        software_version = found[0].strip(',').split()[1]
+    else:
+        software_version = 'UNK'
+
+    found = _VERSION_LICENSE.findall(version)
+    license = found[0] if found else 'UNK'
+    # sanity checks, if we're not sure, just suppress.
+    if license != 'UNK':
+        if any(license.count(char) > 1 for char in ['(', ')', ',']):
+            license = 'UNK'
+        elif '-' in license:
+            license = license.split('-')[1]
+        else:
+            license = 'UNK'
+
+    return VersionInfo(model, software_version, license, ram, stack_members,
+                       uptime, hostname)
+
+
+# CDP capability names (lowercase) -> bit in CDPNeighbor.flags
+CDP_CAPABILITIES = {
+    'router': 0x01,
+    'trans-bridge': 0x02,
+    'source-route-bridge': 0x04,
+    'switch': 0x08,
+    'host': 0x10,
+    'igmp': 0x20,
+    'repeater': 0x40,
+    'phone': 0x80,
+    'remote': 0x100,
+    'cvta': 0x200,
+    'two-port': 0x400,
+}
+# Neighbors that make a port not an edge port
+CDP_NETWORK_DEVICE = CDP_CAPABILITIES['router'] | CDP_CAPABILITIES['switch']
+
+
+def capability_flags(capabilities):
+    """Given a list of CDP capability names, return them as a bitmask"""
+    flags = 0
+    for capability in capabilities:
+        flags |= CDP_CAPABILITIES.get(capability.lower(), 0)
+    return flags
+
+
+class CDPNeighbor(object):
+    """
+        One entry of 'sh cdp ne det'.  Indexes like the tuple it replaces:
+        (deviceID, ip, capabilities, port), with ip the first of addresses.
+        flags holds the capabilities as a CDP_CAPABILITIES bitmask.
+    """
+    __slots__ = ('deviceID', 'addresses', 'platform', 'capabilities',
+                 'flags', 'interface', 'port')
+
+    def __init__(self, deviceID=None, addresses=None, platform=None,
+                 capabilities=None, interface=None, port=None):
+        self.deviceID = deviceID
+        self.addresses = addresses or []
+        self.platform = platform
+        self.capabilities = capabilities or []
+        self.flags = capability_flags(self.capabilities)
+        self.interface = interface  # ours
+        self.port = port  # theirs
+
+    @property
+    def ip(self):
+        return self.addresses[0] if self.addresses else None
+
+    def __getitem__(self, index):
+        return (self.deviceID, self.ip, self.capabilities, self.port)[index]
+
+    def __len__(self):
+        return 4
+
+    def __iter__(self):
+        return iter((self.deviceID, self.ip, self.capabilities, self.port))
+
+    def __repr__(self):
+        return ('CDPNeighbor(deviceID={0}, addresses={1}, capabilities={2}, '
+                'interface={3}, port={4})'
+                ''.format(self.deviceID, self.addresses, self.capabilities,
+                          self.interface, self.port))
+
+
+# The 'sh cdp ne det' lines we keep, by their first two characters
+_CDP_LINES = {
+    'De': re.compile(r'Device ID:(.*)'),
+    'IP': re.compile(r'IP(?:v6)? address: *(\S+)'),
+    'Pl': re.compile(r'Platform: *([^,]*), *Capabilities:(.*)'),
+    'In': re.compile(r'Interface: *([^,]*), *Port ID \(outgoing port\):(.*)'),
+}
+
+
+def parse_cdp_neighbors(data):
+    """
+        Given 'sh cdp ne det' output, return a list of CDPNeighbor, one per
+        entry, in order.  Every entry (and management) address is kept.
+    """
+    rslt = []
+    neighbor = None
+    lineRegexes = _CDP_LINES
+    for line in iter_lines(data):
+        line = line.lstrip()
+        regex = lineRegexes.get(line[:2])
+        if regex is None:
+            continue
+        m = regex.match(line)
+        if m is None:
+            continue
+        key = line[:2]
+        if key == 'De':
+            neighbor = CDPNeighbor(deviceID=''.join(m.group(1).split()))
+            rslt.append(neighbor)
+        elif neighbor is None:
+            continue
+        elif key == 'IP':
+            if m.group(1) not in neighbor.addresses:
+                neighbor.addresses.append(m.group(1))
+        elif key == 'Pl':
+            neighbor.platform = m.group(1).strip()
+            neighbor.capabilities = m.group(2).split()
+            neighbor.flags = capability_flags(neighbor.capabilities)
+        else:
+            neighbor.interface = m.group(1).strip()
+            neighbor.port = m.group(2).strip()
+    return rslt
+
+
+class PortTable(list):
+    """
+        List of SwitchPorts, in switch order, that also keeps dict indexes by
+        long name, short name and ifIndex.  `name in ports`,
+        ports.index(name) and ports.get(name) are O(1) and take any form of
+        the name ('Gi1/0/1', 'GigabitEthernet1/0/1', a SwitchPort).
+
+        Appending keeps the indexes current; any other change to the list
+        rebuilds them on the next lookup.  Call reindex() after renaming a
+        port that is already in the table.
+    """
+
+    # Class level so unpickling (which appends before restoring __dict__)
+    # starts out unindexed
+    _byName = None
+    _byIfIndex = None
+
+    def __init__(self, ports=()):
+        list.__init__(self, ports)
+        self._byName = None
+        self._byIfIndex = {}
+
+    def reindex(self):
+        self._byName = {}
+        self._byIfIndex = {}
+        for position, port in enumerate(self):
+            self._index_port(position, port)
+
+    def _index_port(self, position, port):
+        name = str(port)
+        byName = self._byName
+        byName.setdefault(name, position)
+        forms = _interface_forms(name) if name else None
+        if forms is not None:
+            byName.setdefault(forms[0], position)
+            byName.setdefault(forms[1], position)
+        ifIndex = getattr(port, 'ifIndex', None)
+        if ifIndex is not None:
+            self._byIfIndex.setdefault(ifIndex, position)
+
+    def _position(self, name):
+        if self._byName is None:
+            self.reindex()
+        name = str(name)
+        position = self._byName.get(name)
+        if position is None and name:
+            forms = _interface_forms(name)
+            if forms is not None:
+                position = self._byName.get(forms[1])
+        return position
+
+    def get(self, name, default=None):
+        position = self._position(name)
+        return default if position is None else self[position]
+
+    def by_ifindex(self, ifIndex, default=None):
+        if self._byName is None:
+            self.reindex()
+        position = self._byIfIndex.get(ifIndex)
+        if position is None:
+            # ifIndex is usually learned after the port was added
+            self.reindex()
+            position = self._byIfIndex.get(ifIndex)
+        return default if position is None else self[position]
+
+    def index(self, name, *args):
+        position = self._position(name)
+        if position is None or args:
+            return list.index(self, name, *args)
+        return position
+
+    def __contains__(self, name):
+        return self._position(name) is not None
+
+    def append(self, port):
+        list.append(self, port)
+        if self._byName is not None:
+            self._index_port(len(self) - 1, port)
+
+    def extend(self, ports):
+        for port in ports:
+            self.append(port)
+
+    def __iadd__(self, ports):
+        self.extend(ports)
+        return self
+
+    # Anything else that changes positions drops the indexes
+    def _invalidate(self):
+        self._byName = None
+        self._byIfIndex = None
+
+    def __setitem__(self, *args):
+        self._invalidate()
+        return list.__setitem__(self, *args)
+
+    def __delitem__(self, *args):
+        self._invalidate()
+        return list.__delitem__(self, *args)
+
+    def __setslice__(self, *args):
+        self._invalidate()
+        return list.__setslice__(self, *args)
+
+    def __delslice__(self, *args):
+        self._invalidate()
+        return list.__delslice__(self, *args)
+
+    def insert(self, *args):
+        self._invalidate()
+        return list.insert(self, *args)
+
+    def remove(self, *args):
+        self._invalidate()
+        return list.remove(self, *args)
+
+    def pop(self, *args):
+        self._invalidate()
+        return list.pop(self, *args)
+
+    def sort(self, *args, **kwargs):
+        self._invalidate()
+        return list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._invalidate()
+        return list.reverse(self)
+
+
 class SwitchPort(object):
     """
         Represent ports attached to a Switch.  Contains
@@ -920,7 +1711,7 @@ class SwitchPort(object):
     def __init__(self, name=None, switch=None, switchportMode=None,
                  detail=None):
         # str ip, Switch switch
-        self.stats = {}
+        self.stats = InterfaceCounters()
         self.switchportMode = switchportMode
         self.CDPneigh = []
         self.devices = []
@@ -929,6 +1720,7 @@ class SwitchPort(object):
         self._detail = ''
         self.status = ''
         self.description = ''
+        self.ifIndex = None
         self._name = None
         if detail:
             self.detail = detail
@@ -976,8 +1768,9 @@ class SwitchPort(object):
     def name(self, value):
         if value is None:
             self._name = value
-        else:
-            self._name = format_interface_name(value)
+            return
+        # Loopback0, Null0, etc... keep their raw name
+        self._name = try_normalize(value, default=value)
 
     @property
     def switchportMode(self):
@@ -1002,44 +1795,17 @@ class SwitchPort(object):
 
     @detail.setter
     def detail(self, value):
-        UpdateMetric('SwitchportSetDetail')
         if type(value) is not str and not (len(value) > 0):
             raise Exception('can\'t set \'SwitchPort({0}).detail with '
                             '{1}'.format(self, type(value)))
 
         self._detail = value
-        lines = value.strip().splitlines()
-        try:
-            for line in lines:
-                lsplit = line.split()
-                if 'line protocol' in line:
-                    self.name = line.split()[0]
-                    status = [x.lower() for x in line.split()
-                              if x.lower() in ['up', 'down']][-1]
-                    self.status = status
-                elif 'Last clearing of' in line:
-                    self.stats['StatDuration'] = lsplit[-1]
-                elif '5 minute input' in line:
-                    self.stats['5MinInputBPS'] = int(lsplit[4])
-                    self.stats['5MinInputPPS'] = int(lsplit[-2])
-                elif '5 minute output' in line:
-                    self.stats['5MinOutputBPS'] = int(lsplit[4])
-                    self.stats['5MinOutputPPS'] = int(lsplit[-2])
-                elif 'packets input' in line:
-                    self.stats['InputPackets'] = int(lsplit[0])
-                    self.stats['InputBytes'] = int(lsplit[3])
-                elif 'packets output' in line:
-                    self.stats['OutputPackets'] = int(lsplit[0])
-                    self.stats['OutputBytes'] = int(lsplit[3])
-                elif 'input errors' in line:
-                    self.stats['InputErrors'] = int(lsplit[0])
-                elif 'output errors' in line:
-                    self.stats['OutputErrors'] = int(lsplit[0])
-                elif 'Description:' in line:
-                    self.description = ' '.join(lsplit[1:])
-        except Exception as e:
-            #print self._detail
-            raise e
+        name, status, description, self.stats = parse_interface_detail(value)
+        if name is not None:
+            self.name = name
+            self.status = status
+        if description is not None:
+            self.description = description
 
     def _get_edge(self, CDPneigh=[], switchportMode='access'):
         """
@@ -1049,9 +1815,11 @@ class SwitchPort(object):
             'switchport mode == access'
         """
         for neighbor in CDPneigh:
-            nlist = ' '.join(neighbor[2]).lower()
-            if (('switch' in nlist) or
-                    ('router' in nlist)):
+            # CDPNeighbor has flags precomputed, plain tuples don't
+            flags = getattr(neighbor, 'flags', None)
+            if flags is None:
+                flags = capability_flags(neighbor[2])
+            if flags & CDP_NETWORK_DEVICE:
                 return False
 
         if not (switchportMode.lower() in ['access', 'unknown']):
@@ -1083,6 +1851,8 @@ def process_end_devices(switches, creds=None, defaultgateway=None, maxThreads=1)
     """
         call _get_end_devices for given host(s), resolve IPs and DNS information
         return list
+        defaultgateway is anything ARPCache.add_gateways() takes, e.g.
+        '10.1.20.1=20+21,10.1.30.1=10.1.30.0/24' for one gateway per VLAN.
     """
     metrics.DebugPrint('sshutil.py:process_end_devices()', 2)
     metrics.DebugPrint('::hosts:{0}\n::defaultgateway:{1}\n::maxThreads:{2}'
@@ -1116,95 +1886,392 @@ def process_end_devices(switches, creds=None, defaultgateway=None, maxThreads=1)
         DebugPrint('process_end_devices.NoEndDevicesFound!', 3)
         return []
 
-    if defaultgateway is None:
+    if defaultgateway is not None:
+        ARP_CACHE.add_gateways(defaultgateway)
+    if not ARP_CACHE.gateways:
         DebugPrint('No default gateway.  Skipping IP and DNS resolution!', 3)
         return endDevices
 
     DebugPrint('Resolving MAC addresses', 2)
+    if ARP_CACHE.creds is None:
+        ARP_CACHE.creds = creds
+    ARP_CACHE.refresh()  # every gateway at once, rather than on demand
     for endDevice in endDevices:
-        endDevice.ip = resolve_mac(endDevice.mac)
+        ip = ARP_CACHE.resolve(endDevice.mac, endDevice.vlan)
+        endDevice.ip = 'Not Found' if ip is None else ip
 
     DebugPrint('Resolving DNS names', 2)
     resolve_ips_mt(endDevices, maxThreads)
     return endDevices
 
 
+def _is_ipv4(ip):
+    try:
+        socket.inet_aton(ip)
+    except (socket.error, TypeError):
+        return False
+    return ip.count('.') == 3
+
+
+class DNSResolver(object):
+    """
+        Reverse DNS, cached.  Names are kept for ttl seconds, failed lookups
+        (no PTR record) for negativeTTL.  Lookups run on a thread pool and
+        each gets at most timeout seconds once it's running; one that runs
+        over is cached as failed, but left to finish and replace that with
+        its answer.
+        With a path, the cache is loaded from and saved to that (JSON) file.
+    """
+    def __init__(self, path=None, ttl=24 * 3600, negativeTTL=3600,
+                 timeout=2.0, maxThreads=16):
+        self.path = path
+        self.ttl = ttl
+        self.negativeTTL = negativeTTL
+        self.timeout = timeout
+        self.maxThreads = maxThreads
+        self._cache = {}  # ip -> (expires, name), name '' if none
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as fIn:
+                entries = json.load(fIn)
+        except (IOError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            for ip, (expires, name) in entries.iteritems():
+                if expires > now:
+                    self._cache[str(ip)] = (expires, str(name))
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = dict(self._cache)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fOut:
+            json.dump(entries, fOut)
+        os.rename(tmp, self.path)
+
+    def cached(self, ip):
+        """Cached name for ip ('' for a cached failure), None if not cached"""
+        entry = self._cache.get(ip)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    def _lookup(self, ip):
+        UpdateMetric('DNSResolver.lookup')
+        DebugPrint('Resolving IP: ' + str(ip), 0)
+        try:
+            name = socket.gethostbyaddr(ip)[0]
+        except (socket.error, UnicodeError):  # herror, gaierror included
+            name = ''
+        ttl = self.ttl if name else self.negativeTTL
+        with self._lock:
+            self._cache[ip] = (time.time() + ttl, name)
+        return name
+
+    def resolve(self, ip):
+        return self.resolve_many([ip])[ip]
+
+    def resolve_many(self, ips, maxThreads=None):
+        """
+        {ip: name} for each of ips, '' where there's no name (or no answer
+        in time).  Each distinct IP is looked up at most once, and anything
+        that isn't an IPv4 address ('Not Found', None) isn't looked up.
+        """
+        rslt = {}
+        misses = []
+        for ip in set(ips):
+            name = self.cached(ip) if _is_ipv4(ip) else ''
+            if name is None:
+                misses.append(ip)
+            else:
+                UpdateMetric('DNSResolver.hit')
+                rslt[ip] = name
+        if misses:
+            threads = max(1, min(maxThreads or self.maxThreads, len(misses)))
+            # every lookup gets timeout seconds once it has a thread
+            waves = (len(misses) + threads - 1) // threads
+            started = time.time()
+            deadline = started + waves * self.timeout
+            pool = multiprocessing.pool.ThreadPool(threads)
+            late = []
+            try:
+                pending = [(ip, pool.apply_async(self._lookup, (ip, )))
+                           for ip in misses]
+                for ip, result in pending:
+                    try:
+                        rslt[ip] = result.get(max(deadline - time.time(), 0))
+                    except multiprocessing.TimeoutError:
+                        late.append(ip)
+            finally:
+                if late:  # don't wait on them; a late answer still lands
+                    pool.terminate()
+                else:
+                    pool.close()
+                    pool.join()
+            for ip in late:
+                UpdateMetric('DNSResolver.timeout')
+                DebugPrint('DNS lookup of {0} timed out'.format(ip), 1)
+                rslt[ip] = ''
+                with self._lock:
+                    entry = self._cache.get(ip)
+                    # only if the lookup hasn't answered since it started
+                    if entry is None or entry[0] <= started:
+                        self._cache[ip] = (time.time() + self.negativeTTL,
+                                           '')
+                    else:
+                        rslt[ip] = entry[1]
+            self.save()
+        return rslt
+
+DNS_RESOLVER = DNSResolver()
+
+
 def resolve_ip(ip):
     """
         Given an IP address, return appropriate DNS entry, if any
     """
-    try:
-        DebugPrint('Resolving IP: ' + str(ip), 0)
-        dns = (socket.gethostbyaddr(ip))[0]
-    except:
-        dns = ''
-    return dns
+    return DNS_RESOLVER.resolve(ip)
 
 
 def resolve_ips_mt(endDevices, maxThreads=4):
 
     """
-        Given list of clEndDevices, use pool of subprocesses
-        (count determined by MAX_THREADS) to call resolve_ip()
+        Given list of clEndDevices, resolve each one's IP through
+        DNS_RESOLVER, maxThreads lookups at a time.
     """
-    ips = []
-    dns = []
     DebugPrint('resolve_ips_mt.maxThreads: ' + str(maxThreads))
     DebugPrint('resolve_ips_mt.endDevices: ' + str(endDevices), 0)
+    names = DNS_RESOLVER.resolve_many([ed.ip for ed in endDevices],
+                                      maxThreads)
     for ed in endDevices:
-        ips.append(ed.ip)
-    DebugPrint('resolve_ips_mt.IPs: ' + str(ips), 0)
-    pool_size = maxThreads
-    pool = multiprocessing.Pool(processes=pool_size)
-    dns = pool.map(resolve_ip, ips)
-    pool.close()
-    pool.join()
-    for n in range(len(ips)):
-        if ips[n] == endDevices[n].ip:  # sanity check
-            endDevices[n].dns = dns[n]
+        ed.dns = names[ed.ip]
+
+
+def _ipv4(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+
+def _parse_subnet(subnet):
+    """'10.1.0.0/16' -> (network, mask) as ints"""
+    network, _, bits = subnet.partition('/')
+    bits = int(bits or 32)
+    mask = (0xffffffff << (32 - bits)) & 0xffffffff
+    return _ipv4(network) & mask, mask
+
+
+class ARPCache(object):
+    """
+        Parsed 'sh arp' tables, one per gateway, each good for ttl seconds.
+        A gateway can be limited to some VLANs and/or subnets; lookups go to
+        the gateways that claim the VLAN (or IP) first, and on to the rest
+        if those don't have it.  Lookups are dict hits, 'last 4' fragments
+        included.
+    """
+    def __init__(self, creds=None, ttl=300, maxThreads=8):
+        self.creds = creds
+        self.ttl = ttl
+        self.maxThreads = maxThreads
+        self._gateways = []  # [(gateway, vlans, subnets)], in order added
+        self._tables = {}  # gateway -> (pulled, byMAC, byTail, byIP)
+        self._lock = threading.Lock()
+
+    @property
+    def gateways(self):
+        return [gateway for gateway, _, _ in self._gateways]
+
+    def add_gateway(self, gateway, vlans=None, subnets=None):
+        """Use gateway for vlans / subnets ('10.1.0.0/16'), or for anything"""
+        vlans = frozenset(str(vlan) for vlan in vlans) if vlans else None
+        subnets = [_parse_subnet(subnet) for subnet in subnets or []] or None
+        with self._lock:
+            self._gateways = [entry for entry in self._gateways
+                              if entry[0] != gateway]
+            self._gateways.append((gateway, vlans, subnets))
+
+    def add_gateways(self, spec):
+        """
+        Add gateways from a list, or a string like
+            '10.1.20.1=20+21,10.1.30.1=10.1.30.0/24,10.1.1.1'
+        i.e. comma separated gateways, each optionally followed by '=' and
+        '+' separated VLANs and subnets it serves.
+        """
+        if isinstance(spec, basestring):
+            spec = spec.split(',')
+        for entry in spec:
+            gateway, _, selectors = entry.strip().partition('=')
+            selectors = [x for x in selectors.split('+') if x]
+            self.add_gateway(gateway,
+                             [x for x in selectors if '.' not in x],
+                             [x for x in selectors if '.' in x])
+
+    def gateways_for(self, vlan=None, ip=None):
+        chosen = []
+        if vlan is not None or ip is not None:
+            address = _ipv4(ip) if ip is not None else None
+            for gateway, vlans, subnets in self._gateways:
+                if vlan is not None and vlans and str(vlan) in vlans:
+                    chosen.append(gateway)
+                elif address is not None and subnets and any(
+                        address & mask == network
+                        for network, mask in subnets):
+                    chosen.append(gateway)
+        return chosen or self.gateways
+
+    def _search_order(self, chosen):
+        return chosen + [gateway for gateway in self.gateways
+                         if gateway not in chosen]
+
+    def _pull(self, gateway):
+        UpdateMetric('ARPCache.pull')
+        try:
+            data = NetworkDevice(ip=gateway, creds=self.creds).execute('sh arp')
+        except Exception:
+            DebugPrint("Couldn't pull ARP Table from gw: {0}"
+                       "".format(gateway), 3)
+            data = ''
+        byMAC, byIP = parse_arp_table(data)
+        byTail = {}
+        for mac, ip in byMAC.iteritems():
+            byTail.setdefault(mac.value & 0xffff, ip)
+        entry = (time.time(), byMAC, byTail, byIP)
+        with self._lock:
+            self._tables[gateway] = entry
+        return entry
+
+    def _fresh(self, gateway):
+        entry = self._tables.get(gateway)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry
+        return None
+
+    def table(self, gateway):
+        """(pulled, byMAC, byTail, byIP) for gateway, pulled if stale"""
+        return self._fresh(gateway) or self._pull(gateway)
+
+    def refresh(self, gateways=None, force=False):
+        """Pull every stale gateway (or all, with force), several at once"""
+        if gateways is None:
+            gateways = self.gateways
+        stale = [g for g in gateways if force or self._fresh(g) is None]
+        if len(stale) > 1 and self.maxThreads > 1:
+            pool = multiprocessing.pool.ThreadPool(
+                min(self.maxThreads, len(stale)))
+            try:
+                pool.map(self._pull, stale)
+            finally:
+                pool.close()
+                pool.join()
         else:
-            DebugPrint('Sanity Check failed during resolve_ips_mt()', 3)
-            pass
+            for gateway in stale:
+                self._pull(gateway)
+
+    def resolve(self, mac, vlan=None):
+        """IP for mac ('last 4' allowed), or None"""
+        mac = MACAddress(mac)
+        for gateway in self._search_order(self.gateways_for(vlan=vlan)):
+            _, byMAC, byTail, _ = self.table(gateway)
+            ip = (byMAC.get(mac) if mac.bits == 48
+                  else byTail.get(mac.value & 0xffff))
+            if ip is not None:
+                return ip
+        return None
 
+    def resolve_ip(self, ip):
+        """MACAddress for ip, or None"""
+        for gateway in self._search_order(self.gateways_for(ip=ip)):
+            mac = self.table(gateway)[3].get(ip)
+            if mac is not None:
+                return mac
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+ARP_CACHE = ARPCache()
 
-def resolve_mac(mac=None, defaultgateway=None, ip=None, creds=None):
+
+def resolve_mac(mac=None, defaultgateway=None, ip=None, creds=None,
+                vlan=None):
     """
         Given a MAC or IP address and the appropriate subnet default gateway,
         SSH into the default gateway and use arp table to resolve between MAC
         and IP
+        Tables are kept in ARP_CACHE, so every gateway given so far is
+        searched (see ARPCache.gateways_for()).
     """
-    lines = []
-    command = 'sh arp'
-    global ARP_TABLE
     if defaultgateway is None:
         defaultgateway = DEFAULT_GATEWAY
-    if defaultgateway is None:
+    if defaultgateway is not None and defaultgateway not in ARP_CACHE.gateways:
+        ARP_CACHE.add_gateways(defaultgateway)
+    if not ARP_CACHE.gateways:
         raise Exception('Default Gateway not set!')
     if creds is None:
         creds = CREDENTIALS
+    if ARP_CACHE.creds is None:
+        ARP_CACHE.creds = creds
     if not (mac or ip):
         raise Exception('No MAC or IP Address specified to resolve!')
-    # DebugPrint('resolve_mac.defaultgateway: ' + str(defaultgateway))
-    # DebugPrint('resolve_mac.creds[0]: ' + creds[0])
-    if ARP_TABLE == []:
-        UpdateMetric('resolve_mac')
+    UpdateMetric('resolve_mac')
+
+    if mac:
+        rslt = ARP_CACHE.resolve(mac, vlan)
+    else:
+        rslt = ARP_CACHE.resolve_ip(ip)
+    return "Not Found" if rslt is None else str(rslt)
+
+
+def parse_mac_table(data):
+    """
+        Given 'sh mac address-table' output, return a list of
+        (vlan, MACAddress, port) with port in short form ('Gi1/0/1').
+        Header and other lines that don't hold a MAC are skipped, as are
+        STATIC (and any other non-DYNAMIC) entries: CPU, router and
+        multicast MACs aren't devices plugged into the port.
+    """
+    rslt = []
+    for line in iter_lines(data):
+        words = line.split()
+        if words and words[0] == '*':  # some platforms flag entries
+            words = words[1:]
+        if len(words) < 3:
+            continue
+        if len(words) > 3 and words[2].isalpha() and \
+                words[2].lower() != 'dynamic':
+            continue
         try:
-            ARP_TABLE = sshrunP(command=command, host=defaultgateway,
-                                creds=creds)
-        except:
-            DebugPrint("Couldn't pull ARP Table from gw: {0}"
-                       "".format(defaultgateway), 3)
-            return "Not Found"
+            mac = MACAddress(words[1])
+        except ValueError:
+            continue
+        if mac.bits != 48:
+            continue
+        port = words[-1]
+        rslt.append((words[0], mac,
+                     try_normalize(port, short=True, default=port)))
+    return rslt
 
-        # print 'looking for' , mac , 'in\n', ARP_TABLE
-    target = mac or ip
-    lines = [l for l in ARP_TABLE.splitlines() if target in l]
 
-    if lines == [] or lines[0] == '':
-        return "Not Found"
-    else:
-        if mac:
-            rslt = lines[0].split()[1]
-        else:
-            rslt = lines[0].split()[3]
-        return rslt
+def parse_arp_table(data):
+    """
+        Given 'sh arp' output, return ({MACAddress: ip}, {ip: MACAddress}).
+        The first entry wins for a MAC with more than one IP.
+    """
+    byMAC, byIP = {}, {}
+    for line in iter_lines(data):
+        words = line.split()
+        if len(words) < 4 or words[0] != 'Internet':
+            continue
+        try:
+            mac = MACAddress(words[3])
+        except ValueError:  # Incomplete
+            continue
+        byMAC.setdefault(mac, words[1])
+        byIP[words[1]] = mac
+    return byMAC, byIP
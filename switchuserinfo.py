@@ -29,6 +29,7 @@ from sshutil import get_credentials
 from sshutil import Switch
 import sshutil
 import metrics
+import cmdcache
 
 DEFAULT_GATEWAY = None
 CREDENTIALS = None  # SET THESE IN MAIN()!
@@ -60,10 +61,16 @@ def createParser():
                       default='True')
     parser.add_option('-o', '--outfile', help='Primary output to listed file.')
     parser.add_option('-g', '--defaultgateway', help='Switch or router to use '
-                      'for MAC-> IP resolution (via ARP table lookup).')
+                      'for MAC-> IP resolution (via ARP table lookup).  '
+                      'Several may be given, comma separated, each optionally'
+                      ' limited to VLANs/subnets: 10.1.20.1=20+21,10.1.30.1='
+                      '10.1.30.0/24')
     parser.add_option('-v', '--verbose', action='count', help='Increase output'
                       ' verbosity (e.g., -vv is more than -v) up to 3.',
                       default=0)
+    parser.add_option('--dns-cache', dest='dns_cache', help='Keep reverse '
+                      'DNS answers in this file between runs.')
+    cmdcache.add_options(parser)
     return parser
 
 
@@ -103,6 +110,9 @@ def main(argv):
     MultiThreading = options.multithreading
     defaultGateway = options.defaultgateway
     outfile = options.outfile
+    cmdcache.configure(options)
+    if options.dns_cache:
+        sshutil.DNS_RESOLVER = sshutil.DNSResolver(options.dns_cache)
 
     if hostfile:
         if host:
@@ -5,8 +5,22 @@ Created on Jan 9, 2015
 @author: William.George
 '''
 
+import os
+import tempfile
+import threading
+import time
 import unittest
 import sshutil
+import sshexecute
+import cmdcache
+import snapshot
+import macindex
+import collector
+import cdpmap
+import macsearch
+import interfacestats
+import counterstore
+from contextlib import contextmanager
 from optparse import OptionParser
 
 
@@ -63,6 +77,18 @@ class sshutilFINtc(unittest.TestCase):
                 self.assertEqual(rslt, dirty, 'failed: {0} didn\'t return '
                                  '{1}'.format(rslt, dirty))
 
+    def test_FIN_unknown(self):
+        for dirty in ['Loopback0', 'Null0', 't1', 'em0', '---- ----']:
+            self.assertRaises(ValueError, sshutil.format_interface_name, dirty)
+            self.assertEqual(sshutil.try_normalize(dirty), None)
+            self.assertEqual(sshutil.try_normalize(dirty, default=dirty),
+                             dirty)
+        self.assertEqual(sshutil.try_normalize('gi1/0/1', short=True),
+                         'Gi1/0/1')
+        # Cached results are the same (interned) objects every time
+        self.assertTrue(sshutil.format_interface_name('Fa1/0/2') is
+                        sshutil.format_interface_name('Fa1/0/2'))
+
 
 class sshutilSwitchTC(unittest.TestCase):
 
@@ -115,6 +141,876 @@ class sshutilSwitchTC(unittest.TestCase):
         pass
 
 
+class sshutilInterfaceBlocksTC(unittest.TestCase):
+
+    def setUp(self):
+        self.sampleData = [
+            'Vlan1 is administratively down, line protocol is down ',
+            '  Hardware is EtherSVI, address is 0019.e8a4.a440',
+            '  Encapsulation ARPA, loopback not set',
+            'FastEthernet1/0/1 is up, line protocol is up (connected) ',
+            '  Description: Server is up, line protocol is up',
+            '     0 input errors, 0 CRC, 0 frame, 0 overrun, 0 ignored',
+            'Loopback0 is up, line protocol is up ',
+            '  Hardware is Loopback',
+        ]
+
+    def test_iter_interface_blocks(self):
+        blocks = list(sshutil.iter_interface_blocks(iter(self.sampleData)))
+        self.assertEqual([len(x) for x in blocks], [3, 3, 2],
+                         'bad block split: {0}'.format(blocks))
+        self.assertEqual([x[0].split()[0] for x in blocks],
+                         ['Vlan1', 'FastEthernet1/0/1', 'Loopback0'])
+        self.assertEqual(list(sshutil.iter_interface_blocks([])), [])
+
+    def test_descriptions_unknown_types(self):
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        sw._get_interfaces(data='\n'.join([
+            'GigabitEthernet1/0/1 is up, line protocol is up (connected) ',
+            '  Description: Uplink',
+            'Loopback0 is up, line protocol is up ',
+            '  Hardware is Loopback',
+            'AppGigabitEthernet1/0/1 is up, line protocol is up ',
+            '  Hardware is App-hosting Gigabit Ethernet']))
+        sw._collect_interface_descriptions(data='\n'.join([
+            'Interface                      Status         Protocol '
+            'Description',
+            'Gi1/0/1                        up             up       Uplink',
+            'Lo0                            up             up       '
+            'Router ID']))
+        self.assertEqual([port.description for port in sw.ports],
+                         ['Uplink', 'Router ID', ''])
+        self.assertEqual(sshutil.short_interface_key('Loopback0'), 'lo0')
+        self.assertEqual(sshutil.short_interface_key('Gi1/0/1'),
+                         sshutil.short_interface_key('GigabitEthernet1/0/1'))
+
+    def test_empty_output(self):
+        # '' is real (empty) output, not a reason to go ask the switch
+        def connect(*args, **kwargs):
+            raise Exception('should not connect')
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        sw.execute = sw.execute_iter = connect
+        sw._collect_version(data='')
+        sw._get_interfaces(data='')
+        sw.collect_mac_table(data='')
+        sw._collect_cdp_information(data='')
+        sw._classify_ports(data='')
+        sw._collect_interface_descriptions(data='')
+        self.assertEqual((sw.ports, sw.cdp_information), ([], {}))
+
+
+class sshutilMACAddressTC(unittest.TestCase):
+
+    def test_MACAddress(self):
+        mac = sshutil.MACAddress('0026.B9F0.095E')
+        for same in ['0026.b9f0.095e', '00:26:b9:f0:09:5e',
+                     '00-26-B9-F0-09-5E', '0026b9f0095e', 0x0026b9f0095e]:
+            self.assertEqual(mac, sshutil.MACAddress(same))
+            self.assertEqual(hash(mac), hash(sshutil.MACAddress(same)))
+        self.assertEqual(str(mac), '0026.b9f0.095e')
+        self.assertNotEqual(mac, sshutil.MACAddress('095e'))
+        self.assertTrue(mac.matches('095E'))
+        self.assertFalse(mac.matches('095f'))
+        for dirty in ['0026.b9f0', 'Incomplete', 'zz26.b9f0.095e',
+                      '0x26b9f0095e', '0x12', '+abc']:
+            self.assertRaises(ValueError, sshutil.MACAddress, dirty)
+        # only equal to MACAddresses, so == agrees with the hash
+        self.assertNotEqual(mac, '0026.b9f0.095e')
+        self.assertFalse('0026.b9f0.095e' in set([mac]))
+        self.assertTrue(sshutil.MACAddress('0026.b9f0.095e') in set([mac]))
+        self.assertEqual(mac.__lt__('0026.b9f0.095f'), NotImplemented)
+        self.assertTrue(sshutil.MACAddress('095e') < mac)
+
+    def test_EndDevice(self):
+        ed = sshutil.EndDevice(mac='0026.b9f0.095e', ip='10.0.0.5')
+        self.assertEqual(ed, sshutil.EndDevice(mac='0026b9f0095e'))
+        self.assertEqual(ed, '10.0.0.5')
+        self.assertEqual(ed, '0026.b9f0.095e')
+        self.assertEqual(len(set([ed, sshutil.EndDevice(mac='0026b9f0095e')])),
+                         1)
+
+
+    def test_get_end_devices(self):
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        sw.ports = ['Gi1/0/1', 'Gi1/0/11', 'Gi1/0/2']
+        sw.ports[2].CDPneigh.append(('sw2', '10.0.0.2', ['Switch'], 'Gi0/1'))
+        sw._mac_address_table = '\n'.join([
+            '  10    0026.b9f0.0001    DYNAMIC     Gi1/0/1',
+            '  10    0026.b9f0.0002    DYNAMIC     Gi1/0/11',
+            '  10    0026.b9f0.0003    DYNAMIC     Gi1/0/2',
+            '* 30    0026.b9f0.0004    dynamic     Gi1/0/11'])
+        rslt = sw._get_end_devices()
+        self.assertEqual([str(x) for x in rslt], ['0026.b9f0.0001',
+                                                  '0026.b9f0.0002',
+                                                  '0026.b9f0.0004'])
+        # Gi1/0/1 must not pick up Gi1/0/11's MACs
+        self.assertEqual(len(sw.ports[0].devices), 1)
+        self.assertEqual(len(sw.ports[1].devices), 2)
+        self.assertEqual(len(sw.devices), 3)
+        self.assertTrue(rslt[1].switchport is sw.ports[1])
+
+
+    def test_mac_locations(self):
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        sw.ports = ['Gi1/0/1', 'Gi1/0/48']
+        sw.ports[1].switchportMode = 'trunk'
+        sw._mac_address_table = '\n'.join([
+            '  10    0026.b9f0.0001    DYNAMIC     Gi1/0/1',
+            '  10    0026.b9f0.0002    DYNAMIC     Gi1/0/48',
+            ' All    0100.0ccc.cccc    STATIC      CPU',
+            '  10    0026.b9f0.0010    STATIC      Gi1/0/1',
+            '  10    0026.b9f0.0003    DYNAMIC     Po1'])
+        self.assertEqual([(str(mac), port, edge) for _, mac, port, edge in
+                          sw.mac_locations()],
+                         [('0026.b9f0.0001', 'Gi1/0/1', True),
+                          ('0026.b9f0.0002', 'Gi1/0/48', False),
+                          ('0026.b9f0.0003', 'Po1', True)])
+
+
+class sshutilARPCacheTC(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        cache = cmdcache.enable(self.path)
+        arp = ('Protocol  Address          Age (min)  Hardware Addr   Type'
+               '   Interface\n'
+               'Internet  {0}  5   {1}  ARPA   Vlan{2}\n')
+        cache.put('10.1.20.1', 'sh arp', arp.format('10.1.20.5',
+                                                    '0026.b9f0.0001', 20))
+        cache.put('10.1.30.1', 'sh arp', arp.format('10.1.30.5',
+                                                    '0026.b9f0.0002', 30))
+        self.arp = sshutil.ARPCache(creds=('user', 'pass'))
+        self.arp.add_gateways('10.1.20.1=20+21,10.1.30.1=10.1.30.0/24')
+
+    def tearDown(self):
+        cmdcache.disable()
+        os.remove(self.path)
+
+    def test_gateways_for(self):
+        self.assertEqual(self.arp.gateways, ['10.1.20.1', '10.1.30.1'])
+        self.assertEqual(self.arp.gateways_for(vlan='21'), ['10.1.20.1'])
+        self.assertEqual(self.arp.gateways_for(ip='10.1.30.9'), ['10.1.30.1'])
+        self.assertEqual(self.arp.gateways_for(vlan=99),
+                         ['10.1.20.1', '10.1.30.1'])
+
+    def test_resolve(self):
+        self.arp.refresh()
+        self.assertEqual(self.arp.resolve('0026.b9f0.0001', 20), '10.1.20.5')
+        self.assertEqual(self.arp.resolve('0002'), '10.1.30.5')
+        # VLAN 20's gateway doesn't have it, the others are asked next
+        self.assertEqual(self.arp.resolve('0026.b9f0.0002', 20), '10.1.30.5')
+        self.assertEqual(self.arp.resolve('0026.b9f0.0003'), None)
+        self.assertEqual(str(self.arp.resolve_ip('10.1.30.5')),
+                         '0026.b9f0.0002')
+        # an expired table is pulled again
+        self.arp.ttl = 0
+        self.assertEqual(self.arp.resolve('0026.b9f0.0001'), '10.1.20.5')
+
+
+class sshutilDNSResolverTC(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_cache(self):
+        resolver = sshutil.DNSResolver(self.path)
+        now = time.time()
+        resolver._cache['10.0.0.1'] = (now + 100, 'host1')
+        resolver._cache['10.0.0.2'] = (now + 100, '')
+        resolver._cache['10.0.0.3'] = (now - 1, 'expired')
+        resolver.save()
+
+        resolver = sshutil.DNSResolver(self.path)
+        self.assertEqual(resolver.cached('10.0.0.1'), 'host1')
+        self.assertEqual(resolver.cached('10.0.0.2'), '')
+        self.assertEqual(resolver.cached('10.0.0.3'), None)
+        # Nothing here needs an actual lookup
+        lookups = sshutil.metrics.METRICS.get('DNSResolver.lookup', 0)
+        self.assertEqual(resolver.resolve_many(['10.0.0.1', '10.0.0.1',
+                                                '10.0.0.2', 'Not Found']),
+                         {'10.0.0.1': 'host1', '10.0.0.2': '',
+                          'Not Found': ''})
+        self.assertEqual(sshutil.metrics.METRICS.get('DNSResolver.lookup', 0),
+                         lookups)
+
+    def test_timeout(self):
+        resolver = sshutil.DNSResolver(self.path, timeout=0.05)
+        def lookup(ip):
+            if ip == '10.0.0.2':  # answers, then the thread hangs around
+                resolver._cache[ip] = (time.time() + 100, 'host2')
+            time.sleep(0.5)
+            return 'too late'
+        resolver._lookup = lookup
+        self.assertEqual(resolver.resolve_many(['10.0.0.1', '10.0.0.2']),
+                         {'10.0.0.1': '', '10.0.0.2': 'host2'})
+        self.assertEqual(resolver.cached('10.0.0.1'), '')
+        # the timeout must not clobber the answer that did come in
+        self.assertEqual(resolver.cached('10.0.0.2'), 'host2')
+
+
+class sshutilPortTableTC(unittest.TestCase):
+
+    def test_PortTable(self):
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        sw.ports = ['Gi1/0/1', 'FastEthernet1/0/2', 'Loopback0']
+        self.assertTrue(isinstance(sw.ports, sshutil.PortTable))
+        self.assertEqual(sw.ports.index('GigabitEthernet1/0/1'), 0)
+        self.assertEqual(sw.ports.index('fa1/0/2'), 1)
+        self.assertEqual(sw.ports.get('Loopback0').name, 'Loopback0')
+        self.assertFalse('Gi1/0/2' in sw.ports)
+        self.assertRaises(ValueError, sw.ports.index, 'Gi1/0/2')
+        sw.ports.append(sshutil.SwitchPort(name='Vl10', switch=sw))
+        self.assertTrue('Vlan10' in sw.ports)
+        sw.ports[3].ifIndex = 10010
+        self.assertEqual(sw.ports.by_ifindex(10010).name, 'Vlan10')
+        for ifIndex, port in enumerate(sw.ports[:3], 10001):
+            port.ifIndex = ifIndex
+        del sw.ports[0]
+        self.assertEqual(sw.ports.index('Vlan10'), 2)
+        self.assertFalse('Gi1/0/1' in sw.ports)
+        # positions moved, the ifIndex lookup has to follow
+        self.assertEqual(sw.ports.by_ifindex(10010).name, 'Vlan10')
+        self.assertEqual(sw.ports.by_ifindex(10001), None)
+        sw.ports.sort(key=lambda port: -port.ifIndex)
+        self.assertEqual(sw.ports.by_ifindex(10010).name, 'Vlan10')
+        self.assertEqual(sw.ports.by_ifindex(10002).name,
+                         'FastEthernet1/0/2')
+        self.assertEqual(sw.ports[0].name, 'Vlan10')
+
+
+class sshutilVersionTC(unittest.TestCase):
+
+    def setUp(self):
+        self.sampleData = '\n'.join([
+            'Cisco IOS Software, C3750E Software (C3750E-UNIVERSALK9-M), '
+            'Version 12.2(55)SE5, RELEASE SOFTWARE (fc1)',
+            'sw1 uptime is 1 year, 12 weeks, 3 days, 4 hours, 19 minutes',
+            'cisco WS-C3750X-48P (PowerPC405) processor (revision A0) with '
+            '262144K bytes of memory.',
+            '',
+            'Switch Ports Model              SW Version            SW Image',
+            '------ ----- -----              ----------            ----------',
+            '*    1 54    WS-C3750X-48P      12.2(55)SE5           '
+            'C3750E-UNIVERSALK9-M',
+            '     2 54    WS-C3750X-48P      12.2(55)SE5           '
+            'C3750E-UNIVERSALK9-M',
+            ''])
+
+    def test_parse_version(self):
+        info = sshutil.parse_version(self.sampleData)
+        self.assertEqual(info.model, 'WS-C3750X-48P')
+        self.assertEqual(info.software_version, '12.2(55)SE5')
+        self.assertEqual(info.license, 'UNIVERSALK9')
+        self.assertEqual(info.ram, 262144)
+        self.assertEqual(len(info.stack_members), 2)
+        self.assertEqual(info.uptime, '1 year, 12 weeks, 3 days, 4 hours, '
+                                      '19 minutes')
+        self.assertEqual(info.hostname, 'sw1')
+        self.assertEqual(sshutil.parse_version('').model, 'UNK')
+
+    def test_Switch_version_properties(self):
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        sw._collect_version(data=self.sampleData)
+        self.assertEqual(sw.model, 'UNK')  # not UP yet
+        sw.state = 'UP'
+        self.assertEqual((sw.model, sw.stacked, sw.available_ram,
+                          sw.software_version),
+                         ('WS-C3750X-48P', True, 262144, '12.2(55)SE5'))
+        sw._collect_version(data=self.sampleData.replace('262144K', '1024K'))
+        self.assertEqual(sw.available_ram, 1024)
+
+
+class cmdcacheTC(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.cache = cmdcache.enable(self.path)
+
+    def tearDown(self):
+        cmdcache.disable()
+        os.remove(self.path)
+
+    def test_ttl(self):
+        self.assertEqual(self.cache.ttl('sh ver'), 24 * 3600)
+        self.assertEqual(self.cache.ttl('show  MAC address-table'), 300)
+        self.assertEqual(self.cache.ttl('ping 10.0.0.1'), None)
+        self.assertEqual(self.cache.ttl('sh clock'), None)
+        cache = cmdcache.CommandCache(self.path, maxAge=30)
+        self.assertEqual(cache.ttl('sh ver'), 30)
+        cache.close()
+
+    def test_cache(self):
+        self.cache.put('10.0.0.1', 'sh ver', 'version\xff text')
+        self.assertEqual(self.cache.get('10.0.0.1', 'sh  VER'),
+                         'version\xff text')
+        self.assertEqual(self.cache.get('10.0.0.1', 'sh ver', trim=False),
+                         None)
+        self.assertEqual(self.cache.get('10.0.0.2', 'sh ver'), None)
+        self.cache.put('10.0.0.1', 'ping 10.0.0.2', '!!!!!')
+        self.assertEqual(self.cache.get('10.0.0.1', 'ping 10.0.0.2'), None)
+        self.cache.put('10.0.0.1', 'sh mac', 'sh mac\n      ^\n'
+                       "% Invalid input detected at '^' marker.")
+        self.assertEqual(self.cache.get('10.0.0.1', 'sh mac'), None)
+
+    def test_execute(self):
+        # Cached output is served without touching the network
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        self.cache.put('10.0.0.1', 'sh ver', 'line1\nline2')
+        self.cache.put('10.0.0.1', 'sh cdp ne det', '')
+        self.assertEqual(sw.execute('sh ver'), 'line1\nline2')
+        self.assertEqual(list(sw.execute_iter('sh ver')), ['line1', 'line2'])
+        self.assertEqual(sw.execute_batch(['sh ver', 'sh cdp ne det']),
+                         ['line1\nline2', ''])
+        self.assertEqual(sw.state, 'UP')
+
+
+class FakeChannel(object):
+    """
+        Just enough of a paramiko channel for interactive reads.  reply, if
+        given, turns what's sent into more chunks to read.  With nothing to
+        read, select() on it waits out its timeout.
+    """
+    def __init__(self, chunks, reply=None):
+        self.chunks = list(chunks)
+        self.sent = []
+        self.reply = reply
+        self._pipe = os.pipe()
+
+    def recv_ready(self):
+        return bool(self.chunks)
+
+    def recv(self, size):
+        return self.chunks.pop(0)
+
+    def send(self, data):
+        self.sent.append(data)
+        if self.reply is not None:
+            self.chunks.extend(self.reply(data))
+
+    def fileno(self):
+        return self._pipe[0]
+
+    def close(self):
+        for fd in self._pipe:
+            os.close(fd)
+
+
+class sshexecuteTC(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sshexecute.SSHConnection('10.0.0.1', ('user', 'pass'),
+                                             interactive=True)
+        self.conn.channel = FakeChannel(['sh mac\nline1\n', 'line2\n',
+                                         'line3\nsw1#'])
+
+    def tearDown(self):
+        self.conn.channel.close()
+
+    def test_read_until_prompt(self):
+        output, timeToPrompt = sshexecute.read_until_prompt(
+            self.conn.channel)
+        self.assertEqual(output, 'sh mac\nline1\nline2\nline3\nsw1#')
+        self.assertTrue(timeToPrompt is not None)
+        self.conn.channel.chunks = ['sh mac\nline1\n', 'line2\nsw1#']
+        self.assertEqual(list(self.conn._iterP('sh mac')),
+                         ['line1', 'line2'])
+        self.assertTrue(self.conn.timeToPrompt is not None)
+
+    def test_abandoned_iter(self):
+        # Stopping early drains the rest, so it can't leak into the next
+        # command run on the pooled connection
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        lines = sw._release_after(self.conn, self.conn._iterP('sh mac'))
+        self.assertEqual(next(lines), 'line1')
+        lines.close()
+        self.assertEqual(self.conn.channel.chunks, [])
+        self.assertEqual(self.conn.channel.sent, ['sh mac\n'])
+
+    def test_batch(self):
+        # what IOS sends back for a batch: each line echoed after a prompt,
+        # '!<token>-<n>' comments included
+        outputs = {'sh ver': ['Cisco IOS Software', 'sw1 uptime is 3 days'],
+                   'sh cdp ne det': []}
+
+        def reply(data):
+            lines = data.splitlines()
+            if not lines or not lines[-1].startswith('!'):
+                return []
+            if self.truncate:  # the second command's sentinel never comes
+                lines = lines[:2]
+            echo = []
+            for line in lines:
+                echo.append('sw1#' + line)
+                echo.extend(outputs.get(line, []))
+            echo.append('sw1#')
+            return ['\r\n'.join(echo)[4:]]  # the first prompt was sent
+        self.conn.channel.close()
+        self.conn.channel = FakeChannel([], reply)
+        self.conn._connect = lambda: None  # no ssh session behind it
+
+        @contextmanager
+        def connect():
+            yield self.conn
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        cache = cmdcache.enable(path)
+        try:
+            sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+            sw._connect = connect
+            self.truncate = True
+            self.assertEqual(sw.execute_batch(['sh ver', 'sh cdp ne det'],
+                                              timeout=0.05),
+                             ['Cisco IOS Software\nsw1 uptime is 3 days', ''])
+            self.assertTrue(self.conn.timeToPrompt is None)
+            # cut short, so nothing went in the cache
+            self.assertEqual(cache.get('10.0.0.1', 'sh ver'), None)
+
+            self.truncate = False
+            self.assertEqual(sw.execute_batch(['sh ver', 'sh cdp ne det'],
+                                              timeout=0.05),
+                             ['Cisco IOS Software\nsw1 uptime is 3 days', ''])
+            self.assertTrue(self.conn.timeToPrompt is not None)
+            self.assertEqual(cache.get('10.0.0.1', 'sh cdp ne det'), '')
+            self.assertEqual(cache.get('10.0.0.1', 'sh ver'),
+                             'Cisco IOS Software\nsw1 uptime is 3 days')
+        finally:
+            cmdcache.disable()
+            os.remove(path)
+
+    def test_pool_lru(self):
+        pool = sshexecute.SSHConnectionPool(maxSessions=2)
+        creds = ('user', 'pass')
+        for host in ['a', 'b', 'a']:  # b is now least recently used
+            pool.release(pool.acquire(host, creds))
+        pool.release(pool.acquire('c', creds))
+        self.assertEqual(sorted(key[0] for key in pool._idle), ['a', 'c'])
+        self.assertEqual([key[0] for key in pool._lru], ['a', 'c'])
+        pool.closeall()
+        self.assertEqual((len(pool), len(pool._lru)), (0, 0))
+
+
+class snapshotTC(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.snap')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        sw.state = 'UP'
+        sw._collect_version(data='cisco WS-C2960-24TT-L (PowerPC405) '
+                                 'processor (revision B0) with 65536K bytes '
+                                 'of memory.')
+        sw.ports = ['Gi0/1', 'Gi0/2', 'Vlan10']
+        sw.ports[0].description = 'uplink'
+        sw.ports[0].stats['InputBytes'] = 12345
+        sw.ports[0].stats['StatDuration'] = 'never'
+        sw.ports[2].switchportMode = 'trunk'
+        sw._collect_cdp_information(data='\n'.join([
+            'Device ID: sw2', '  IP address: 10.0.0.2',
+            'Platform: cisco WS-C3750,  Capabilities: Switch IGMP',
+            'Interface: GigabitEthernet0/1,  Port ID (outgoing port): '
+            'GigabitEthernet1/0/1', '',
+            'Device ID: ap1', '  IP address: 10.0.0.3',
+            'Platform: cisco AIR,  Capabilities: Trans-Bridge',
+            'Interface: GigabitEthernet0/9,  Port ID (outgoing port): '
+            'GigabitEthernet0']))
+        sw._mac_address_table = '  10    0026.b9f0.0001    DYNAMIC     Gi0/2'
+        sw._get_end_devices()
+        sw.devices[0].ip = '10.0.0.50'
+
+        self.assertEqual(snapshot.save([sw], self.path), 1)
+        snap = snapshot.load(self.path, ('user', 'pass'))
+        self.assertEqual((len(snap), snap.ips()), (1, ['10.0.0.1']))
+        self.assertEqual(snap.get('10.0.0.2'), None)
+
+        loaded = snap['10.0.0.1']
+        self.assertTrue(snap['10.0.0.1'] is loaded)  # decoded once
+        self.assertEqual(loaded.model, 'WS-C2960-24TT-L')
+        self.assertEqual([p.name for p in loaded.ports],
+                         [p.name for p in sw.ports])
+        port = loaded.ports.get('Gi0/1')
+        self.assertEqual(port.description, 'uplink')
+        self.assertEqual(port.stats.items(), sw.ports[0].stats.items())
+        self.assertEqual(loaded.ports[2].switchportMode, 'trunk')
+        self.assertEqual(port.CDPneigh[0].ip, '10.0.0.2')
+        self.assertFalse(port.edge)
+        # ap1 is on a port we don't know about, but CDP still has it
+        self.assertEqual(sorted(loaded.cdp_information),
+                         sorted(sw.cdp_information))
+        device = loaded.devices[0]
+        self.assertEqual((str(device), device.ip, device.vlan),
+                         ('0026.b9f0.0001', '10.0.0.50', '10'))
+        self.assertTrue(device.switchport is loaded.ports[1])
+
+        switches, stale = snapshot.reuse(snap, ['10.0.0.1', '10.0.0.9'],
+                                         ('user', 'pass'))
+        self.assertTrue(switches[0] is loaded)
+        self.assertEqual(stale, [switches[1]])
+
+
+class macindexTC(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.index = macindex.MACIndex(self.path)
+        self.sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        self.sw.ports = ['Gi1/0/1', 'Gi1/0/48']
+        self.sw.ports[1].switchportMode = 'trunk'
+        self.sw._mac_address_table = '\n'.join([
+            '  10    0026.b9f0.0001    DYNAMIC     Gi1/0/1',
+            '  10    0026.b9f0.0002    DYNAMIC     Gi1/0/48',
+            '* 20    0026.b9f0.0003    dynamic     Gi1/0/2'])
+
+    def tearDown(self):
+        self.index.close()
+        os.remove(self.path)
+
+    def test_record(self):
+        self.assertEqual(self.index.record(self.sw), 3)
+        location = self.index.locate('0026.b9f0.0001')
+        self.assertEqual((location.switch, location.port, location.vlan),
+                         ('10.0.0.1', 'Gi1/0/1', '10'))
+        # trunk ports aren't where a device lives
+        self.assertEqual(self.index.locate('0026.b9f0.0002'), None)
+        self.assertEqual(len(self.index.lookup('0026.b9f0.0002')), 1)
+        self.assertEqual(self.index.locate('0003').port, 'Gi1/0/2')
+        # recording a switch again replaces what it had
+        self.sw._mac_address_table = ''
+        self.index.record(self.sw)
+        self.assertEqual(self.index.lookup('0026.b9f0.0001'), [])
+
+    def test_stale(self):
+        self.index.record(self.sw, seen=time.time() - 7200)
+        self.assertEqual(self.index.locate('0026.b9f0.0001', 3600), None)
+        self.assertEqual(self.index.stale(['10.0.0.1', '10.0.0.2'], 3600),
+                         ['10.0.0.1', '10.0.0.2'])
+        self.index.record(self.sw)
+        self.assertEqual(self.index.stale(['10.0.0.1', '10.0.0.2'], 3600),
+                         ['10.0.0.2'])
+
+
+class StubSwitch(object):
+    """Takes delay seconds to populate(), counting how many run at once"""
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def __init__(self, ip, delay=0.0, fail=False):
+        self.ip = ip
+        self.delay = delay
+        self.fail = fail
+        self.state = 'UNK'
+
+    def populate(self):
+        with StubSwitch.lock:
+            StubSwitch.running += 1
+            StubSwitch.peak = max(StubSwitch.peak, StubSwitch.running)
+        time.sleep(self.delay)
+        with StubSwitch.lock:
+            StubSwitch.running -= 1
+        if self.fail:
+            raise Exception('no route to host')
+        self.state = 'UP'
+
+
+class collectorTC(unittest.TestCase):
+
+    def setUp(self):
+        StubSwitch.running = StubSwitch.peak = 0
+
+    def test_iter_populated(self):
+        switches = [StubSwitch('10.0.0.1', 0.2), StubSwitch('10.0.0.2'),
+                    StubSwitch('10.0.0.3', 0.1, fail=True)]
+        done = list(collector.iter_populated(switches, 3))
+        self.assertEqual([sw.ip for sw in done],  # completion order
+                         ['10.0.0.2', '10.0.0.3', '10.0.0.1'])
+        self.assertEqual([sw.state for sw in switches], ['UP', 'UP', 'DOWN'])
+        # the pool only makes room while something is running
+        self.assertEqual(sshexecute.POOL._reserved, [])
+
+    def test_max_in_flight(self):
+        switches = (StubSwitch('10.0.0.{0}'.format(n), 0.01)
+                    for n in range(20))
+        self.assertEqual(len(collector.populate_switches(switches, 4)), 20)
+        self.assertTrue(1 < StubSwitch.peak <= 4, StubSwitch.peak)
+
+    def test_bad_input(self):
+        # a hostfile line that can't become a Switch stops the run, loudly
+        def switches():
+            yield StubSwitch('10.0.0.1')
+            raise ValueError('bad host line')
+        self.assertRaises(ValueError, list,
+                          collector.iter_populated(switches(), 2))
+        self.assertEqual(sshexecute.POOL._reserved, [])
+
+    def test_runner_push(self):
+        seen = []
+        runner = collector.Runner(lambda n: n * 2, [1, 2, 2], 1, unique=True)
+        for n, doubled, error in runner:
+            seen.append(doubled)
+            if n == 1:
+                runner.push(5)
+                runner.push(4, first=True)
+        self.assertEqual(seen, [2, 8, 10, 4])
+
+
+class cdpmapCrawlTC(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        cache = cmdcache.enable(self.path)
+        neighbor = '\n'.join([
+            '-------------------------',
+            'Device ID: {0}',
+            'Entry address(es): ',
+            '  IP address: {1}',
+            'Platform: cisco WS-C3750X-48P,  Capabilities: {2} ',
+            'Interface: {3},  Port ID (outgoing port): Gi1/0/1',
+            ''])
+        topology = {
+            '10.0.0.1': ('sw1', [
+                ('sw2.example.com', '10.0.0.2', 'Switch IGMP', 'Gi1/0/49'),
+                ('SEP001122334455', '10.5.0.20', 'Host Phone', 'Fa1/0/3')]),
+            '10.0.0.2': ('sw2', [
+                ('sw1.example.com', '10.0.0.1', 'Switch IGMP', 'Gi1/0/1'),
+                ('sw3', '10.0.0.3', 'Router Switch', 'Gi1/0/2'),
+                # sw2 again, through another of its addresses
+                ('SW2', '10.1.0.2', 'Switch', 'Gi1/0/3')]),
+            '10.0.0.3': ('sw3', [])}
+        for ip, (name, neighbors) in topology.items():
+            cache.put(ip, 'sh cdp ne det', ''.join(
+                neighbor.format(*entry) for entry in neighbors))
+            cache.put(ip, 'sh ver', '\n'.join([
+                'Cisco IOS Software, C3750E Software (C3750E-UNIVERSALK9-M), '
+                'Version 12.2(55)SE5, RELEASE SOFTWARE (fc1)',
+                name + ' uptime is 3 days, 4 hours, 19 minutes', '']))
+
+    def tearDown(self):
+        cmdcache.disable()
+        os.remove(self.path)
+
+    def test_crawl(self):
+        switches = cdpmap.Crawl(['10.0.0.1'], ('user', 'pass'), 4, 4)
+        self.assertEqual(sorted(sw.ip for sw in switches),
+                         ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        self.assertEqual(set(sw.version_info.hostname for sw in switches),
+                         set(['sw1', 'sw2', 'sw3']))
+        switches = cdpmap.Crawl(['10.0.0.1'], ('user', 'pass'), 4, 1)
+        self.assertEqual(sorted(sw.ip for sw in switches),
+                         ['10.0.0.1', '10.0.0.2'])
+
+
+class macsearchTC(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        fd, self.csv = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.cache = cmdcache.enable(self.path)
+
+    def tearDown(self):
+        cmdcache.disable()
+        os.remove(self.path)
+        os.remove(self.csv)
+
+    def test_parallel_search(self):
+        # sw1 -> sw2 -> sw3, where the MAC is on an access port
+        mac = '0026.b9f0.0001'
+        cdp = ('  IP address: {0}\n'
+               'Platform: cisco WS-C3750X-48P,  Capabilities: Switch IGMP')
+        for ip, port, neighbors in [('10.0.0.1', 'Gi1/0/49', '10.0.0.2'),
+                                    ('10.0.0.2', 'Gi1/0/2', '10.0.0.3'),
+                                    ('10.0.0.3', 'Gi1/0/5', None)]:
+            self.cache.put(ip, 'show mac address-table | inc ' + mac,
+                           '  10    {0}    DYNAMIC     {1}'.format(mac, port))
+            self.cache.put(ip, 'Show CDP Neighbor {0} detail | in '
+                           '(IP address|Platform)'.format(port),
+                           cdp.format(neighbors) if neighbors else '')
+        # sw3 is in the host list too, but only reached through sw2
+        path = macsearch.ParallelSearch(mac, ['10.0.0.1', '10.0.0.3'],
+                                        ('user', 'pass'), 1)
+        self.assertEqual([(hop.switch, hop.port) for hop in path],
+                         [('10.0.0.1', 'Gi1/0/49'), ('10.0.0.2', 'Gi1/0/2'),
+                          ('10.0.0.3', 'Gi1/0/5')])
+        self.cache.put('10.0.0.3', 'show mac address-table | inc ' + mac, '')
+        self.assertEqual(macsearch.ParallelSearch(mac, ['10.0.0.1'],
+                                                  ('user', 'pass'), 4), [])
+
+    def test_batch(self):
+        switchport = ('Name: {0}\nSwitchport: Enabled\n'
+                      'Operational Mode: {1}\n')
+        tables = {
+            '10.0.0.1': ([('0026.b9f0.0001', 'Gi1/0/49'),
+                          ('0026.b9f0.0002', 'Gi1/0/49')],
+                         switchport.format('Gi1/0/49', 'trunk')),
+            '10.0.0.2': ([('0026.b9f0.0001', 'Gi1/0/5'),
+                          ('0026.b9f0.0003', 'Gi1/0/6')],
+                         switchport.format('Gi1/0/5', 'static access') +
+                         switchport.format('Gi1/0/6', 'static access'))}
+        for ip, (entries, modes) in tables.items():
+            self.cache.put(ip, 'sh mac address-table dynamic', '\n'.join(
+                '  10    {0}    DYNAMIC     {1}'.format(*entry)
+                for entry in entries))
+            self.cache.put(ip, 'sh int switchport', modes)
+            self.cache.put(ip, 'sh cdp ne det', '')
+        fd, macfile = tempfile.mkstemp()
+        os.write(fd, '# wanted\n0026.b9f0.0001\n0026.b9f0.0002\n0003\n'
+                     '0026.b9f0.0009\nnot-a-mac\n')
+        os.close(fd)
+        options = macsearch.createParser().parse_args(
+            ['-M', macfile, '--csv', self.csv, '-p', '2'])[0]
+        try:
+            macsearch.BatchMain(options, ['10.0.0.1', '10.0.0.2'],
+                                ('user', 'pass'))
+        finally:
+            os.remove(macfile)
+        with open(self.csv, 'r') as fIn:
+            rows = [line.rstrip('\r\n').split(',') for line in fIn]
+        self.assertEqual(rows, [
+            ['mac', 'switch', 'port', 'vlan', 'status'],
+            # edge port first, though sw1 saw it too
+            ['0026.b9f0.0001', '10.0.0.2', 'Gi1/0/5', '10', 'edge'],
+            ['0026.b9f0.0002', '10.0.0.1', 'Gi1/0/49', '10', 'uplink only'],
+            # 'last 4', matched by tail
+            ['0003', '10.0.0.2', 'Gi1/0/6', '10', 'edge'],
+            ['0026.b9f0.0009', '', '', '', 'not found'],
+            ['not-a-mac', '', '', '', 'invalid']])
+
+
+class interfacestatsPollTC(unittest.TestCase):
+
+    def setUp(self):
+        self.sw = sshutil.Switch(ip='10.0.0.1', creds=('user', 'pass'))
+        self.sw.ports = ['Gi1/0/1', 'Gi1/0/2']
+
+    def poll(self, when, cleared, counters):
+        for port, values in zip(self.sw.ports, counters):
+            port.stats['StatDuration'] = cleared
+            for key, value in zip(interfacestats.POLLED, values):
+                port.stats[key] = value
+        return list(self.history.add(self.sw, when))
+
+    def test_csv_rows(self):
+        # a port missing counters (an SVI, say) still gets its row
+        self.sw.ports[0].stats['InputBytes'] = 100
+        rows = sorted(interfacestats.CSVRows(self.sw))
+        self.assertEqual(rows[0][:2], ['10.0.0.1', 'GigabitEthernet1/0/1'])
+        self.assertEqual(rows[0][2 + interfacestats.STATS.index('InputBytes')],
+                         100)
+        self.assertEqual(rows[1][2:], [''] * len(interfacestats.STATS))
+
+    def test_parse_duration(self):
+        self.assertEqual(interfacestats.ParseDuration('never'), None)
+        self.assertEqual(interfacestats.ParseDuration('00:01:05'), 65)
+        self.assertEqual(interfacestats.ParseDuration('1d02h'), 93600)
+        self.assertEqual(interfacestats.ParseDuration('3w2d'), 23 * 86400)
+
+    def test_counter_delta(self):
+        delta = interfacestats.CounterDelta
+        self.assertEqual(delta(100, 150), (50, None))
+        self.assertEqual(delta(2 ** 32 - 10, 5), (15, 'wrapped'))
+        self.assertEqual(delta(2 ** 64 - 10, 5), (15, 'wrapped'))
+        self.assertEqual(delta(5000, 20), (20, 'reset'))
+        self.assertEqual(delta(5000, 20, cleared=True), (20, 'cleared'))
+
+    def test_history(self):
+        self.history = interfacestats.CounterHistory(samples=3)
+        idle = [0] * 6
+        self.assertEqual(self.poll(0, 'never', [[1000] * 6, idle]), [])
+        # Gi1/0/2 didn't move, so only Gi1/0/1 is reported
+        rates = self.poll(10, 'never', [[2000] * 6, idle])
+        self.assertEqual([port for port, _, _ in rates],
+                         ['GigabitEthernet1/0/1'])
+        port, rate, window = rates[0]
+        self.assertEqual(rate.rates, [800.0, 800.0, 100.0, 100.0,
+                                      100.0, 100.0])
+        self.assertEqual(rate.event, None)
+        # cleared 5 seconds ago: only those 5 seconds are in the counters.
+        # Both ports are reported, a clear counts as a change.
+        rates = dict((port, (rate, window)) for port, rate, window
+                     in self.poll(20, '00:00:05', [[500] * 6, idle]))
+        self.assertEqual(len(rates), 2)
+        rate, window = rates[port]
+        self.assertEqual((rate.seconds, rate.rates[2], rate.event),
+                         (5, 100.0, 'cleared'))
+        self.assertEqual((window.seconds, window.rates[2]), (15, 100.0))
+        self.assertEqual(len(self.history.ports['10.0.0.1', port]), 3)
+
+
+class counterstoreTC(unittest.TestCase):
+
+    def interface(self, name, inputBytes, inputErrors):
+        return '\n'.join([
+            '{0} is up, line protocol is up (connected) '.format(name),
+            '  Last clearing of "show interface" counters never',
+            '     {0} packets input, {1} bytes, 0 no buffer'.format(
+                inputBytes // 100, inputBytes),
+            '     {0} input errors, 0 CRC, 0 frame'.format(inputErrors),
+            ''])
+
+    def setUp(self):
+        self.store = counterstore.CounterStore()
+        self.store.add_output('10.0.0.1', self.interface('Gi1/0/1', 5000, 3) +
+                              self.interface('Gi1/0/2', 900, 40))
+        sw = sshutil.Switch(ip='10.0.0.2', creds=('user', 'pass'))
+        sw._get_interfaces(data=self.interface('Gi1/0/1', 7000, 0))
+        self.assertEqual(self.store.add_switch(sw), (2, 3))
+
+    def test_top(self):
+        store = self.store
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store['InputErrors'].tolist(), [3, 40, 0])
+        self.assertEqual(store['OutputBytes'].tolist(),
+                         [counterstore.MISSING] * 3)
+        gi1, gi2 = 'GigabitEthernet1/0/1', 'GigabitEthernet1/0/2'
+        self.assertEqual(store.top('InputBytes', 2),
+                         [('10.0.0.2', gi1, 7000), ('10.0.0.1', gi1, 5000)])
+        self.assertEqual(store.top('InputErrors', 5,
+                                   mask=store['InputBytes'] < 6000),
+                         [('10.0.0.1', gi2, 40), ('10.0.0.1', gi1, 3)])
+        self.assertEqual(store.top('OutputBytes'), [])
+
+    def test_delta(self):
+        later = counterstore.CounterStore()
+        later.add_output('10.0.0.3', self.interface('Gi1/0/1', 1, 0))
+        later.add_output('10.0.0.2', self.interface('Gi1/0/1', 8000, 0))
+        later.add_output('10.0.0.1', self.interface('Gi1/0/2', 100, 41) +
+                         self.interface('Gi1/0/1', 2 ** 32 + 5000, 3))
+        rows, deltas = later.delta(self.store, 'InputBytes')
+        gi1, gi2 = 'GigabitEthernet1/0/1', 'GigabitEthernet1/0/2'
+        self.assertEqual(later.names(rows), [('10.0.0.2', gi1),
+                                             ('10.0.0.1', gi2),
+                                             ('10.0.0.1', gi1)])
+        # Gi1/0/2 was cleared: counted from zero
+        self.assertEqual(deltas.tolist(), [1000, 100, 2 ** 32])
+
+    def test_iter_rows(self):
+        rows = list(self.store.iter_rows(1))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][:3],
+                         ['10.0.0.1', 'GigabitEthernet1/0/2', 'never'])
+        self.assertEqual(len(rows[0]), 2 + len(interfacestats.STATS))
+        self.assertEqual(rows[0][interfacestats.STATS.index('InputBytes')
+                                 + 2], 900)
+        self.assertEqual(rows[0][interfacestats.STATS.index('OutputBytes')
+                                 + 2], '')
+        self.assertEqual(list(self.store.iter_rows()), list(
+            self.store.iter_rows(0, 1)) + rows)
+
+
 class sshutilSwitchPortTC(unittest.TestCase):
     def setUp(self):
         self.sampleData = {}
@@ -178,6 +1074,36 @@ class sshutilSwitchPortTC(unittest.TestCase):
                    ''.format(sample[0], sample[1], eRslt, aRslt))
             self.assertEqual(eRslt, aRslt, msg)
 
+    def test_get_edge_CDPNeighbor(self):
+        neighbors = sshutil.parse_cdp_neighbors([
+            '-------------------------',
+            'Device ID: sw2.example.com',
+            'Entry address(es): ',
+            '  IP address: 10.0.0.2',
+            '  IP address: 10.1.0.2',
+            'Platform: cisco WS-C3750X-48P,  Capabilities: Switch IGMP ',
+            'Interface: GigabitEthernet1/0/49,  Port ID (outgoing port): '
+            'GigabitEthernet1/0/1',
+            'Holdtime : 137 sec',
+            '-------------------------',
+            'Device ID: SEP001122334455',
+            'Entry address(es): ',
+            '  IP address: 10.5.0.20',
+            'Platform: Cisco IP Phone 7962,  Capabilities: Host Phone ',
+            'Interface: FastEthernet1/0/3,  Port ID (outgoing port): Port 1'])
+        self.assertEqual(len(neighbors), 2)
+        switch, phone = neighbors
+        self.assertEqual(tuple(switch), ('sw2.example.com', '10.0.0.2',
+                                         ['Switch', 'IGMP'],
+                                         'GigabitEthernet1/0/1'))
+        self.assertEqual(switch.addresses, ['10.0.0.2', '10.1.0.2'])
+        self.assertEqual(switch.interface, 'GigabitEthernet1/0/49')
+        self.assertEqual(phone[3], 'Port 1')
+        sp = sshutil.SwitchPort()
+        self.assertFalse(sp._get_edge([switch], 'access'))
+        self.assertTrue(sp._get_edge([phone], 'access'))
+        self.assertFalse(sp._get_edge([phone, switch], 'access'))
+
     def test_switchportMode(self):
         sp = sshutil.SwitchPort()
         self.assertEqual(sp.switchportMode, 'access', 'clswitchportMode'
@@ -194,9 +1120,40 @@ class sshutilSwitchPortTC(unittest.TestCase):
                          '    Expected: {0}\n    Returned: {1}\n'
                          ''.format('trunk', sp.switchportMode))
 
+    def test_detail(self):
+        sp = sshutil.SwitchPort()
+        sp.detail = '\n'.join([
+            'FastEthernet1/0/1 is up, line protocol is up (connected) ',
+            '  Description: Server',
+            '  Last clearing of "show interface" counters never',
+            '  5 minute input rate 12000 bits/sec, 10 packets/sec',
+            '  5 minute output rate 48000 bits/sec, 30 packets/sec',
+            '     68426911 packets input, 3402343221 bytes, 0 no buffer',
+            '     12 input errors, 3 CRC, 0 frame, 0 overrun, 0 ignored',
+            '     441629331 packets output, 4103217890 bytes, 0 underruns',
+            '     1 output errors, 0 collisions, 1 interface resets'])
+        self.assertEqual(sp.name, 'FastEthernet1/0/1')
+        self.assertEqual(sp.status, 'up')
+        self.assertEqual(sp.description, 'Server')
+        self.assertEqual(sp.stats['StatDuration'], 'never')
+        self.assertEqual(sp.stats['InputBytes'], 3402343221)
+        self.assertEqual(sp.stats['5MinOutputPPS'], 30)
+        self.assertEqual(sp.stats['OutputErrors'], 1)
+        # Counters out of the usual order go through the line-by-line parser
+        sp.detail = '\n'.join([
+            'Vlan1 is administratively down, line protocol is down ',
+            '     5 input errors, 0 CRC, 0 frame, 0 overrun, 0 ignored',
+            '     7 packets input, 640 bytes, 0 no buffer'])
+        self.assertEqual(sp.status, 'down')
+        self.assertEqual(sorted(sp.stats.items()),
+                         [('InputBytes', 640), ('InputErrors', 5),
+                          ('InputPackets', 7)])
+        self.assertRaises(KeyError, lambda: sp.stats['OutputBytes'])
+
 
 def ts_FIN():
-    FIN_tests = ['test_FIN_to_Short', 'test_FIN_to_Long']
+    FIN_tests = ['test_FIN_to_Short', 'test_FIN_to_Long',
+                 'test_FIN_unknown']
     suite_FormatInterfaceName = unittest.TestSuite(
         map(sshutilFINtc, FIN_tests))
     return suite_FormatInterfaceName
@@ -216,8 +1173,121 @@ def ts_SwitchClassifyPorts():
     return suite_clSwitch
 
 
+def ts_InterfaceBlocks():
+    IB_tests = ['test_iter_interface_blocks',
+                'test_descriptions_unknown_types', 'test_empty_output']
+    suite_InterfaceBlocks = unittest.TestSuite(
+        map(sshutilInterfaceBlocksTC, IB_tests))
+    return suite_InterfaceBlocks
+
+
+def ts_MACAddress():
+    MAC_tests = ['test_MACAddress', 'test_EndDevice', 'test_get_end_devices',
+                 'test_mac_locations']
+    suite_MACAddress = unittest.TestSuite(
+        map(sshutilMACAddressTC, MAC_tests))
+    return suite_MACAddress
+
+
+def ts_ARPCache():
+    ARP_tests = ['test_gateways_for', 'test_resolve']
+    suite_ARPCache = unittest.TestSuite(
+        map(sshutilARPCacheTC, ARP_tests))
+    return suite_ARPCache
+
+
+def ts_DNSResolver():
+    DNS_tests = ['test_cache', 'test_timeout']
+    suite_DNSResolver = unittest.TestSuite(
+        map(sshutilDNSResolverTC, DNS_tests))
+    return suite_DNSResolver
+
+
+def ts_PortTable():
+    PT_tests = ['test_PortTable']
+    suite_PortTable = unittest.TestSuite(
+        map(sshutilPortTableTC, PT_tests))
+    return suite_PortTable
+
+
+def ts_Version():
+    VER_tests = ['test_parse_version', 'test_Switch_version_properties']
+    suite_Version = unittest.TestSuite(
+        map(sshutilVersionTC, VER_tests))
+    return suite_Version
+
+
+def ts_cmdcache():
+    CC_tests = ['test_ttl', 'test_cache', 'test_execute']
+    suite_cmdcache = unittest.TestSuite(
+        map(cmdcacheTC, CC_tests))
+    return suite_cmdcache
+
+
+def ts_sshexecute():
+    SX_tests = ['test_read_until_prompt', 'test_abandoned_iter',
+                'test_batch', 'test_pool_lru']
+    suite_sshexecute = unittest.TestSuite(
+        map(sshexecuteTC, SX_tests))
+    return suite_sshexecute
+
+
+def ts_snapshot():
+    SNAP_tests = ['test_round_trip']
+    suite_snapshot = unittest.TestSuite(
+        map(snapshotTC, SNAP_tests))
+    return suite_snapshot
+
+
+def ts_macindex():
+    MI_tests = ['test_record', 'test_stale']
+    suite_macindex = unittest.TestSuite(
+        map(macindexTC, MI_tests))
+    return suite_macindex
+
+
+def ts_collector():
+    CO_tests = ['test_iter_populated', 'test_max_in_flight', 'test_bad_input',
+                'test_runner_push']
+    suite_collector = unittest.TestSuite(
+        map(collectorTC, CO_tests))
+    return suite_collector
+
+
+def ts_crawl():
+    CR_tests = ['test_crawl']
+    suite_crawl = unittest.TestSuite(
+        map(cdpmapCrawlTC, CR_tests))
+    return suite_crawl
+
+
+def ts_macsearch():
+    MS_tests = ['test_parallel_search', 'test_batch']
+    suite_macsearch = unittest.TestSuite(
+        map(macsearchTC, MS_tests))
+    return suite_macsearch
+
+
+def ts_poll():
+    POLL_tests = ['test_parse_duration', 'test_counter_delta',
+                  'test_history', 'test_csv_rows']
+    suite_poll = unittest.TestSuite(
+        map(interfacestatsPollTC, POLL_tests))
+    return suite_poll
+
+
+def ts_counterstore():
+    CS_tests = ['test_top', 'test_delta', 'test_iter_rows']
+    if counterstore.numpy is None:  # nothing to test without it
+        CS_tests = []
+    suite_counterstore = unittest.TestSuite(
+        map(counterstoreTC, CS_tests))
+    return suite_counterstore
+
+
 def ts_Switchport():
-    SP_tests = ['test_init', 'test_get_edge', 'test_switchportMode']
+    SP_tests = ['test_init', 'test_get_edge', 'test_switchportMode',
+                'test_detail', 'test_get_edge_CDPNeighbor']
     suite_clSwitchPort = unittest.TestSuite(
         map(sshutilSwitchPortTC, SP_tests))
     return suite_clSwitchPort
@@ -231,6 +1301,21 @@ def createParser():
                      'switchgi:                  Switch._get_interfaces() '
                      'switchcp:                  Switch._classify_ports() '
                      'switchport:          SwitchPort, multiple methods '
+                     'ib:            sshutil.iter_interface_blocks() '
+                     'mac:               sshutil.MACAddress, EndDevice '
+                     'pt:                            sshutil.PortTable '
+                     'arp:                            sshutil.ARPCache '
+                     'dns:                         sshutil.DNSResolver '
+                     'ver:                       sshutil.parse_version() '
+                     'cache:                     cmdcache.CommandCache '
+                     'sshx:         sshexecute.read_until_prompt, _iterP '
+                     'snap:                         snapshot.save/load '
+                     'mi:                           macindex.MACIndex '
+                     'co:                       collector.iter_populated '
+                     'crawl:                            cdpmap.Crawl() '
+                     'ms:        macsearch.ParallelSearch, BatchSearch '
+                     'poll:           interfacestats.CounterHistory '
+                     'cs:              counterstore.CounterStore (NumPy) '
                      'all:                               self explanatory ')
     parser = OptionParser(usage)
     parser.add_option('-v', '--verbose', action='store_true', dest='verbose')
@@ -254,10 +1339,55 @@ def main():
         ts_Suite = ts_Switchport()
     elif suite == 'switchcp':
         ts_Suite = ts_SwitchClassifyPorts()
+    elif suite == 'ib':
+        ts_Suite = ts_InterfaceBlocks()
+    elif suite == 'mac':
+        ts_Suite = ts_MACAddress()
+    elif suite == 'arp':
+        ts_Suite = ts_ARPCache()
+    elif suite == 'dns':
+        ts_Suite = ts_DNSResolver()
+    elif suite == 'pt':
+        ts_Suite = ts_PortTable()
+    elif suite == 'ver':
+        ts_Suite = ts_Version()
+    elif suite == 'cache':
+        ts_Suite = ts_cmdcache()
+    elif suite == 'sshx':
+        ts_Suite = ts_sshexecute()
+    elif suite == 'snap':
+        ts_Suite = ts_snapshot()
+    elif suite == 'mi':
+        ts_Suite = ts_macindex()
+    elif suite == 'co':
+        ts_Suite = ts_collector()
+    elif suite == 'crawl':
+        ts_Suite = ts_crawl()
+    elif suite == 'ms':
+        ts_Suite = ts_macsearch()
+    elif suite == 'poll':
+        ts_Suite = ts_poll()
+    elif suite == 'cs':
+        ts_Suite = ts_counterstore()
     elif suite == 'all':
         ts_Suite = unittest.TestSuite((
             ts_FIN(),
             ts_Switchport(),
+            ts_InterfaceBlocks(),
+            ts_MACAddress(),
+            ts_ARPCache(),
+            ts_DNSResolver(),
+            ts_PortTable(),
+            ts_Version(),
+            ts_cmdcache(),
+            ts_sshexecute(),
+            ts_snapshot(),
+            ts_macindex(),
+            ts_collector(),
+            ts_crawl(),
+            ts_macsearch(),
+            ts_poll(),
+            ts_counterstore(),
             ts_SwitchGetInterfaces(),
             ts_SwitchClassifyPorts())
         )